@@ -5,7 +5,7 @@ from Admin.models import Book, Member, Transaction, BookRequest
 # Register your models here.
 @admin.register(Book)
 class BookAdmin(admin.ModelAdmin):
-    list_display = ('title', 'author', 'isbn', 'available_copies', 'published_date')
+    list_display = ('title', 'author', 'isbn', 'available_copies', 'borrow_count', 'published_date')
     list_filter = ('published_date',)
     search_fields = ('title', 'author', 'isbn')
 
@@ -21,10 +21,12 @@ class TransactionAdmin(admin.ModelAdmin):
     list_filter = ('status', 'issue_date')
     search_fields = ('member__full_name', 'book__title')
     date_hierarchy = 'issue_date'
+    list_select_related = ('member', 'book')
 
 @admin.register(BookRequest)
 class BookRequestAdmin(admin.ModelAdmin):
     list_display = ('member', 'book', 'request_date', 'status')
     list_filter = ('status', 'request_date')
     search_fields = ('member__full_name', 'book__title')
-    date_hierarchy = 'request_date'
\ No newline at end of file
+    date_hierarchy = 'request_date'
+    list_select_related = ('member', 'book')
@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class AdminConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'Admin'
+
+    def ready(self):
+        from Admin import signals  # noqa: F401
@@ -0,0 +1,76 @@
+"""
+Archive of returned loans.
+
+Most Transaction rows are long-returned loans, and every listing of current
+circulation has to step over them. ``archive_returned`` moves returned loans
+older than a cutoff into ``ArchivedTransaction``, in short batches so issuing
+and returning carry on meanwhile (``manage.py archive_transactions``). The
+move changes no counters: LibraryStats, member counters and borrow counts
+keep counting archived loans.
+
+Loan history and popularity read ``LoanHistory``, the ``Admin_loanhistory``
+view over both tables (created in migration 0016). SQLite will not rename a
+table that a view refers to, so a migration that remakes Admin_transaction or
+Admin_archivedtransaction must call ``drop_loan_history_view`` before its
+operations and ``install_loan_history_view`` after them.
+"""
+from django.db import connection
+
+from Admin.db import writer
+from Admin.models import ArchivedTransaction, Transaction
+
+LOAN_HISTORY_VIEW = 'Admin_loanhistory'
+
+LOAN_HISTORY_SQL = f"""
+    CREATE VIEW IF NOT EXISTS "{LOAN_HISTORY_VIEW}" AS
+    SELECT id, member_id, book_id, issue_date, return_date, status, 0 AS archived
+    FROM "Admin_transaction"
+    UNION ALL
+    SELECT id, member_id, book_id, issue_date, return_date, 'Returned', 1
+    FROM "Admin_archivedtransaction"
+"""
+
+ARCHIVED_COLUMNS = 'id, member_id, book_id, book_request_id, issue_date, return_date'
+
+
+def install_loan_history_view(schema_editor):
+    """(Re)create the LoanHistory view. Safe to call more than once."""
+    schema_editor.execute(LOAN_HISTORY_SQL)
+
+
+def drop_loan_history_view(schema_editor):
+    schema_editor.execute(f'DROP VIEW IF EXISTS "{LOAN_HISTORY_VIEW}"')
+
+
+def archive_returned(before, batch_size=1000, dry_run=False):
+    """
+    Move loans returned before ``before`` (a date) to ArchivedTransaction.
+
+    Each batch is copied and deleted in its own write transaction. The
+    delete is raw SQL, so the Transaction delete signals, which would undo
+    the loan's counters, do not fire.
+
+    Returns:
+        Number of loans moved (or that would be moved, with ``dry_run``)
+    """
+    returned = Transaction.objects.filter(status='Returned', return_date__lt=before)
+    if dry_run:
+        return returned.count()
+
+    moved = 0
+    live = Transaction._meta.db_table
+    archive = ArchivedTransaction._meta.db_table
+    while True:
+        with writer():
+            ids = list(returned.order_by('id').values_list('id', flat=True)[:batch_size])
+            if not ids:
+                return moved
+            placeholders = ', '.join(['%s'] * len(ids))
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f'INSERT INTO "{archive}" ({ARCHIVED_COLUMNS}) '
+                    f'SELECT {ARCHIVED_COLUMNS} FROM "{live}" WHERE id IN ({placeholders})',
+                    ids,
+                )
+                cursor.execute(f'DELETE FROM "{live}" WHERE id IN ({placeholders})', ids)
+        moved += len(ids)
@@ -0,0 +1,381 @@
+"""
+End-to-end view benchmark (``manage.py benchmark_views``).
+
+Every URL in ``Admin/urls.py`` and ``User/urls.py`` has at least one Case
+below; a URL without one fails the run. Each case is requested through the
+test client ``iterations`` times. The run records the p50/p95/p99 latency
+and the largest number of SQL queries a single request ran, which is checked
+against the budget recorded for the case in ``query_budgets.json``. Cases
+that change data (and the staff-only exports) also check the result before
+it is rolled back, so a case that lands on a form error or a login redirect
+fails the run instead of timing the wrong page.
+
+The run happens inside a transaction that is rolled back at the end, and
+each request in a savepoint of its own. Views that delete, issue or approve
+leave the database as they found it, and every iteration sees the same data.
+Reads therefore go to the default connection rather than the read-only one.
+"""
+import json
+import time
+import uuid
+from contextlib import ExitStack
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable
+
+import numpy as np
+from django.conf import settings
+from django.contrib.auth import SESSION_KEY
+from django.contrib.auth.models import User
+from django.db import connections, transaction
+from django.test import Client, override_settings
+from django.urls import reverse
+
+from Admin import urls as admin_urls
+from Admin.db import READ_ALIAS, WRITE_ALIAS
+from Admin.models import Book, BookRequest, LibraryStats, Member, Transaction
+from User import coborrow, similarity, urls as user_urls
+
+BUDGETS_PATH = Path(__file__).resolve().parent / 'query_budgets.json'
+
+URLCONFS = {'Admin': admin_urls, 'User': user_urls}
+
+PASSWORD = 'benchmark-password'
+
+
+class BenchmarkError(Exception):
+    """Raised when the harness cannot run a case as written."""
+
+
+@dataclass(frozen=True)
+class Case:
+    url_name: str
+    # Distinguishes several cases of one URL in reports and budgets
+    label: str = ''
+    method: str = 'get'
+    # fixtures -> URL kwargs / GET parameters / POST form data / JSON body
+    kwargs: Callable = None
+    query: Callable = None
+    data: Callable = None
+    json: Callable = None
+    signed_in: bool = False
+    # Sign in as a staff user instead (staff-only admin views)
+    staff: bool = False
+    # (fixtures, response) -> whether the request did its job; checked
+    # before the request's changes are rolled back
+    check: Callable = None
+
+    @property
+    def key(self):
+        return f'{self.url_name}:{self.label}' if self.label else self.url_name
+
+
+@dataclass
+class Fixtures:
+    """Rows the cases point at, picked from (or added to) the current data."""
+    user: User
+    staff: User
+    # The signed-in member, and another member for the admin pages
+    member: Member
+    other_member: Member
+    # In stock, not held by either member nor requested by ``member``
+    book: Book
+    # Open loans of ``other_member`` and of ``member``, of another such book
+    loan: Transaction
+    my_loan: Transaction
+    # A pending request of ``other_member`` for ``book``
+    request: BookRequest
+
+
+def _book_form(f):
+    book = f.book
+    return {
+        'title': book.title, 'author': book.author, 'isbn': book.isbn,
+        'published_date': book.published_date.isoformat(),
+        'available_copies': book.available_copies, 'category': book.category,
+        'description': book.description or '',
+    }
+
+
+def _member_form(f):
+    return {'full_name': 'Bench Mark', 'email': 'bench.mark@example.org', 'phone': '555-0100', 'address': '1 Test St'}
+
+
+# Checks for Case.check
+
+def _deleted(model, fixture):
+    return lambda f, response: not model.objects.filter(pk=getattr(f, fixture).pk).exists()
+
+
+def _returned(fixture):
+    return lambda f, response: Transaction.objects.filter(pk=getattr(f, fixture).pk, status='Returned').exists()
+
+
+def _request_status(status):
+    return lambda f, response: BookRequest.objects.filter(pk=f.request.pk, status=status).exists()
+
+
+def _ok(f, response):
+    return response.status_code == 200
+
+
+CASES = (
+    # Admin panel
+    Case('dashboard'),
+    Case('admin'),
+    Case('admin', 'search', query=lambda f: {'search': f.book.title}),
+    Case('add_book'),
+    Case('add_book', 'post', method='post', data=lambda f: {**_book_form(f), 'isbn': '9790000000001'},
+         check=lambda f, r: Book.objects.filter(isbn='9790000000001').exists()),
+    Case('update', kwargs=lambda f: {'id': f.book.pk}),
+    Case('update', 'post', method='post', kwargs=lambda f: {'id': f.book.pk},
+         data=lambda f: {**_book_form(f), 'title': 'Benchmark Edition'},
+         check=lambda f, r: Book.objects.filter(pk=f.book.pk, title='Benchmark Edition').exists()),
+    Case('delete_book', kwargs=lambda f: {'id': f.book.pk}, check=_deleted(Book, 'book')),
+    Case('members'),
+    Case('members', 'search', query=lambda f: {'search': f.other_member.full_name}),
+    Case('add_member'),
+    Case('add_member', 'post', method='post', data=_member_form,
+         check=lambda f, r: Member.objects.filter(email='bench.mark@example.org').exists()),
+    Case('edit_member', kwargs=lambda f: {'id': f.other_member.pk}),
+    Case('edit_member', 'post', method='post', kwargs=lambda f: {'id': f.other_member.pk}, data=_member_form,
+         check=lambda f, r: Member.objects.filter(pk=f.other_member.pk, email='bench.mark@example.org').exists()),
+    Case('delete_member', kwargs=lambda f: {'id': f.other_member.pk}, check=_deleted(Member, 'other_member')),
+    Case('transactions'),
+    Case('transactions', 'issued', query=lambda f: {'status': 'Issued'}),
+    Case('issue_book'),
+    Case('issue_book', 'post', method='post', data=lambda f: {'member': f.other_member.pk, 'book': f.book.pk},
+         check=lambda f, r: Transaction.objects.filter(
+             member=f.other_member, book=f.book, status='Issued').exists()),
+    Case('admin_return_book', kwargs=lambda f: {'id': f.loan.pk}, check=_returned('loan')),
+    Case('check_in'),
+    Case('check_in', 'post', method='post', data=lambda f: {'identifiers': str(f.loan.pk), 'by': 'id'},
+         check=_returned('loan')),
+    Case('delete_transaction', kwargs=lambda f: {'id': f.loan.pk}, check=_deleted(Transaction, 'loan')),
+    Case('book_requests'),
+    Case('approve_request', kwargs=lambda f: {'id': f.request.pk}, check=_request_status('Approved')),
+    Case('reject_request', kwargs=lambda f: {'id': f.request.pk}),
+    Case('reject_request', 'post', method='post', kwargs=lambda f: {'id': f.request.pk},
+         data=lambda f: {'admin_notes': 'Benchmark'}, check=_request_status('Rejected')),
+    Case('bulk_requests', method='post', data=lambda f: {'request_ids': [f.request.pk], 'action': 'approve'},
+         check=_request_status('Approved')),
+    Case('delete_request', kwargs=lambda f: {'id': f.request.pk}, check=_deleted(BookRequest, 'request')),
+    Case('export', 'transactions', kwargs=lambda f: {'kind': 'transactions'}, staff=True, check=_ok),
+    Case('export', 'members', kwargs=lambda f: {'kind': 'members'}, query=lambda f: {'format': 'jsonl'},
+         staff=True, check=_ok),
+    Case('export', 'books', kwargs=lambda f: {'kind': 'books'}, staff=True, check=_ok),
+
+    # Member site
+    Case('user_home'),
+    Case('user_home', 'signed-in', signed_in=True),
+    Case('user_home', 'search', query=lambda f: {'search': f.book.title}),
+    Case('book_detail', kwargs=lambda f: {'id': f.book.pk}),
+    Case('book_detail', 'signed-in', kwargs=lambda f: {'id': f.book.pk}, signed_in=True),
+    Case('register'),
+    Case('register', 'post', method='post', data=lambda f: {
+        'username': 'bench-new', 'email': 'bench.new@example.org', 'password': PASSWORD,
+        'password2': PASSWORD, 'full_name': 'Bench New', 'phone': '555-0101',
+    }, check=lambda f, r: Member.objects.filter(user__username='bench-new').exists()),
+    Case('user_login'),
+    Case('user_login', 'post', method='post', data=lambda f: {'username': f.user.username, 'password': PASSWORD},
+         check=lambda f, r: r.wsgi_request.user.pk == f.user.pk),
+    Case('user_logout', signed_in=True, check=lambda f, r: not r.wsgi_request.user.is_authenticated),
+    Case('my_books', signed_in=True),
+    Case('my_requests', signed_in=True),
+    Case('my_transactions', signed_in=True),
+    Case('request_book', kwargs=lambda f: {'id': f.book.pk}, signed_in=True,
+         check=lambda f, r: BookRequest.objects.filter(member=f.member, book=f.book, status='Pending').exists()),
+    Case('return_book', kwargs=lambda f: {'id': f.my_loan.pk}, signed_in=True, check=_returned('my_loan')),
+    Case('profile', signed_in=True),
+    Case('update_profile', signed_in=True),
+    Case('update_profile', 'post', method='post', signed_in=True, data=lambda f: {
+        'first_name': 'Bench', 'last_name': 'Member', 'email': f.member.email,
+        'full_name': f.member.full_name, 'phone': f.member.phone, 'address': f.member.address,
+    }, check=lambda f, r: User.objects.filter(pk=f.user.pk, first_name='Bench').exists()),
+    Case('chatbot'),
+    Case('chatbot_query', 'search', method='post', json=lambda f: {'query': f.book.title}),
+    Case('chatbot_query', 'similar', method='post', json=lambda f: {'query': f'books similar to {f.book.title}'}),
+    Case('chatbot_query', 'popular', method='post', json=lambda f: {'query': 'most popular fiction books'}),
+    Case('chatbot_query', 'recommend', method='post', signed_in=True,
+         json=lambda f: {'query': 'what should I read next?'}),
+)
+
+
+@dataclass
+class CaseResult:
+    key: str
+    # Seconds per request
+    timings: list = field(default_factory=list)
+    # Most queries run by one request
+    queries: int = 0
+    budget: int = None
+
+    def percentile(self, p):
+        """Latency percentile in milliseconds."""
+        return float(np.percentile(self.timings, p)) * 1000
+
+    @property
+    def over_budget(self):
+        return self.budget is not None and self.queries > self.budget
+
+
+def cases_for(app):
+    """The cases for the URLs of one app ('Admin' or 'User')."""
+    names = _url_names(URLCONFS[app])
+    return [case for case in CASES if case.url_name in names]
+
+
+def uncovered_urls():
+    """Names of the URLs no case requests."""
+    names = set().union(*(_url_names(urlconf) for urlconf in URLCONFS.values()))
+    return sorted(names - {case.url_name for case in CASES})
+
+
+def load_budgets(path=BUDGETS_PATH):
+    path = Path(path)
+    if not path.exists():
+        return {}
+    return json.loads(path.read_text(encoding='utf-8'))
+
+
+def save_budgets(budgets, path=BUDGETS_PATH):
+    Path(path).write_text(json.dumps(dict(sorted(budgets.items())), indent=2) + '\n', encoding='utf-8')
+
+
+def run(iterations=20, cases=CASES, budgets=None):
+    """
+    Request every case ``iterations`` times and return one CaseResult each.
+
+    Raises:
+        BenchmarkError: a URL has no case, the data has nothing to point the
+            cases at, or a request failed
+    """
+    missing = uncovered_urls()
+    if missing:
+        raise BenchmarkError(f'No benchmark case for URL(s): {", ".join(missing)}')
+    budgets = load_budgets() if budgets is None else budgets
+
+    results = []
+    # The test client sends Host: testserver. Fixtures are uncommitted and
+    # queries are counted on this thread's connections, so no worker threads.
+    overrides = override_settings(ALLOWED_HOSTS=['testserver', *settings.ALLOWED_HOSTS], DB_WORKER_THREADS=0)
+    with overrides, transaction.atomic():
+        fixtures = prepare_fixtures()
+        for case in cases:
+            result = CaseResult(case.key, budget=budgets.get(case.key))
+            client = _client(case, fixtures)
+            for _iteration in range(iterations):
+                if not (case.signed_in or case.staff):
+                    # Anonymous requests start without cookies every time
+                    client = Client()
+                elif SESSION_KEY not in client.session:
+                    # The previous request logged out
+                    client = _client(case, fixtures)
+                with transaction.atomic():
+                    elapsed, queries, response = _request(client, case, fixtures)
+                    done = case.check is None or case.check(fixtures, response)
+                    transaction.set_rollback(True)
+                if response.status_code >= 400:
+                    raise BenchmarkError(f'{case.key} returned HTTP {response.status_code}')
+                if not done:
+                    raise BenchmarkError(f'{case.key} did not make its change (HTTP {response.status_code})')
+                result.timings.append(elapsed)
+                result.queries = max(result.queries, queries)
+            results.append(result)
+        transaction.set_rollback(True)
+    return results
+
+
+def prepare_fixtures():
+    """Pick the members and books the cases use, and add the loans and request they act on."""
+    # The chatbot cases should measure the recommenders, not their fallbacks
+    for recommender in (similarity, coborrow):
+        if not recommender.index_path().exists():
+            recommender.rebuild_index()
+
+    member = Member.objects.filter(user=None).order_by('-total_loans', 'id').first()
+    other_member = Member.objects.exclude(pk=getattr(member, 'pk', None)).order_by('-total_loans', 'id').first()
+    if member is None or other_member is None:
+        raise BenchmarkError('The database needs at least two members without a login; run manage.py seed_lms.')
+
+    user = User.objects.create_user(f'benchmark-{uuid.uuid4().hex[:12]}', password=PASSWORD)
+    member.user = user
+    member.save()
+    staff = User.objects.create_user(f'benchmark-staff-{uuid.uuid4().hex[:12]}', password=PASSWORD, is_staff=True)
+
+    held = Transaction.objects.filter(member__in=[member, other_member], status='Issued').values('book')
+    requested = BookRequest.objects.filter(member=member, status='Pending').values('book')
+    in_stock = (
+        Book.objects.filter(available_copies__gt=0)
+        .exclude(pk__in=held).exclude(pk__in=requested)
+        .order_by('-borrow_count', 'id')
+    )
+    books = list(in_stock[:2])
+    if len(books) < 2:
+        raise BenchmarkError('The database needs at least two books in stock; run manage.py seed_lms.')
+    book, spare = books
+    # Stock both well above the low-stock threshold, so no case crosses it
+    # and every run takes the same path whatever the data holds
+    for stocked in books:
+        stocked.available_copies = max(stocked.available_copies, LibraryStats.LOW_STOCK_THRESHOLD + 3)
+        stocked.save()
+
+    # The loans and the request are the harness's own, not whatever the data
+    # happens to hold
+    my_loan = Transaction.objects.create(member=member, book=spare)
+    loan = Transaction.objects.create(member=other_member, book=spare)
+    request = BookRequest.objects.create(member=other_member, book=book)
+
+    return Fixtures(
+        user=user, staff=staff, member=member, other_member=other_member, book=book,
+        loan=loan, my_loan=my_loan, request=request,
+    )
+
+
+def _client(case, fixtures):
+    client = Client()
+    if case.staff:
+        client.force_login(fixtures.staff)
+    elif case.signed_in:
+        client.force_login(fixtures.user)
+    return client
+
+
+def _request(client, case, fixtures):
+    """Make one request; returns (seconds, queries, response)."""
+    url = reverse(case.url_name, kwargs=case.kwargs(fixtures) if case.kwargs else None)
+    query = case.query(fixtures) if case.query else {}
+    if case.json:
+        send = lambda: client.post(url, json.dumps(case.json(fixtures)), content_type='application/json')
+    elif case.method == 'post':
+        send = lambda: client.post(url, case.data(fixtures) if case.data else {})
+    else:
+        send = lambda: client.get(url, query)
+
+    counter = _QueryCounter()
+    # The read-only alias may share the default connection (test mirror)
+    watched = {id(connections[alias]): connections[alias] for alias in (WRITE_ALIAS, READ_ALIAS)}
+    with ExitStack() as stack:
+        for connection in watched.values():
+            stack.enter_context(connection.execute_wrapper(counter))
+        started = time.perf_counter()
+        response = send()
+        if response.streaming:
+            b''.join(response.streaming_content)
+        elapsed = time.perf_counter() - started
+    return elapsed, counter.count, response
+
+
+class _QueryCounter:
+    """Database execute wrapper that counts statements."""
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+def _url_names(urlconf):
+    return {pattern.name for pattern in urlconf.urlpatterns if pattern.name}
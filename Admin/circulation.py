@@ -0,0 +1,284 @@
+"""
+Set-based circulation operations for the admin panel.
+
+These handle many requests in a fixed number of queries instead of one HTTP
+round trip (and several queries) per request. The single-item paths
+(``Transaction.save``, ``mark_returned``, ``BookRequest.resolve``) stay in
+Admin/models.py.
+"""
+import re
+from collections import Counter, defaultdict
+
+from django.db.models import Case, F, When
+from django.utils import timezone
+
+from Admin.db import writer
+from Admin.models import Book, BookRequest, ConcurrentUpdate, LibraryStats, Member, Transaction
+
+NO_STOCK_NOTE = 'Book no longer available'
+ALREADY_ISSUED_NOTE = 'Member already has this book issued'
+
+# What check_in matches scanned tokens against
+CHECK_IN_MODES = ('isbn', 'id')
+
+# Longer digit strings cannot be a transaction id (SQLite integers are 64-bit)
+MAX_ID_DIGITS = 18
+
+
+class BulkResult:
+    """Outcome of a bulk operation, keyed by request id."""
+
+    def __init__(self):
+        self.approved = []
+        self.rejected = {}  # request id -> admin note
+
+    @property
+    def rejected_count(self):
+        return len(self.rejected)
+
+    def rejected_for(self, note):
+        return sum(1 for n in self.rejected.values() if n == note)
+
+
+def pending_requests_for(request_ids, whole_books=False):
+    """
+    Return the pending requests to act on, oldest first.
+
+    Args:
+        request_ids: Ids selected on the book_requests page
+        whole_books: Expand the selection to every pending request for the
+            books of the selected requests
+
+    Returns:
+        List of ``(id, member_id, book_id)`` tuples
+    """
+    pending = BookRequest.objects.filter(status='Pending')
+    if whole_books:
+        pending = pending.filter(
+            book_id__in=BookRequest.objects.filter(id__in=request_ids).values('book_id')
+        )
+    else:
+        pending = pending.filter(id__in=request_ids)
+    return list(pending.order_by('request_date', 'id').values_list('id', 'member_id', 'book_id'))
+
+
+def reject_requests(request_ids, admin_notes='', whole_books=False):
+    """Reject the selected pending requests in one UPDATE."""
+    result = BulkResult()
+    with writer():
+        ids = [row[0] for row in pending_requests_for(request_ids, whole_books)]
+        _reject(ids, admin_notes)
+    result.rejected = {request_id: admin_notes for request_id in ids}
+    return result
+
+
+def approve_requests(request_ids, whole_books=False):
+    """
+    Approve the selected pending requests.
+
+    Copies are handed out by request_date. Requests that cannot be
+    served are rejected with a note: the book ran out, or the member already
+    holds it. Everything commits in one transaction, with a fixed number of
+    queries however many requests are selected.
+    """
+    result = BulkResult()
+    with writer():
+        rows = pending_requests_for(request_ids, whole_books)
+        if not rows:
+            return result
+
+        book_ids = {book_id for _id, _member_id, book_id in rows}
+        member_ids = {member_id for _id, member_id, _book_id in rows}
+        stock = dict(
+            Book.objects.select_for_update()
+            .filter(id__in=book_ids)
+            .values_list('id', 'available_copies')
+        )
+        open_loans = set(
+            Transaction.objects.filter(
+                status='Issued', book_id__in=book_ids, member_id__in=member_ids
+            ).values_list('member_id', 'book_id')
+        )
+
+        remaining = dict(stock)
+        loans = []
+        for request_id, member_id, book_id in rows:
+            if (member_id, book_id) in open_loans:
+                result.rejected[request_id] = ALREADY_ISSUED_NOTE
+            elif remaining[book_id] <= 0:
+                result.rejected[request_id] = NO_STOCK_NOTE
+            else:
+                remaining[book_id] -= 1
+                open_loans.add((member_id, book_id))
+                result.approved.append(request_id)
+                loans.append(Transaction(
+                    member_id=member_id,
+                    book_id=book_id,
+                    book_request_id=request_id,
+                    status='Issued',
+                ))
+
+        if result.approved:
+            _resolve(result.approved, status='Approved')
+            Transaction.objects.bulk_create(loans)
+            issued = Counter(loan.book_id for loan in loans)
+            Book.objects.filter(id__in=issued).update(
+                available_copies=Case(
+                    *[When(id=book_id, then=F('available_copies') - count) for book_id, count in issued.items()]
+                ),
+                borrow_count=Case(
+                    *[When(id=book_id, then=F('borrow_count') + count) for book_id, count in issued.items()]
+                ),
+            )
+
+        for note in (NO_STOCK_NOTE, ALREADY_ISSUED_NOTE):
+            _reject([rid for rid, n in result.rejected.items() if n == note], note)
+
+        threshold = LibraryStats.LOW_STOCK_THRESHOLD
+        newly_low = sum(
+            1 for book_id, before in stock.items()
+            if before >= threshold > remaining[book_id]
+        )
+        LibraryStats.bump(
+            total_transactions=len(loans),
+            issued_books=len(loans),
+            low_stock_books=newly_low,
+            catalog_version=int(bool(loans)),
+        )
+        _bump_members(Counter(loan.member_id for loan in loans), issued_count=1, total_loans=1)
+    return result
+
+
+def parse_identifiers(text):
+    """Split scanner/pasted input on whitespace and commas, dropping dashes."""
+    return [token.replace('-', '') for token in re.split(r'[\s,;]+', text) if token]
+
+
+def check_in(identifiers, by='isbn'):
+    """
+    Return a batch of loans, e.g. a stack of books scanned at the drop box.
+
+    Args:
+        identifiers: ISBNs or transaction ids. Scanning the same ISBN twice
+            returns two copies.
+        by: ``'isbn'`` or ``'id'``
+
+    Returns:
+        One dict per identifier, in input order, with ``identifier``,
+        ``status`` ('returned', 'already_returned' or 'not_found') and
+        ``transaction`` (None when not found).
+
+    Raises:
+        ValueError: ``by`` is not one of CHECK_IN_MODES
+        ConcurrentUpdate: a loan was returned by someone else meanwhile;
+            nothing is changed
+    """
+    if by not in CHECK_IN_MODES:
+        raise ValueError(f'Cannot check in by {by!r}; expected one of {", ".join(CHECK_IN_MODES)}')
+    loan_fields = ('status', 'issue_date', 'book_id', 'member__full_name', 'book__title', 'book__isbn')
+    with writer():
+        loans = Transaction.objects.select_for_update().select_related('member', 'book').only(*loan_fields)
+        if by == 'id':
+            ids = [_loan_id(token) for token in identifiers]
+            by_id = {loan.id: loan for loan in loans.filter(id__in=[i for i in ids if i is not None])}
+            matched = [by_id.get(loan_id) for loan_id in ids]
+        else:
+            # Oldest open loan first for each ISBN
+            queues = defaultdict(list)
+            open_loans = loans.filter(status='Issued', book__isbn__in=set(identifiers))
+            for loan in open_loans.order_by('issue_date', 'id'):
+                queues[loan.book.isbn].append(loan)
+            matched = [queues[token].pop(0) if queues[token] else None for token in identifiers]
+
+        to_return = {}
+        results = []
+        for token, loan in zip(identifiers, matched):
+            if loan is None:
+                status = 'not_found'
+            elif loan.status != 'Issued' or loan.id in to_return:
+                status = 'already_returned'
+            else:
+                status = 'returned'
+                to_return[loan.id] = loan
+            results.append({'identifier': token, 'status': status, 'transaction': loan})
+
+        if to_return:
+            _return_loans(list(to_return.values()))
+    return results
+
+
+def _loan_id(token):
+    """The transaction id a scanned token names, or None."""
+    if token.isdigit() and len(token) <= MAX_ID_DIGITS:
+        return int(token)
+    return None
+
+
+def _return_loans(loans):
+    """Mark open loans returned and restore stock with grouped UPDATEs."""
+    today = timezone.now().date()
+    updated = Transaction.objects.filter(
+        id__in=[loan.id for loan in loans], status='Issued'
+    ).update(status='Returned', return_date=today)
+    if updated != len(loans):
+        raise ConcurrentUpdate('Some of the loans were returned by someone else meanwhile.')
+
+    returned = Counter(loan.book_id for loan in loans)
+    threshold = LibraryStats.LOW_STOCK_THRESHOLD
+    before = dict(
+        Book.objects.select_for_update().filter(id__in=returned).values_list('id', 'available_copies')
+    )
+    Book.objects.filter(id__in=returned).update(available_copies=Case(
+        *[When(id=book_id, then=F('available_copies') + count) for book_id, count in returned.items()]
+    ))
+    no_longer_low = sum(
+        1 for book_id, count in returned.items()
+        if before[book_id] < threshold <= before[book_id] + count
+    )
+    LibraryStats.bump(
+        issued_books=-len(loans),
+        returned_books=len(loans),
+        low_stock_books=-no_longer_low,
+        catalog_version=1,
+    )
+    _bump_members(Counter(loan.member_id for loan in loans), issued_count=-1, returned_count=1)
+
+    for loan in loans:
+        loan.status = 'Returned'
+        loan.return_date = today
+        loan._loaded_status = 'Returned'
+
+
+def _bump_members(per_member, **unit_deltas):
+    """
+    Add ``unit_deltas`` times each member's count to their loan counters,
+    in a single UPDATE for all members.
+    """
+    if not per_member:
+        return
+    Member.objects.filter(id__in=per_member).update(**{
+        field: Case(*[
+            When(id=member_id, then=F(field) + unit * count)
+            for member_id, count in per_member.items()
+        ])
+        for field, unit in unit_deltas.items()
+    })
+
+
+def _resolve(request_ids, status, admin_notes=None):
+    """Move pending requests to ``status``; all of them must still be pending."""
+    if not request_ids:
+        return
+    changes = {'status': status}
+    if admin_notes is not None:
+        changes['admin_notes'] = admin_notes
+    updated = BookRequest.objects.filter(id__in=request_ids, status='Pending').update(**changes)
+    if updated != len(request_ids):
+        # Someone else resolved one of them meanwhile; roll back and let the
+        # librarian retry with a fresh list.
+        raise ConcurrentUpdate('Some of the selected requests are no longer pending.')
+    LibraryStats.bump(pending_requests=-updated)
+
+
+def _reject(request_ids, admin_notes):
+    _resolve(request_ids, status='Rejected', admin_notes=admin_notes)
@@ -0,0 +1,48 @@
+"""
+Conditional GET for catalog pages.
+
+Book grids and detail pages only change when the catalog does, so their
+ETag is ``LibraryStats.catalog_version`` plus the signed-in user (the navbar
+differs per user). A repeat request whose ``If-None-Match`` still matches gets
+a 304 before the view runs its queryset or renders anything. Last-Modified
+is only sent to anonymous visitors, because ``If-Modified-Since`` alone cannot
+tell two users of the same browser apart. Responses that carry flash
+messages are never conditional, or the message would be lost in a 304.
+"""
+from django.contrib.messages import get_messages
+from django.utils.http import quote_etag
+from django.views.decorators.http import condition
+
+from Admin.models import LibraryStats
+
+
+def catalog_state(request):
+    """``(catalog_version, catalog_modified)``, read at most once per request."""
+    if not hasattr(request, '_catalog_state'):
+        request._catalog_state = LibraryStats.catalog_state()
+    return request._catalog_state
+
+
+def conditional_etag(request, version):
+    """ETag for a page of catalog ``version`` as seen by ``request.user``."""
+    if len(get_messages(request)):
+        return None
+    return quote_etag(f'{version}-{request.user.pk or 0}')
+
+
+def conditional_last_modified(request, modified):
+    if request.user.is_authenticated or len(get_messages(request)):
+        return None
+    return modified
+
+
+def _catalog_etag(request, *args, **kwargs):
+    return conditional_etag(request, catalog_state(request)[0])
+
+
+def _catalog_last_modified(request, *args, **kwargs):
+    return conditional_last_modified(request, catalog_state(request)[1])
+
+
+# Decorator for views whose output depends only on the catalog and the user
+catalog_condition = condition(etag_func=_catalog_etag, last_modified_func=_catalog_last_modified)
@@ -0,0 +1,99 @@
+"""
+Cover image derivatives.
+
+Uploaded covers are full-size photos, so list pages show fixed-size
+derivatives instead: a square thumbnail for tables and a 2:3 card image for
+the catalog grid, each as JPEG and WebP. They are generated off the request
+thread once the upload has committed (see ``Admin.signals``).
+``manage.py build_cover_derivatives`` backfills existing images.
+
+Derivatives live next to the original in ``cover_storage``, under
+``derived/``: ``covers/ab/abcd.jpg`` -> ``covers/ab/derived/abcd-card.webp``.
+"""
+import io
+import logging
+import posixpath
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.files.base import ContentFile
+from django.db import transaction
+from PIL import Image, ImageOps
+
+from Admin.storage import cover_storage
+
+logger = logging.getLogger(__name__)
+
+# name -> (width, height); images are cropped to fill the box exactly
+DERIVATIVES = {
+    'thumb': (100, 100),
+    'card': (400, 600),
+}
+
+# file extension -> (Pillow format, save options)
+FORMATS = {
+    'jpg': ('JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+    'webp': ('WEBP', {'quality': 80, 'method': 6}),
+}
+
+# One worker: generation is CPU-bound and must not compete with requests
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='covers')
+
+
+def derivative_name(image_name, kind, ext):
+    """
+    Stored name of one derivative. Only the digest is used, so the same
+    image uploaded as ``.jpg`` and ``.jpeg`` shares its derivatives.
+    """
+    directory, filename = posixpath.split(image_name)
+    stem = posixpath.splitext(filename)[0]
+    return posixpath.join(directory, 'derived', f'{stem}-{kind}.{ext}')
+
+
+def derivative_url(image_name, kind, ext='jpg'):
+    """URL of a derivative, or None while it has not been generated yet (or was deleted)."""
+    storage = cover_storage()
+    name = derivative_name(image_name, kind, ext)
+    if not storage.exists(name):
+        return None
+    return storage.url(name)
+
+
+def generate_derivatives(image_name, force=False):
+    """
+    Write every derivative of ``image_name``.
+
+    Returns:
+        Number of files written (existing ones are kept unless ``force``)
+    """
+    storage = cover_storage()
+    with storage.open(image_name, 'rb') as fh:
+        source = ImageOps.exif_transpose(Image.open(fh))
+        source.load()
+    if source.mode not in ('RGB', 'L'):
+        source = source.convert('RGB')
+
+    written = 0
+    for kind, size in DERIVATIVES.items():
+        image = None
+        for ext, (image_format, options) in FORMATS.items():
+            name = derivative_name(image_name, kind, ext)
+            if not force and storage.exists(name):
+                continue
+            image = image or ImageOps.fit(source, size, Image.Resampling.LANCZOS)
+            buffer = io.BytesIO()
+            image.save(buffer, image_format, **options)
+            storage.save_derived(name, ContentFile(buffer.getvalue()))
+            written += 1
+    return written
+
+
+def schedule_derivatives(image_name):
+    """Generate derivatives in the background once the current transaction commits."""
+    transaction.on_commit(lambda: _executor.submit(_generate_logged, image_name))
+
+
+def _generate_logged(image_name):
+    try:
+        generate_derivatives(image_name, force=True)
+    except Exception:
+        logger.exception('Could not generate cover derivatives for %s', image_name)
@@ -0,0 +1,101 @@
+"""
+Database access for SQLite.
+
+Every connection is opened with WAL journaling and a busy timeout (see
+``DATABASES`` in settings). Readers in WAL mode never block on the writer,
+so reads outside a transaction go to the ``readonly`` alias. That alias uses
+the same file through query-only connections, which each thread keeps
+open between requests. Everything else uses ``default``.
+
+SQLite allows one writer at a time. Inventory writes (issuing, returning and
+resolving requests) therefore run in ``writer()``. It queues the threads of
+this process on a lock before they take the database write lock. A waiting
+thread is woken as soon as the writer commits. Without the queue it would
+sleep and retry in SQLite's busy handler, and it could fail with
+"database is locked". Other processes still wait in the busy handler.
+
+Async views run their ORM work through ``in_worker_thread``, on a pool of
+long-lived threads that each keep their connections. Django would otherwise
+run it on a thread of the request's own, which opens new connections every
+request under ASGI.
+"""
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections, connections
+from django.db.transaction import atomic
+
+READ_ALIAS = 'readonly'
+WRITE_ALIAS = 'default'
+
+_write_lock = threading.Lock()
+
+_worker_pool = None
+_worker_pool_lock = threading.Lock()
+
+
+@contextmanager
+def writer():
+    """Run the block as one write transaction, queued behind other writers."""
+    if connections[WRITE_ALIAS].in_atomic_block:
+        # The enclosing transaction already holds the write lock
+        # (transaction_mode is IMMEDIATE); waiting here could deadlock it
+        with atomic(using=WRITE_ALIAS):
+            yield
+        return
+    with _write_lock, atomic(using=WRITE_ALIAS):
+        yield
+
+
+def in_worker_thread(func):
+    """
+    Return an async version of ``func`` that runs on the worker pool.
+
+    Connections that are broken or older than CONN_MAX_AGE are closed around
+    each call, as the request signals do for request threads. With
+    ``DB_WORKER_THREADS = 0`` ``func`` runs on the caller's thread instead,
+    where it sees the caller's open transaction.
+    """
+    if not settings.DB_WORKER_THREADS:
+        return sync_to_async(func)
+
+    @functools.wraps(func)
+    def call(*args, **kwargs):
+        close_old_connections()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            close_old_connections()
+
+    return sync_to_async(call, thread_sensitive=False, executor=_get_worker_pool())
+
+
+def _get_worker_pool():
+    global _worker_pool
+    with _worker_pool_lock:
+        if _worker_pool is None:
+            _worker_pool = ThreadPoolExecutor(settings.DB_WORKER_THREADS, thread_name_prefix='db-worker')
+        return _worker_pool
+
+
+class ReadWriteRouter:
+    """Send reads to the read-only connections unless inside a transaction."""
+
+    def db_for_read(self, model, **hints):
+        if READ_ALIAS not in connections or connections[WRITE_ALIAS].in_atomic_block:
+            # A transaction must read its own uncommitted writes
+            return WRITE_ALIAS
+        return READ_ALIAS
+
+    def db_for_write(self, model, **hints):
+        return WRITE_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, **hints):
+        return db == WRITE_ALIAS
@@ -0,0 +1,256 @@
+"""
+Bulk catalog import (``manage.py import_books``).
+
+Records are streamed from CSV, JSON Lines or binary MARC 21 files, validated
+and upserted on ISBN a chunk at a time: one lookup of the chunk's existing
+ISBNs, then one ``bulk_create`` and one ``bulk_update``, each chunk in its own
+write transaction. Memory use depends on the chunk size, not the file size.
+Malformed input (bad MARC structure, invalid UTF-8) fails only the record it
+is in, as an InvalidRecord.
+
+New books get the copies given in the file. Existing books keep their
+stock, since copies may be out on loan, and only their descriptive fields are
+updated. Bulk writes skip ``save()``, so each chunk bumps LibraryStats
+itself. The search index triggers still fire.
+"""
+import csv
+import datetime
+import json
+import re
+from dataclasses import dataclass
+
+from Admin.db import writer
+from Admin.models import Book, LibraryStats
+
+FORMATS = ('csv', 'jsonl', 'marc')
+
+# Updated on books that already exist; copies only count for new books
+UPDATE_FIELDS = ('title', 'author', 'published_date', 'category', 'description')
+
+CATEGORIES = {value.lower(): value for value, _label in Book.CATEGORY_CHOICES}
+
+_ISBN_RE = re.compile(r'^(\d{9}[\dX]|\d{13})$')
+_YEAR_RE = re.compile(r'\d{4}')
+_SURROGATE_RE = re.compile('[\ud800-\udfff]')
+
+MARC_RECORD_END = b'\x1d'
+
+
+class InvalidRecord(ValueError):
+    """Raised for a record that cannot be imported."""
+
+
+@dataclass
+class ImportResult:
+    created: int = 0
+    updated: int = 0
+    # Records that failed validation
+    invalid: int = 0
+
+
+def detect_format(path):
+    suffix = str(path).lower().rsplit('.', 1)[-1]
+    if suffix in ('mrc', 'marc'):
+        return 'marc'
+    if suffix in ('jsonl', 'ndjson'):
+        return 'jsonl'
+    return 'csv'
+
+
+def read_records(path, file_format):
+    """
+    Yield one dict per record in the file, without reading it all in.
+
+    Bytes that are not valid UTF-8 are kept as lone surrogates, which
+    clean_record() rejects, so they fail their record rather than the file.
+    So do CSV rows the csv module cannot parse (such as a field over
+    ``csv.field_size_limit()``) and JSON lines that are not objects.
+    """
+    if file_format == 'csv':
+        with open(path, newline='', encoding='utf-8-sig', errors='surrogateescape') as fh:
+            rows = csv.DictReader(fh)
+            while True:
+                try:
+                    yield next(rows)
+                except StopIteration:
+                    return
+                except csv.Error as e:
+                    yield InvalidRecord(f'malformed CSV row: {e}')
+    elif file_format == 'jsonl':
+        with open(path, encoding='utf-8', errors='surrogateescape') as fh:
+            for line in fh:
+                if line.strip():
+                    try:
+                        record = json.loads(line)
+                    except ValueError as e:
+                        yield InvalidRecord(f'invalid JSON: {e}')
+                        continue
+                    if isinstance(record, dict):
+                        yield record
+                    else:
+                        yield InvalidRecord(f'expected a JSON object, got {type(record).__name__}')
+    elif file_format == 'marc':
+        with open(path, 'rb') as fh:
+            yield from read_marc(fh)
+    else:
+        raise ValueError(f'Unknown format {file_format!r}; expected one of {", ".join(FORMATS)}')
+
+
+def read_marc(fh):
+    """
+    Yield book dicts from a binary MARC 21 (ISO 2709) stream.
+
+    Uses 020$a (ISBN), 245$a$b (title), 100/110/700$a (author), 264/260$c or
+    008 (year), 520$a (description) and 650$a (category, when it names one).
+    A record whose leader or directory cannot be parsed is yielded as an
+    InvalidRecord; reading goes on after its record terminator.
+    """
+    while True:
+        leader = fh.read(24)
+        if not leader.strip():
+            return
+        try:
+            length = int(leader[:5])
+            if length < 24:
+                raise ValueError(f'record length {length}')
+        except ValueError as e:
+            _skip_to_terminator(fh, leader)
+            yield InvalidRecord(f'malformed MARC leader: {e}')
+            continue
+        record = leader + fh.read(length - 24)
+        try:
+            yield _marc_book(record)
+        except ValueError as e:
+            # Includes UnicodeDecodeError from a garbled directory
+            yield InvalidRecord(f'malformed MARC record: {e}')
+
+
+def _skip_to_terminator(fh, read):
+    """Consume the rest of a record whose length is unknown."""
+    while MARC_RECORD_END not in read:
+        read = fh.read(4096)
+        if not read:
+            return
+    # Step back to just after the terminator
+    fh.seek(read.index(MARC_RECORD_END) + 1 - len(read), 1)
+
+
+def _marc_book(record):
+    base = int(record[12:17])
+    encoding = 'utf-8' if record[9:10] == b'a' else 'latin-1'
+
+    fields = {}
+    directory = record[24:base - 1]
+    for i in range(0, len(directory) - 11, 12):
+        tag = directory[i:i + 3].decode('ascii')
+        size, start = int(directory[i + 3:i + 7]), int(directory[i + 7:i + 12])
+        data = record[base + start:base + start + size].rstrip(b'\x1e\x1d')
+        fields.setdefault(tag, []).append(data.decode(encoding, 'replace'))
+
+    def subfield(tag, code):
+        for data in fields.get(tag, ()):
+            for part in data.split('\x1f')[1:]:
+                if part[:1] == code:
+                    return part[1:].strip()
+        return ''
+
+    title = ': '.join(filter(None, (subfield('245', code).rstrip(' /:;,.') for code in 'ab')))
+    control = fields.get('008', [''])[0]
+    return {
+        'isbn': subfield('020', 'a').split(' ')[0],
+        'title': title,
+        'author': (subfield('100', 'a') or subfield('110', 'a') or subfield('700', 'a')).rstrip(' ,.'),
+        'published_date': subfield('264', 'c') or subfield('260', 'c') or control[7:11],
+        'description': subfield('520', 'a'),
+        'category': subfield('650', 'a').rstrip(' .'),
+    }
+
+
+def clean_record(record):
+    """
+    Validate a raw record and return the Book field values.
+
+    Raises:
+        InvalidRecord: a required field is missing or malformed
+    """
+    if isinstance(record, InvalidRecord):
+        raise record
+
+    def text(name, max_length, required=True):
+        value = str(record.get(name) or '').strip()
+        if _SURROGATE_RE.search(value):
+            raise InvalidRecord(f'{name} is not valid UTF-8')
+        if required and not value:
+            raise InvalidRecord(f'{name} is required')
+        if len(value) > max_length:
+            raise InvalidRecord(f'{name} is longer than {max_length} characters')
+        return value
+
+    isbn = str(record.get('isbn') or '').replace('-', '').replace(' ', '').upper()
+    if not _ISBN_RE.match(isbn):
+        raise InvalidRecord(f'invalid ISBN {record.get("isbn")!r}')
+
+    try:
+        copies = int(record.get('available_copies') or 1)
+    except (TypeError, ValueError):
+        raise InvalidRecord(f'invalid available_copies {record.get("available_copies")!r}')
+    if copies < 0:
+        raise InvalidRecord('available_copies cannot be negative')
+
+    return {
+        'isbn': isbn,
+        'title': text('title', 200),
+        'author': text('author', 100),
+        'published_date': _parse_date(record.get('published_date')),
+        'available_copies': copies,
+        'category': CATEGORIES.get(str(record.get('category') or '').strip().lower(), 'Other'),
+        'description': text('description', 100_000, required=False),
+    }
+
+
+def _parse_date(value):
+    value = str(value or '').strip()
+    try:
+        return datetime.date.fromisoformat(value[:10])
+    except ValueError:
+        pass
+    year = _YEAR_RE.search(value)
+    if year is None:
+        raise InvalidRecord(f'invalid published_date {value!r}')
+    return datetime.date(int(year.group()), 1, 1)
+
+
+def upsert_chunk(rows, result, include_unchanged=False):
+    """
+    Create or update one chunk of cleaned rows; returns the ids written.
+
+    With ``include_unchanged`` the ids of existing books that needed no
+    update are returned too: when resuming, the chunk may have been written
+    by the interrupted run, whose change signal was never sent.
+    """
+    # The last record wins when an ISBN repeats within the chunk
+    rows = {row['isbn']: row for row in rows}
+    with writer():
+        existing = Book.objects.in_bulk(rows, field_name='isbn')
+        new = [Book(**row) for isbn, row in rows.items() if isbn not in existing]
+        changed = []
+        for isbn, book in existing.items():
+            row = rows[isbn]
+            if any(getattr(book, name) != row[name] for name in UPDATE_FIELDS):
+                for name in UPDATE_FIELDS:
+                    setattr(book, name, row[name])
+                changed.append(book)
+
+        Book.objects.bulk_create(new)
+        Book.objects.bulk_update(changed, UPDATE_FIELDS)
+        threshold = LibraryStats.LOW_STOCK_THRESHOLD
+        LibraryStats.bump(
+            total_books=len(new),
+            low_stock_books=sum(1 for book in new if book.available_copies < threshold),
+            catalog_version=int(bool(new or changed)),
+        )
+    result.created += len(new)
+    result.updated += len(changed)
+    if include_unchanged:
+        changed = list(existing.values())
+    return [book.pk for book in new] + [book.pk for book in changed]
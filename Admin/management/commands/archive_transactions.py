@@ -0,0 +1,22 @@
+import datetime
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from Admin.archive import archive_returned
+
+
+class Command(BaseCommand):
+    help = 'Move loans returned more than --days ago from the transaction table to the archive'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=365,
+                            help='Archive loans returned more than this many days ago')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--dry-run', action='store_true', help='Only count the loans to move')
+
+    def handle(self, *args, **options):
+        before = timezone.now().date() - datetime.timedelta(days=options['days'])
+        moved = archive_returned(before, batch_size=options['batch_size'], dry_run=options['dry_run'])
+        verb = 'Would archive' if options['dry_run'] else 'Archived'
+        self.stdout.write(self.style.SUCCESS(f'{verb} {moved} loan(s) returned before {before}.'))
@@ -0,0 +1,134 @@
+import random
+import sqlite3
+import statistics
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import IntegrityError, OperationalError, connections
+
+from Admin import db
+from Admin.models import Book, BookUnavailable, Member, Transaction
+
+ALIASES = (db.WRITE_ALIAS, db.READ_ALIAS)
+
+
+class Command(BaseCommand):
+    help = (
+        'Measure mixed catalog-read / issue-and-return throughput on a copy '
+        'of the database, first with plain SQLite settings (rollback '
+        'journal, no writer queue) and then with the configured ones. The '
+        'configured settings are there to remove "database is locked" errors '
+        'and keep reads off the write lock; write latency may well go up.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seconds', type=float, default=10)
+        parser.add_argument('--readers', type=int, default=8)
+        parser.add_argument('--writers', type=int, default=4)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        source = connections[db.WRITE_ALIAS].settings_dict['NAME']
+        member_ids = list(Member.objects.values_list('id', flat=True))
+        book_ids = list(Book.objects.filter(available_copies__gt=0).values_list('id', flat=True))
+        if not member_ids or not book_ids:
+            raise CommandError('The database needs members and books in stock to benchmark.')
+        connections.close_all()
+
+        configured = {alias: dict(connections.settings[alias]['OPTIONS']) for alias in ALIASES}
+        with tempfile.TemporaryDirectory() as tmp:
+            for name, tuned in (('baseline', False), ('tuned', True)):
+                path = Path(tmp) / f'{name}.sqlite3'
+                _copy_database(source, path, journal_mode='WAL' if tuned else 'DELETE')
+                for alias in ALIASES:
+                    settings_dict = connections.settings[alias]
+                    settings_dict['NAME'] = path
+                    settings_dict['OPTIONS'] = configured[alias] if tuned else {}
+                write_lock = db._write_lock
+                if not tuned:
+                    db._write_lock = nullcontext()
+                try:
+                    stats = self.run(member_ids, book_ids, options)
+                finally:
+                    db._write_lock = write_lock
+                    connections.close_all()
+                self.report(name, stats, options['seconds'])
+
+    def run(self, member_ids, book_ids, options):
+        deadline = time.perf_counter() + options['seconds']
+        stats = {'reads': 0, 'writes': 0, 'locked': 0, 'write_latency': []}
+        lock = threading.Lock()
+
+        def reader(seed):
+            rng = random.Random(seed)
+            pages = max(1, len(book_ids) // 24)
+            reads = 0
+            while time.perf_counter() < deadline:
+                offset = rng.randrange(pages) * 24
+                list(Book.objects.order_by('title', 'id').values('id', 'title', 'available_copies')[offset:offset + 24])
+                Book.objects.filter(pk=rng.choice(book_ids)).first()
+                reads += 1
+            connections.close_all()
+            with lock:
+                stats['reads'] += reads
+
+        def writer(seed):
+            rng = random.Random(seed)
+            writes, locked, latency, open_loans = 0, 0, [], []
+            while time.perf_counter() < deadline:
+                started = time.perf_counter()
+                try:
+                    if open_loans and (len(open_loans) > 5 or rng.random() < 0.5):
+                        open_loans.pop(rng.randrange(len(open_loans))).mark_returned()
+                    else:
+                        open_loans.append(Transaction.objects.create(
+                            member_id=rng.choice(member_ids),
+                            book_id=rng.choice(book_ids),
+                            status='Issued',
+                        ))
+                except (BookUnavailable, IntegrityError):
+                    # Out of stock, or the member already holds that book
+                    continue
+                except OperationalError:
+                    locked += 1
+                    continue
+                latency.append(time.perf_counter() - started)
+                writes += 1
+            connections.close_all()
+            with lock:
+                stats['writes'] += writes
+                stats['locked'] += locked
+                stats['write_latency'] += latency
+
+        rng = random.Random(options['seed'])
+        workers = [reader] * options['readers'] + [writer] * options['writers']
+        with ThreadPoolExecutor(max_workers=len(workers)) as pool:
+            for future in [pool.submit(work, rng.random()) for work in workers]:
+                future.result()
+        return stats
+
+    def report(self, name, stats, seconds):
+        latency = sorted(stats['write_latency']) or [0]
+        self.stdout.write(
+            f'{name}: {stats["reads"] / seconds:.0f} reads/s, '
+            f'{stats["writes"] / seconds:.0f} writes/s, '
+            f'{stats["locked"]} "database is locked" errors, '
+            f'write p50 {statistics.median(latency) * 1000:.1f}ms, '
+            f'p95 {latency[int(len(latency) * 0.95) - 1] * 1000:.1f}ms'
+        )
+
+
+def _copy_database(source, target, journal_mode):
+    src = sqlite3.connect(source)
+    dst = sqlite3.connect(target)
+    try:
+        src.backup(dst)
+        dst.execute(f'PRAGMA journal_mode={journal_mode}')
+    finally:
+        src.close()
+        dst.close()
@@ -0,0 +1,56 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from Admin import benchmark
+
+
+class Command(BaseCommand):
+    help = (
+        'Request every admin and member URL through the test client and report '
+        'p50/p95/p99 latency and SQL query counts; fails when a view runs more '
+        'queries than its recorded budget'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=20, help='Requests per case')
+        parser.add_argument('--case', action='append', default=[],
+                            help='Only run cases whose name contains this text (repeatable)')
+        parser.add_argument('--budgets', default=benchmark.BUDGETS_PATH, help='Query budget file')
+        parser.add_argument('--record', action='store_true',
+                            help='Write the measured query counts to the budget file instead of checking them')
+
+    def handle(self, *args, **options):
+        cases = [
+            case for case in benchmark.CASES
+            if not options['case'] or any(text in case.key for text in options['case'])
+        ]
+        if not cases:
+            raise CommandError('No case matches --case.')
+        budgets = benchmark.load_budgets(options['budgets'])
+        try:
+            results = benchmark.run(options['iterations'], cases, budgets)
+        except benchmark.BenchmarkError as e:
+            raise CommandError(str(e))
+
+        self.stdout.write(f'{"case":<32} {"p50 ms":>8} {"p95 ms":>8} {"p99 ms":>8} {"queries":>8} {"budget":>7}')
+        for result in results:
+            line = (
+                f'{result.key:<32} {result.percentile(50):8.1f} {result.percentile(95):8.1f} '
+                f'{result.percentile(99):8.1f} {result.queries:8d} {"-" if result.budget is None else result.budget:>7}'
+            )
+            self.stdout.write(self.style.ERROR(line) if result.over_budget else line)
+
+        if options['record']:
+            budgets.update({result.key: result.queries for result in results})
+            benchmark.save_budgets(budgets, options['budgets'])
+            self.stdout.write(self.style.SUCCESS(f'Recorded {len(results)} query budget(s) in {options["budgets"]}.'))
+            return
+
+        unbudgeted = [result.key for result in results if result.budget is None]
+        if unbudgeted:
+            self.stdout.write(self.style.WARNING(
+                f'No query budget for: {", ".join(unbudgeted)} (record one with --record).'
+            ))
+        over = [f'{result.key} ({result.queries} > {result.budget})' for result in results if result.over_budget]
+        if over:
+            raise CommandError(f'{len(over)} view(s) over their query budget: {", ".join(over)}')
+        self.stdout.write(self.style.SUCCESS(f'{len(results)} case(s) within their query budgets.'))
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from Admin.covers import generate_derivatives
+from Admin.models import Book
+
+
+class Command(BaseCommand):
+    help = 'Generate thumbnail and card derivatives (JPEG + WebP) for existing book covers'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help='Regenerate derivatives that already exist')
+
+    def handle(self, *args, **options):
+        images = Book.objects.exclude(image='').exclude(image__isnull=True).values_list('image', flat=True)
+        written = failed = 0
+        for name in images.distinct().iterator():
+            try:
+                written += generate_derivatives(name, force=options['force'])
+            except (OSError, ValueError) as e:
+                failed += 1
+                self.stderr.write(f'{name}: {e}')
+        self.stdout.write(self.style.SUCCESS(f'Wrote {written} derivative(s); {failed} image(s) failed.'))
@@ -0,0 +1,36 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from Admin.exports import EXPORTS, FORMATS, encode, export_rows, parse_date
+
+
+class Command(BaseCommand):
+    help = 'Stream loans (full history), members or books to a CSV or JSON Lines file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=sorted(EXPORTS))
+        parser.add_argument('--format', choices=sorted(FORMATS), default='csv')
+        parser.add_argument('--status', help='Only loans with this status (Issued or Returned)')
+        parser.add_argument('--from', dest='date_from', help='First date to include (YYYY-MM-DD)')
+        parser.add_argument('--to', dest='date_to', help='Last date to include (YYYY-MM-DD)')
+        parser.add_argument('--output', '-o', help='File to write; defaults to standard output')
+
+    def handle(self, *args, **options):
+        try:
+            names, rows = export_rows(
+                options['kind'],
+                status=options['status'],
+                date_from=parse_date(options['date_from']),
+                date_to=parse_date(options['date_to']),
+            )
+        except ValueError as e:
+            raise CommandError(e)
+
+        out = open(options['output'], 'w', newline='', encoding='utf-8') if options['output'] else sys.stdout
+        try:
+            for line in encode(names, rows, options['format']):
+                out.write(line)
+        finally:
+            if out is not sys.stdout:
+                out.close()
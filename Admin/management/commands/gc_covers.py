@@ -0,0 +1,60 @@
+import posixpath
+import time
+
+from django.core.management.base import BaseCommand
+
+from Admin.covers import DERIVATIVES, FORMATS, derivative_name
+from Admin.models import Book
+from Admin.storage import COVERS_DIR, cover_storage
+
+
+class Command(BaseCommand):
+    help = 'Delete cover blobs (and their derivatives) that no book refers to any more'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='List what would be deleted')
+        parser.add_argument(
+            '--min-age', type=float, default=1.0,
+            help='Keep blobs younger than this many hours (uploads whose book is not saved yet)',
+        )
+
+    def handle(self, *args, **options):
+        storage = cover_storage()
+        referenced = set(
+            Book.objects.exclude(image='').exclude(image__isnull=True)
+            .values_list('image', flat=True).distinct().iterator()
+        )
+        cutoff = time.time() - options['min_age'] * 3600
+
+        orphans, kept = [], []
+        for blob in self.blobs(storage):
+            if blob in referenced or storage.get_modified_time(blob).timestamp() > cutoff:
+                kept.append(blob)
+            else:
+                orphans.append(blob)
+
+        # Blobs with the same digest and another extension share derivatives
+        kept_stems = {posixpath.splitext(blob)[0] for blob in kept}
+        for blob in orphans:
+            doomed = [blob]
+            if posixpath.splitext(blob)[0] not in kept_stems:
+                doomed += [derivative_name(blob, kind, ext) for kind in DERIVATIVES for ext in FORMATS]
+            for name in doomed:
+                if options['dry_run']:
+                    if storage.exists(name):
+                        self.stdout.write(f'would delete {name}')
+                else:
+                    storage.delete(name)
+
+        verb = 'Would delete' if options['dry_run'] else 'Deleted'
+        self.stdout.write(self.style.SUCCESS(f'{verb} {len(orphans)} orphaned cover(s); {len(kept)} kept.'))
+
+    def blobs(self, storage):
+        """Every stored cover, as ``covers/<xx>/<digest>.<ext>``."""
+        if not storage.exists(COVERS_DIR):
+            return
+        shards, _files = storage.listdir(COVERS_DIR)
+        for shard in shards:
+            _dirs, files = storage.listdir(posixpath.join(COVERS_DIR, shard))
+            for filename in files:
+                yield posixpath.join(COVERS_DIR, shard, filename)
@@ -0,0 +1,122 @@
+import json
+import time
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from Admin.importer import (
+    FORMATS, ImportResult, InvalidRecord, clean_record, detect_format, read_records, upsert_chunk,
+)
+from Admin.models import Book, books_imported
+
+# Errors printed individually; the rest are only counted
+MAX_ERRORS_SHOWN = 20
+
+
+class Command(BaseCommand):
+    help = (
+        'Import books from a CSV, JSON Lines or MARC 21 file, creating new '
+        'ISBNs and updating existing ones. Progress is checkpointed after '
+        'every chunk, so re-running after a failure resumes where it stopped.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=FORMATS,
+                            help='Defaults to the file extension (.csv, .jsonl, .mrc)')
+        parser.add_argument('--chunk-size', type=int, default=1000)
+        parser.add_argument('--restart', action='store_true',
+                            help='Ignore the checkpoint and start from the first record')
+
+    def handle(self, *args, **options):
+        path = Path(options['path'])
+        if not path.is_file():
+            raise CommandError(f'{path} does not exist.')
+        file_format = options['format'] or detect_format(path)
+        chunk_size = options['chunk_size']
+        checkpoint = Checkpoint(path)
+
+        result = ImportResult()
+        skip = 0 if options['restart'] else checkpoint.load(result)
+        if skip:
+            self.stdout.write(f'Resuming after record {skip}.')
+
+        # The first chunk after a resume may have been written by the
+        # interrupted run without its books_imported signal
+        resumed = bool(skip)
+        chunk = []
+        number = skip
+        started = last_report = time.perf_counter()
+        for number, record in enumerate(read_records(path, file_format), 1):
+            if number <= skip:
+                continue
+            try:
+                chunk.append(clean_record(record))
+            except InvalidRecord as e:
+                result.invalid += 1
+                if result.invalid <= MAX_ERRORS_SHOWN:
+                    self.stderr.write(f'Record {number}: {e}')
+            if number % chunk_size == 0:
+                self.write_chunk(chunk, result, resumed)
+                chunk, resumed = [], False
+                checkpoint.save(number, result)
+                if time.perf_counter() - last_report >= 5:
+                    last_report = time.perf_counter()
+                    self.report(number, skip, result, last_report - started)
+        if chunk:
+            self.write_chunk(chunk, result, resumed)
+        checkpoint.clear()
+
+        if result.invalid > MAX_ERRORS_SHOWN:
+            self.stderr.write(f'... and {result.invalid - MAX_ERRORS_SHOWN} more invalid record(s).')
+        self.report(number, skip, result, time.perf_counter() - started, done=True)
+
+    def write_chunk(self, chunk, result, resumed):
+        """Upsert one chunk and announce its books, so caches never wait for the whole file."""
+        book_ids = upsert_chunk(chunk, result, include_unchanged=resumed)
+        if book_ids:
+            books_imported.send(sender=Book, book_ids=book_ids)
+
+    def report(self, number, skip, result, elapsed, done=False):
+        rate = (number - skip) / elapsed if elapsed else 0
+        line = (
+            f'{number} records read: {result.created} created, {result.updated} updated, '
+            f'{result.invalid} invalid ({rate:.0f} records/s)'
+        )
+        self.stdout.write(self.style.SUCCESS(line) if done else line)
+
+
+class Checkpoint:
+    """Records how far an import of ``path`` got, in ``<path>.import-state``."""
+
+    def __init__(self, path):
+        self.source = path
+        self.path = path.with_name(path.name + '.import-state')
+        stat = path.stat()
+        self.fingerprint = [stat.st_size, stat.st_mtime_ns]
+
+    def load(self, result):
+        """Return the number of records already imported (0 if none or the file changed)."""
+        try:
+            state = json.loads(self.path.read_text())
+        except (OSError, ValueError):
+            return 0
+        if state.get('file') != self.fingerprint:
+            return 0
+        result.created, result.updated, result.invalid = state['created'], state['updated'], state['invalid']
+        return state['records']
+
+    def save(self, records, result):
+        state = {
+            'file': self.fingerprint,
+            'records': records,
+            'created': result.created,
+            'updated': result.updated,
+            'invalid': result.invalid,
+        }
+        tmp = self.path.with_name(self.path.name + '.tmp')
+        tmp.write_text(json.dumps(state))
+        tmp.replace(self.path)
+
+    def clear(self):
+        self.path.unlink(missing_ok=True)
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from Admin.stats import refresh_member_stats
+
+
+class Command(BaseCommand):
+    help = "Recompute every member's issued/returned/total loan counters from the transaction table"
+
+    def handle(self, *args, **options):
+        updated = refresh_member_stats()
+        self.stdout.write(self.style.SUCCESS(f'Loan counters refreshed for {updated} member(s).'))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from Admin.stats import refresh_borrow_counts
+
+
+class Command(BaseCommand):
+    help = "Recompute every book's borrow_count (popularity ranking) from the transaction table"
+
+    def handle(self, *args, **options):
+        updated = refresh_borrow_counts()
+        self.stdout.write(self.style.SUCCESS(f'Borrow counts refreshed for {updated} book(s).'))
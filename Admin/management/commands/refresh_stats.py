@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from Admin.stats import refresh_stats
+
+
+class Command(BaseCommand):
+    help = 'Recompute the dashboard statistics from the source tables'
+
+    def handle(self, *args, **options):
+        stats = refresh_stats()
+        self.stdout.write(self.style.SUCCESS(
+            f'Stats refreshed: {stats.total_books} books, {stats.total_members} members, '
+            f'{stats.total_transactions} transactions, {stats.pending_requests} pending requests.'
+        ))
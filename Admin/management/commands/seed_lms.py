@@ -0,0 +1,36 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from Admin.seed import seed
+
+
+class Command(BaseCommand):
+    help = (
+        'Add synthetic books, members, loans and requests with realistic '
+        'distributions, e.g. to reproduce production scale locally'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--books', type=int, default=10_000)
+        parser.add_argument('--members', type=int, default=1_000)
+        parser.add_argument('--transactions', type=int, default=50_000)
+        parser.add_argument('--requests', type=int, default=2_000)
+        parser.add_argument('--years', type=int, default=3, help='Spread the loan history over this many years')
+        parser.add_argument('--seed', type=int, default=0, help='Random seed; the same seed gives the same data')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        result = seed(
+            books=options['books'],
+            members=options['members'],
+            transactions=options['transactions'],
+            requests=options['requests'],
+            years=options['years'],
+            seed=options['seed'],
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'Seeded {result.books} books, {result.members} members, {result.transactions} transactions '
+            f'({result.open_loans} open) and {result.requests} requests '
+            f'in {time.perf_counter() - started:.1f}s.'
+        ))
@@ -0,0 +1,54 @@
+# Generated by Django 5.2.18 on 2026-10-17 03:55
+
+from django.db import migrations, models
+from django.db.models import Count, Q
+
+
+def seed_stats(apps, schema_editor):
+    Book = apps.get_model('Admin', 'Book')
+    Member = apps.get_model('Admin', 'Member')
+    Transaction = apps.get_model('Admin', 'Transaction')
+    BookRequest = apps.get_model('Admin', 'BookRequest')
+    LibraryStats = apps.get_model('Admin', 'LibraryStats')
+
+    LibraryStats.objects.create(
+        pk=1,
+        total_members=Member.objects.count(),
+        pending_requests=BookRequest.objects.filter(status='Pending').count(),
+        **Book.objects.aggregate(
+            total_books=Count('id'),
+            low_stock_books=Count('id', filter=Q(available_copies__lt=5)),
+        ),
+        **Transaction.objects.aggregate(
+            total_transactions=Count('id'),
+            issued_books=Count('id', filter=Q(status='Issued')),
+            returned_books=Count('id', filter=Q(status='Returned')),
+        ),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Admin', '0008_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LibraryStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('total_books', models.IntegerField(default=0)),
+                ('total_members', models.IntegerField(default=0)),
+                ('issued_books', models.IntegerField(default=0)),
+                ('returned_books', models.IntegerField(default=0)),
+                ('total_transactions', models.IntegerField(default=0)),
+                ('pending_requests', models.IntegerField(default=0)),
+                ('low_stock_books', models.IntegerField(default=0)),
+            ],
+            options={
+                'verbose_name_plural': 'library stats',
+            },
+        ),
+        migrations.RunPython(seed_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,75 @@
+# Generated by Django 5.2.18 on 2026-10-17 03:57
+
+import datetime
+import logging
+
+from django.db import migrations, models
+from django.db.models import Count, F, Min, Q
+
+logger = logging.getLogger(__name__)
+
+
+def close_duplicate_open_loans(apps, schema_editor):
+    """
+    The old issue_book could open a second loan of a book the member already
+    held, which unique_open_loan rejects. Keep the first open loan of each
+    pair, close the others as returned today and put their copies back.
+    """
+    Book = apps.get_model('Admin', 'Book')
+    Transaction = apps.get_model('Admin', 'Transaction')
+    LibraryStats = apps.get_model('Admin', 'LibraryStats')
+
+    open_loans = Transaction.objects.filter(status='Issued')
+    duplicated = open_loans.values('member', 'book').annotate(loans=Count('id'), first=Min('id')).filter(loans__gt=1)
+    closed = []
+    for pair in duplicated:
+        extra = open_loans.filter(member=pair['member'], book=pair['book']).exclude(pk=pair['first'])
+        ids = list(extra.values_list('id', flat=True))
+        extra.update(status='Returned', return_date=datetime.date.today())
+        Book.objects.filter(pk=pair['book']).update(available_copies=F('available_copies') + len(ids))
+        closed.extend(ids)
+    if not closed:
+        return
+
+    LibraryStats.objects.filter(pk=1).update(
+        low_stock_books=Book.objects.filter(available_copies__lt=5).count(),
+        **Transaction.objects.aggregate(
+            issued_books=Count('id', filter=Q(status='Issued')),
+            returned_books=Count('id', filter=Q(status='Returned')),
+        ),
+    )
+    logger.warning(
+        'Closed %d duplicate open loan(s) as returned so unique_open_loan can be added: transaction ids %s',
+        len(closed), ', '.join(map(str, sorted(closed))),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Admin', '0009_librarystats'),
+    ]
+
+    operations = [
+        migrations.RunPython(close_duplicate_open_loans, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(condition=models.Q(('available_copies__gt', 0)), fields=['category'], name='book_available_category_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='bookrequest',
+            index=models.Index(fields=['status', 'request_date', 'id'], name='bookrequest_status_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='bookrequest',
+            index=models.Index(condition=models.Q(('status', 'Pending')), fields=['member', 'book', 'request_date'], name='bookrequest_pending_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['status', 'issue_date', 'id'], name='transaction_status_date_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='transaction',
+            constraint=models.UniqueConstraint(condition=models.Q(('status', 'Issued')), fields=('member', 'book'), name='unique_open_loan'),
+        ),
+    ]
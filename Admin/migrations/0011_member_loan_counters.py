@@ -0,0 +1,47 @@
+# Generated by Django 5.2.18 on 2026-10-17 03:59
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def populate_loan_counters(apps, schema_editor):
+    Member = apps.get_model('Admin', 'Member')
+    Transaction = apps.get_model('Admin', 'Transaction')
+
+    def count_loans(**filters):
+        loans = Transaction.objects.filter(member=OuterRef('pk'), **filters).order_by()
+        counted = loans.values('member').annotate(n=Count('id')).values('n')
+        return Coalesce(Subquery(counted, output_field=IntegerField()), Value(0))
+
+    Member.objects.update(
+        issued_count=count_loans(status='Issued'),
+        returned_count=count_loans(status='Returned'),
+        total_loans=count_loans(),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Admin', '0010_lookup_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='member',
+            name='issued_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='member',
+            name='returned_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='member',
+            name='total_loans',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(populate_loan_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 5.2.18 on 2026-10-17 04:00
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+from Admin.search import install_search_triggers
+
+
+def populate_borrow_counts(apps, schema_editor):
+    Book = apps.get_model('Admin', 'Book')
+    Transaction = apps.get_model('Admin', 'Transaction')
+
+    loans = Transaction.objects.filter(book=OuterRef('pk')).order_by()
+    counted = loans.values('book').annotate(n=Count('id')).values('n')
+    Book.objects.update(
+        borrow_count=Coalesce(Subquery(counted, output_field=IntegerField()), Value(0))
+    )
+
+
+def reinstall_search_triggers(apps, schema_editor):
+    # Adding the column rebuilt Admin_book on SQLite, dropping its triggers
+    install_search_triggers(schema_editor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Admin', '0011_member_loan_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='borrow_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['-borrow_count', '-available_copies'], name='book_popularity_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['category', '-borrow_count', '-available_copies'], name='book_category_popularity_idx'),
+        ),
+        migrations.RunPython(reinstall_search_triggers, migrations.RunPython.noop),
+        migrations.RunPython(populate_borrow_counts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 04:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Admin', '0012_book_borrow_count'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='librarystats',
+            name='catalog_version',
+            field=models.BigIntegerField(default=0),
+        ),
+    ]
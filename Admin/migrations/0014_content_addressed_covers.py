@@ -0,0 +1,26 @@
+# Generated by Django 5.2.18 on 2026-10-17 04:15
+
+import Admin.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Admin', '0013_librarystats_catalog_version'),
+    ]
+
+    operations = [
+        # storage/upload_to don't touch the column; applying this as a real
+        # AlterField would rebuild Admin_book on SQLite (and drop the FTS
+        # triggers) for nothing.
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AlterField(
+                    model_name='book',
+                    name='image',
+                    field=models.ImageField(blank=True, null=True, storage=Admin.storage.cover_storage, upload_to='covers/'),
+                ),
+            ],
+        ),
+    ]
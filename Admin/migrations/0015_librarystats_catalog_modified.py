@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 04:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Admin', '0014_content_addressed_covers'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='librarystats',
+            name='catalog_modified',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
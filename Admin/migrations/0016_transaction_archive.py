@@ -0,0 +1,42 @@
+# Generated by Django 5.2.18 on 2026-10-17 04:24
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+from Admin.archive import LOAN_HISTORY_SQL, LOAN_HISTORY_VIEW
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Admin', '0015_librarystats_catalog_modified'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LoanHistory',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('issue_date', models.DateField()),
+                ('return_date', models.DateField(blank=True, null=True)),
+                ('status', models.CharField(choices=[('Issued', 'Issued'), ('Returned', 'Returned')], max_length=20)),
+                ('archived', models.BooleanField()),
+            ],
+            options={
+                'db_table': 'Admin_loanhistory',
+                'managed': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='ArchivedTransaction',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('issue_date', models.DateField()),
+                ('return_date', models.DateField(blank=True, null=True)),
+                ('book', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='Admin.book')),
+                ('book_request', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='Admin.bookrequest')),
+                ('member', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='Admin.member')),
+            ],
+        ),
+        migrations.RunSQL(LOAN_HISTORY_SQL, f'DROP VIEW IF EXISTS "{LOAN_HISTORY_VIEW}"'),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-17 04:50
+
+import Admin.models
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Admin', '0016_transaction_archive'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BookSearchEntry',
+            fields=[
+                ('book', models.OneToOneField(db_column='rowid', db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, primary_key=True, related_name='search_entry', serialize=False, to='Admin.book')),
+                ('document', Admin.models.SearchDocumentField(db_column='Admin_book_fts')),
+                ('rank', models.FloatField()),
+            ],
+            options={
+                'db_table': 'Admin_book_fts',
+                'managed': False,
+            },
+        ),
+    ]
@@ -1,8 +1,27 @@
-from django.db import models
+from django.db import connection, models
+from django.db.models import F, Q
 from django.utils import timezone
 from django.contrib.auth.models import User
+from django.dispatch import Signal
+
+from Admin.db import writer
+from Admin.storage import COVERS_DIR, cover_storage
+
+
+class BookUnavailable(Exception):
+    """Raised when a book has no copies left to issue."""
+
+
+class ConcurrentUpdate(Exception):
+    """Raised when rows a bulk operation selected were changed by someone else meanwhile."""
+
+
+# Sent by import_books with the ``book_ids`` it created or updated
+books_imported = Signal()
 
 class Member(models.Model):
+    LOAN_COUNTER_FIELDS = ('issued_count', 'returned_count', 'total_loans')
+
     user = models.OneToOneField(User, on_delete=models.CASCADE, null=True, blank=True)
     full_name = models.CharField(max_length=200)
     email = models.EmailField(unique=True)
@@ -10,8 +29,38 @@ class Member(models.Model):
     address = models.CharField(max_length=255, blank=True)
     date_joined = models.DateField(default=timezone.now)
 
+    # Loan counters, maintained by the issue/return paths (see
+    # Admin.signals and Admin.circulation); rebuilt by refresh_member_stats
+    issued_count = models.IntegerField(default=0)
+    returned_count = models.IntegerField(default=0)
+    total_loans = models.IntegerField(default=0)
+
     def __str__(self):
         return self.full_name
+
+    def save(self, *args, **kwargs):
+        # Profile edits must not write back stale loan counters
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.LOAN_COUNTER_FIELDS
+            ]
+        super().save(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        # Django's collector would load the member's loans and requests and
+        # delete them 100 at a time, since those models have delete signals
+        from Admin.signals import delete_dependents  # Admin.signals imports this module
+        with writer():
+            delete_dependents(self)
+            return super().delete(*args, **kwargs)
+
+    @classmethod
+    def bump_loan_counts(cls, member_id, **deltas):
+        """Atomically add ``deltas`` to one member's loan counters."""
+        changes = {field: F(field) + delta for field, delta in deltas.items() if delta}
+        if changes:
+            cls.objects.filter(pk=member_id).update(**changes)
     
 # Create your models here.
 class Book(models.Model):
@@ -42,10 +91,100 @@ class Book(models.Model):
     category = models.CharField(max_length=50, choices=CATEGORY_CHOICES, default='Other')
     description = models.TextField(blank=True, null=True, help_text="Brief description of the book")
     
-    image = models.ImageField(upload_to='book_images/', blank=True, null=True)
+    # Content-addressed: identical uploads share one file (see Admin/storage.py)
+    image = models.ImageField(upload_to=f'{COVERS_DIR}/', storage=cover_storage, blank=True, null=True)
+
+    # Number of times the book has been issued, maintained by the issue paths
+    borrow_count = models.IntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['title', 'id'], name='book_title_id_idx'),
+            # Popularity rankings: overall and per category top-k reads
+            models.Index(fields=['-borrow_count', '-available_copies'], name='book_popularity_idx'),
+            models.Index(
+                fields=['category', '-borrow_count', '-available_copies'],
+                name='book_category_popularity_idx',
+            ),
+            # Book.objects.filter(category=..., available_copies__gt=0)
+            models.Index(
+                fields=['category'],
+                condition=Q(available_copies__gt=0),
+                name='book_available_category_idx',
+            ),
+        ]
 
     def __str__(self):
         return self.title
+
+    def delete(self, *args, **kwargs):
+        # Django's collector would load the book's loans and requests and
+        # delete them 100 at a time, since those models have delete signals
+        from Admin.signals import delete_dependents  # Admin.signals imports this module
+        with writer():
+            delete_dependents(self)
+            return super().delete(*args, **kwargs)
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        # Remember the stored stock so signal handlers can see what changed
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_copies = instance.__dict__.get('available_copies')
+        instance._loaded_image = str(instance.__dict__.get('image') or '')
+        return instance
+
+    def take_copy(self):
+        """
+        Atomically remove one copy from stock and count the borrow.
+
+        The decrement is a single conditional UPDATE, so concurrent issues can
+        never drive the stock below zero. Raises BookUnavailable when no copy
+        is left.
+
+        Returns the change in ``LibraryStats.low_stock_books`` (0 or 1) for
+        the caller to fold into its own ``bump``.
+        """
+        row = self._update_stock(
+            'available_copies = available_copies - 1, borrow_count = borrow_count + 1',
+            'AND available_copies > 0',
+        )
+        if row is None:
+            raise BookUnavailable(f'No copies of "{self.title}" are available.')
+        return self._copies_changed(row, -1)
+
+    def return_copy(self):
+        """
+        Atomically put one copy back into stock.
+
+        Returns the change in ``LibraryStats.low_stock_books`` (0 or -1).
+        """
+        row = self._update_stock('available_copies = available_copies + 1')
+        if row is None:
+            return 0
+        return self._copies_changed(row, 1)
+
+    def _update_stock(self, assignments, condition=''):
+        # UPDATE ... RETURNING hands back the new stock in the same statement,
+        # so the caller knows whether the book crossed the threshold without
+        # re-reading the row
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'UPDATE {connection.ops.quote_name(self._meta.db_table)} SET {assignments} '
+                f'WHERE id = %s {condition} RETURNING available_copies, borrow_count',
+                [self.pk],
+            )
+            return cursor.fetchone()
+
+    def _copies_changed(self, row, delta):
+        # The UPDATE bypassed save() and signals
+        self.available_copies, self.borrow_count = row
+        self._loaded_copies = self.available_copies
+        threshold = LibraryStats.LOW_STOCK_THRESHOLD
+        if delta < 0 and self.available_copies == threshold - 1:
+            return 1
+        if delta > 0 and self.available_copies == threshold:
+            return -1
+        return 0
     
     
 
@@ -66,11 +205,51 @@ class BookRequest(models.Model):
 
     class Meta:
         ordering = ['-request_date']
+        indexes = [
+            models.Index(fields=['request_date', 'id'], name='bookrequest_date_id_idx'),
+            # Requests by status, newest first (dashboard, request queue)
+            models.Index(fields=['status', 'request_date', 'id'], name='bookrequest_status_date_idx'),
+            # Open request lookup for a member/book pair
+            models.Index(
+                fields=['member', 'book', 'request_date'],
+                condition=Q(status='Pending'),
+                name='bookrequest_pending_idx',
+            ),
+        ]
 
     def __str__(self):
         return f"{self.member.full_name} - {self.book.title} ({self.status})"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_status = instance.__dict__.get('status')
+        return instance
+
+    def resolve(self, status, admin_notes=None):
+        """
+        Move a pending request to ``status`` ('Approved' or 'Rejected').
+
+        Uses a conditional UPDATE so only one caller can resolve a request.
+        Returns False if the request was no longer pending.
+        """
+        changes = {'status': status}
+        if admin_notes is not None:
+            changes['admin_notes'] = admin_notes
+        with writer():
+            updated = BookRequest.objects.filter(pk=self.pk, status='Pending').update(**changes)
+            if not updated:
+                return False
+            LibraryStats.bump(pending_requests=-1)
+        self.status = status
+        self._loaded_status = status
+        if admin_notes is not None:
+            self.admin_notes = admin_notes
+        return True
+
 
+# The Admin_loanhistory view (LoanHistory) reads this table: a migration that
+# remakes it must drop the view first and reinstall it after (Admin/archive.py)
 class Transaction(models.Model):
     STATUS_CHOICES = (
         ('Issued', 'Issued'),
@@ -86,21 +265,188 @@ class Transaction(models.Model):
 
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='Issued')
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['issue_date', 'id'], name='transaction_date_id_idx'),
+            # Loans by status, newest first (transactions page filter)
+            models.Index(fields=['status', 'issue_date', 'id'], name='transaction_status_date_idx'),
+        ]
+        constraints = [
+            # A member can hold at most one open loan of a book; also serves
+            # the Transaction(member, book, status='Issued') lookups
+            models.UniqueConstraint(
+                fields=['member', 'book'],
+                condition=Q(status='Issued'),
+                name='unique_open_loan',
+            ),
+        ]
+
     def __str__(self):
         return f"{self.member.full_name} - {self.book.title}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_status = instance.__dict__.get('status')
+        return instance
+
     # Auto-update counts on save
     def save(self, *args, **kwargs):
         if not self.id:  # New transaction → Issue book
-            self.book.available_copies -= 1
-            self.book.save()
+            with writer():
+                # Counted by transaction_saved along with the loan itself
+                self._low_stock_delta = self.book.take_copy()
+                super().save(*args, **kwargs)
+            return
         super().save(*args, **kwargs)
 
     def mark_returned(self):
-        """Call this when returning a book."""
-        if self.status == 'Issued':
-            self.status = 'Returned'
-            self.return_date = timezone.now().date()
-            self.book.available_copies += 1
-            self.book.save()
-            self.save()
+        """
+        Call this when returning a book.
+
+        Returns False if the loan had already been returned (possibly by a
+        concurrent request).
+        """
+        return_date = timezone.now().date()
+        with writer():
+            updated = Transaction.objects.filter(pk=self.pk, status='Issued').update(
+                status='Returned', return_date=return_date
+            )
+            if not updated:
+                return False
+            LibraryStats.bump(
+                issued_books=-1,
+                returned_books=1,
+                low_stock_books=self.book.return_copy(),
+                catalog_version=1,
+            )
+            Member.bump_loan_counts(self.member_id, issued_count=-1, returned_count=1)
+        self.status = 'Returned'
+        self.return_date = return_date
+        self._loaded_status = 'Returned'
+        return True
+
+
+class ArchivedTransaction(models.Model):
+    """
+    A returned loan moved out of Transaction by ``manage.py archive_transactions``.
+
+    Keeps the id it had as a Transaction (ids are never reused), so the two
+    tables can be read together through LoanHistory. Archived loans still
+    count in LibraryStats, member counters and borrow counts; the member/book
+    delete handlers in Admin.signals take them off when they cascade.
+    """
+    id = models.BigIntegerField(primary_key=True)
+    member = models.ForeignKey(Member, on_delete=models.CASCADE)
+    book = models.ForeignKey(Book, on_delete=models.CASCADE)
+    book_request = models.OneToOneField(BookRequest, on_delete=models.SET_NULL, null=True, blank=True)
+
+    issue_date = models.DateField()
+    return_date = models.DateField(blank=True, null=True)
+
+    def __str__(self):
+        return f"{self.member.full_name} - {self.book.title}"
+
+
+class LoanHistory(models.Model):
+    """
+    Every loan, live or archived: a read-only database view over Transaction
+    and ArchivedTransaction (see migration 0016). Use it for history and
+    popularity; issuing and returning work on Transaction.
+
+    SQLite will not rename a table a view refers to, and Django remakes a
+    table (copy, drop, rename) for most SQLite ALTERs. A migration that
+    changes Transaction or ArchivedTransaction must therefore call
+    ``Admin.archive.drop_loan_history_view`` first and
+    ``install_loan_history_view`` after, or it fails.
+    """
+    STATUS_CHOICES = Transaction.STATUS_CHOICES
+
+    member = models.ForeignKey(Member, on_delete=models.DO_NOTHING, db_constraint=False, related_name='+')
+    book = models.ForeignKey(Book, on_delete=models.DO_NOTHING, db_constraint=False, related_name='+')
+
+    issue_date = models.DateField()
+    return_date = models.DateField(blank=True, null=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES)
+    archived = models.BooleanField()
+
+    class Meta:
+        managed = False
+        db_table = 'Admin_loanhistory'
+
+    def __str__(self):
+        return f"{self.member.full_name} - {self.book.title}"
+
+
+class SearchDocumentField(models.TextField):
+    """The hidden column of an FTS5 table named like the table; supports ``__match``."""
+
+
+@SearchDocumentField.register_lookup
+class Match(models.Lookup):
+    lookup_name = 'match'
+
+    def as_sql(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        rhs, rhs_params = self.process_rhs(compiler, connection)
+        return f'{lhs} MATCH {rhs}', lhs_params + rhs_params
+
+
+class BookSearchEntry(models.Model):
+    """
+    A book's row in the ``Admin_book_fts`` FTS5 index (SQLite only; created
+    in migration 0007 and kept in sync by triggers, see Admin/search.py).
+    Read-only: lets searches join the index by rowid through the ORM.
+    """
+    book = models.OneToOneField(
+        Book, on_delete=models.DO_NOTHING, primary_key=True, db_column='rowid',
+        db_constraint=False, related_name='search_entry',
+    )
+    document = SearchDocumentField(db_column='Admin_book_fts')
+    # BM25 score of the current MATCH; lower is better
+    rank = models.FloatField()
+
+    class Meta:
+        managed = False
+        db_table = 'Admin_book_fts'
+
+
+class LibraryStats(models.Model):
+    """Single-row table of dashboard counters, kept current by Admin.signals"""
+    LOW_STOCK_THRESHOLD = 5
+
+    total_books = models.IntegerField(default=0)
+    total_members = models.IntegerField(default=0)
+    issued_books = models.IntegerField(default=0)
+    returned_books = models.IntegerField(default=0)
+    total_transactions = models.IntegerField(default=0)
+    pending_requests = models.IntegerField(default=0)
+    low_stock_books = models.IntegerField(default=0)
+    # Bumped on every Book/Transaction write; caches of catalog answers key on it
+    catalog_version = models.BigIntegerField(default=0)
+    # When catalog_version last moved, for Last-Modified headers
+    catalog_modified = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name_plural = 'library stats'
+
+    def __str__(self):
+        return 'Library statistics'
+
+    @classmethod
+    def bump(cls, **deltas):
+        """Atomically add ``deltas`` to the counters, e.g. bump(issued_books=1)."""
+        changes = {field: F(field) + delta for field, delta in deltas.items() if delta}
+        if 'catalog_version' in changes:
+            changes['catalog_modified'] = timezone.now()
+        if changes:
+            cls.objects.filter(pk=1).update(**changes)
+
+    @classmethod
+    def current_catalog_version(cls):
+        return cls.objects.filter(pk=1).values_list('catalog_version', flat=True).first() or 0
+
+    @classmethod
+    def catalog_state(cls):
+        """Return ``(catalog_version, catalog_modified)`` in one query."""
+        return cls.objects.filter(pk=1).values_list('catalog_version', 'catalog_modified').first() or (0, None)
@@ -0,0 +1,179 @@
+"""
+Keyset (cursor) pagination shared by the Admin and User list pages.
+
+Pages are selected with a WHERE clause on the ordering key instead of an
+OFFSET, so fetching page 1000 costs the same as fetching page 1 and only
+``per_page + 1`` rows are ever read from the database.
+"""
+import base64
+import json
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db.models import Q
+
+PAGE_SIZE = 25
+CURSOR_PARAM = 'cursor'
+
+
+class CursorPage:
+    """One page of results plus the cursors needed to move around."""
+
+    def __init__(self, object_list, request, cursor_param, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+        self._request = request
+        self._cursor_param = cursor_param
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __bool__(self):
+        return bool(self.object_list)
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    @property
+    def has_other_pages(self):
+        return self.has_next or self.has_previous
+
+    @property
+    def next_query(self):
+        """Query string for the next page (keeps search/filter params)."""
+        return self._query_with(self.next_cursor)
+
+    @property
+    def previous_query(self):
+        """Query string for the previous page (keeps search/filter params)."""
+        return self._query_with(self.previous_cursor)
+
+    def _query_with(self, cursor):
+        params = self._request.GET.copy()
+        params[self._cursor_param] = cursor
+        return params.urlencode()
+
+
+def paginate(request, queryset, ordering, per_page=PAGE_SIZE, cursor_param=CURSOR_PARAM):
+    """
+    Return one keyset-paginated page of ``queryset``.
+
+    Args:
+        request: Current request; the cursor is read from ``request.GET``
+        queryset: Queryset to paginate
+        ordering: Ordering key such as ``('-issue_date', '-id')``. The last
+            field must be unique (normally ``id``) so the key is a total order.
+        per_page: Maximum number of rows on a page
+        cursor_param: Name of the GET parameter carrying the cursor
+
+    Returns:
+        CursorPage
+    """
+    ordering = tuple(ordering)
+    direction, values = _decode_cursor(request.GET.get(cursor_param), queryset, ordering)
+    backwards = direction == 'p'
+
+    page_ordering = _reverse_ordering(ordering) if backwards else ordering
+    page_qs = queryset.order_by(*page_ordering)
+    if values is not None:
+        page_qs = page_qs.filter(_keyset_filter(page_ordering, values))
+
+    rows = list(page_qs[:per_page + 1])
+    has_more = len(rows) > per_page
+    rows = rows[:per_page]
+    if backwards:
+        rows.reverse()
+
+    # Walking backwards we came from a later page; walking forwards from a
+    # cursor we came from an earlier one.
+    has_next = True if backwards else has_more
+    has_previous = has_more if backwards else values is not None
+
+    next_cursor = previous_cursor = None
+    if rows and has_next:
+        next_cursor = _encode_cursor('n', _key_values(rows[-1], ordering))
+    if rows and has_previous:
+        previous_cursor = _encode_cursor('p', _key_values(rows[0], ordering))
+
+    return CursorPage(rows, request, cursor_param, next_cursor, previous_cursor)
+
+
+def _field_name(field):
+    return field.lstrip('-')
+
+
+def _reverse_ordering(ordering):
+    return tuple(f[1:] if f.startswith('-') else f'-{f}' for f in ordering)
+
+
+def _keyset_filter(ordering, values):
+    """
+    Build ``key > values`` for a (possibly mixed-direction) ordering.
+
+    The result has the shape ``a >= x AND (a > x OR (a = x AND ...))`` so the
+    leading column can drive an index range scan.
+    """
+    def strictly_after(index):
+        field = ordering[index]
+        name = _field_name(field)
+        op = 'lt' if field.startswith('-') else 'gt'
+        condition = Q(**{f'{name}__{op}': values[index]})
+        if index + 1 < len(ordering):
+            condition |= Q(**{name: values[index]}) & strictly_after(index + 1)
+        return condition
+
+    first = ordering[0]
+    op = 'lte' if first.startswith('-') else 'gte'
+    return Q(**{f'{_field_name(first)}__{op}': values[0]}) & strictly_after(0)
+
+
+def _key_values(obj, ordering):
+    return [getattr(obj, _field_name(field)) for field in ordering]
+
+
+def _encode_cursor(direction, values):
+    payload = json.dumps([direction, [_serialize(v) for v in values]], separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def _serialize(value):
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return value
+
+
+def _decode_cursor(cursor, queryset, ordering):
+    """Return ``(direction, values)``; a missing or bad cursor means page one."""
+    if not cursor:
+        return 'n', None
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        direction, raw_values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        if direction not in ('n', 'p') or len(raw_values) != len(ordering):
+            return 'n', None
+        values = [
+            _to_python(queryset.model, _field_name(field), value)
+            for field, value in zip(ordering, raw_values)
+        ]
+    except (ValueError, TypeError, ValidationError):
+        return 'n', None
+    return direction, values
+
+
+def _to_python(model, name, value):
+    try:
+        field = model._meta.get_field(name)
+    except FieldDoesNotExist:
+        # Annotation such as search_rank; JSON already restored the type.
+        return value
+    if value is None:
+        return None
+    return field.to_python(value)
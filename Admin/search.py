@@ -0,0 +1,163 @@
+"""
+Full-text search for the book catalog.
+
+On SQLite the catalog is indexed by the ``Admin_book_fts`` FTS5 table (created
+in migration 0007 and kept in sync with ``Admin_book`` by triggers), which the
+ORM reaches through the ``BookSearchEntry`` model. Other database backends
+fall back to ``icontains`` filtering.
+
+FTS5 matches whole words and word prefixes, so a query made only of digits
+(usually part of an ISBN) also matches ISBNs containing it anywhere.
+"""
+import re
+
+from django.db import connection
+from django.db.models import F, FloatField, Q, Value
+
+from Admin.models import Book, BookSearchEntry
+
+FTS_TABLE = 'Admin_book_fts'
+FTS_COLUMNS = ('title', 'author', 'isbn', 'category', 'description')
+
+# (name, SQL) pairs; the triggers are dropped whenever SQLite remakes
+# Admin_book, so migrations that alter the table re-run these.
+FTS_TRIGGERS = (
+    (
+        'Admin_book_fts_ai',
+        f"""
+        CREATE TRIGGER IF NOT EXISTS Admin_book_fts_ai AFTER INSERT ON Admin_book BEGIN
+            INSERT INTO {FTS_TABLE}(rowid, title, author, isbn, category, description)
+            VALUES (new.id, new.title, new.author, new.isbn, new.category, new.description);
+        END
+        """,
+    ),
+    (
+        'Admin_book_fts_ad',
+        f"""
+        CREATE TRIGGER IF NOT EXISTS Admin_book_fts_ad AFTER DELETE ON Admin_book BEGIN
+            INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, author, isbn, category, description)
+            VALUES ('delete', old.id, old.title, old.author, old.isbn, old.category, old.description);
+        END
+        """,
+    ),
+    (
+        'Admin_book_fts_au',
+        f"""
+        CREATE TRIGGER IF NOT EXISTS Admin_book_fts_au
+        AFTER UPDATE OF title, author, isbn, category, description ON Admin_book BEGIN
+            INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, author, isbn, category, description)
+            VALUES ('delete', old.id, old.title, old.author, old.isbn, old.category, old.description);
+            INSERT INTO {FTS_TABLE}(rowid, title, author, isbn, category, description)
+            VALUES (new.id, new.title, new.author, new.isbn, new.category, new.description);
+        END
+        """,
+    ),
+)
+
+_TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+# Digit-only queries at least this long also match ISBN substrings
+_ISBN_FRAGMENT_RE = re.compile(r'\d{3,13}')
+
+
+def fts_enabled():
+    """Return True when the current database serves searches from FTS5."""
+    return connection.vendor == 'sqlite'
+
+
+def install_search_triggers(schema_editor):
+    """(Re)create the FTS sync triggers. Safe to call more than once."""
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for _name, sql in FTS_TRIGGERS:
+        schema_editor.execute(sql)
+
+
+def rebuild_search_index():
+    """Repopulate the FTS index from the Admin_book table."""
+    if not fts_enabled():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+
+
+def search_ordering():
+    """Keyset ordering matching the order ``search_books`` returns rows in."""
+    return ('search_rank', 'id') if fts_enabled() else ('title', 'id')
+
+
+def build_match_expression(query, match_any=False):
+    """
+    Turn free text typed by a user into a safe FTS5 MATCH expression.
+
+    Every word becomes a quoted prefix term, so punctuation and FTS5 operators
+    in the input can never produce a syntax error.
+
+    Args:
+        query: Raw search text
+        match_any: OR the terms together instead of requiring all of them
+
+    Returns:
+        The MATCH expression, or an empty string if the query has no words
+    """
+    tokens = _TOKEN_RE.findall(query.lower())
+    joiner = ' OR ' if match_any else ' '
+    return joiner.join(f'"{token}"*' for token in tokens)
+
+
+def search_books(query, queryset=None, match_any=False):
+    """
+    Search the catalog for ``query``.
+
+    Args:
+        query: Raw search text
+        queryset: Optional Book queryset to narrow (defaults to all books)
+        match_any: Match books containing any word instead of every word
+
+    Returns:
+        Book queryset ordered by relevance (best match first). Each book
+        carries a ``search_rank`` annotation when FTS5 is in use.
+    """
+    if queryset is None:
+        queryset = Book.objects.all()
+
+    expression = build_match_expression(query, match_any=match_any)
+    if not expression:
+        return queryset.none()
+
+    if not fts_enabled():
+        return _search_books_fallback(queryset, query, match_any)
+
+    isbn_fragment = query.replace('-', '').replace(' ', '')
+    if _ISBN_FRAGMENT_RE.fullmatch(isbn_fragment):
+        # MATCH cannot sit under an OR with another table's column, so the
+        # index is read as an id subquery here. BM25 says little about a
+        # number anyway; these results are listed by id.
+        matched = BookSearchEntry.objects.filter(document__match=expression).values('book_id')
+        return queryset.filter(
+            Q(id__in=matched) | Q(isbn__contains=isbn_fragment)
+        ).annotate(
+            search_rank=Value(0.0, output_field=FloatField()),
+        ).order_by('search_rank', 'id')
+
+    # Join the FTS table rather than ranking with a correlated subquery:
+    # FTS5 re-evaluates the whole MATCH for every row a subquery is run on.
+    return queryset.filter(
+        search_entry__document__match=expression
+    ).annotate(
+        search_rank=F('search_entry__rank'),
+    ).order_by('search_rank', 'id')
+
+
+def _search_books_fallback(queryset, query, match_any):
+    """icontains search used on databases without FTS5."""
+    words = _TOKEN_RE.findall(query) if match_any else [query]
+    book_query = Q()
+    for word in words:
+        book_query |= (
+            Q(title__icontains=word) |
+            Q(author__icontains=word) |
+            Q(isbn__icontains=word) |
+            Q(category__icontains=word)
+        )
+    return queryset.filter(book_query)
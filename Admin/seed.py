@@ -0,0 +1,216 @@
+"""
+Synthetic library data (``manage.py seed_lms``).
+
+Generates books, members, loans and requests with the skew a real library
+has: a few books account for most loans (Zipf), a few members borrow far
+more than the rest (Pareto), recent publications and recent loans are more
+common than old ones, and only loans from the last few weeks are still open.
+The same seed always produces the same data.
+
+Rows are written with ``bulk_create``, which skips ``save()`` and the
+signals, so the stored stock, LibraryStats, member counters and borrow counts
+are rebuilt from the new rows at the end. The search index triggers still
+fire. ``bulk_create`` also stamps the current time on the ``auto_now_add``
+loan and request dates, so the generated dates are written back afterwards.
+"""
+import datetime
+import random
+from collections import defaultdict
+from dataclasses import dataclass
+from itertools import accumulate
+
+from django.db.models import Max
+from django.utils import timezone
+
+from Admin.db import writer
+from Admin.models import Book, BookRequest, Member, Transaction, books_imported
+from Admin.stats import refresh_borrow_counts, refresh_member_stats, refresh_stats
+
+# Share of the catalog per category
+CATEGORY_WEIGHTS = {
+    'Fiction': 18, 'Mystery': 9, 'Romance': 8, 'Fantasy': 7, 'Science Fiction': 7,
+    'Literature': 6, 'Non-Fiction': 6, 'History': 6, 'Biography': 5, 'Science': 5,
+    'Technology': 4, 'Programming': 4, 'Business': 4, 'Education': 4, 'Philosophy': 3,
+    'Other': 4,
+}
+
+FIRST_NAMES = (
+    'Ada', 'Alan', 'Amara', 'Ben', 'Carmen', 'Chen', 'Dara', 'Elena', 'Farah', 'George',
+    'Hana', 'Ivan', 'Jonas', 'Kemi', 'Lena', 'Malik', 'Nora', 'Omar', 'Priya', 'Quinn',
+    'Rosa', 'Sami', 'Tomas', 'Uma', 'Victor', 'Wen', 'Yusuf', 'Zoe',
+)
+LAST_NAMES = (
+    'Abbott', 'Banerjee', 'Castillo', 'Dubois', 'Eriksen', 'Fischer', 'Garcia', 'Hoffman',
+    'Ivanova', 'Jensen', 'Kowalski', 'Larsen', 'Moreau', 'Nakamura', 'Okafor', 'Petrov',
+    'Rossi', 'Schmidt', 'Tanaka', 'Urquhart', 'Varga', 'Walsh', 'Yilmaz', 'Zhang',
+)
+TITLE_WORDS = (
+    'Silent', 'Hidden', 'Last', 'Broken', 'Golden', 'Distant', 'Secret', 'Winter', 'Iron',
+    'Paper', 'River', 'Garden', 'Empire', 'Shadow', 'Machine', 'Ocean', 'Signal', 'Mountain',
+    'Library', 'Theory', 'Night', 'City', 'Memory', 'Fire', 'Light', 'Code', 'Kingdom',
+)
+STREETS = ('Oak St', 'Elm Ave', 'Maple Rd', 'High St', 'Station Rd', 'Park Lane', 'Mill Way')
+
+# Loans issued within this many days may still be open
+OPEN_LOAN_DAYS = 30
+
+# Requests made within this many days may still be pending
+PENDING_REQUEST_DAYS = 14
+
+
+@dataclass
+class SeedResult:
+    books: int = 0
+    members: int = 0
+    transactions: int = 0
+    open_loans: int = 0
+    requests: int = 0
+
+
+def seed(books=10_000, members=1_000, transactions=50_000, requests=2_000, years=3, seed=0):
+    """
+    Add synthetic rows to the database and return the counts written.
+
+    Loans and requests only refer to the books and members created by this
+    call, so seeding works the same on an empty or a populated database.
+    """
+    rng = random.Random(seed)
+    today = timezone.now().date()
+    result = SeedResult()
+
+    with writer():
+        new_books = Book.objects.bulk_create(_books(rng, books, today))
+        new_members = Member.objects.bulk_create(_members(rng, members, today, years))
+        result.books, result.members = len(new_books), len(new_members)
+
+        if new_books and new_members:
+            book_weights = _zipf_weights(rng, len(new_books))
+            member_weights = [rng.paretovariate(1.5) for _member in new_members]
+            loans = _loans(rng, transactions, new_books, new_members, book_weights, member_weights, today, years)
+            pending = _requests(rng, requests, new_books, new_members, book_weights, member_weights)
+            issue_dates = [loan.issue_date for loan in loans]
+            request_dates = [request.request_date for request in pending]
+            Transaction.objects.bulk_create(loans, batch_size=2000)
+            BookRequest.objects.bulk_create(pending, batch_size=2000)
+            _restore_dates(Transaction, loans, 'issue_date', issue_dates)
+            _restore_dates(BookRequest, pending, 'request_date', request_dates)
+            result.transactions = len(loans)
+            result.open_loans = sum(1 for loan in loans if loan.status == 'Issued')
+            result.requests = len(pending)
+
+            # Open loans hold copies: store what is left on the shelf
+            Book.objects.bulk_update(new_books, ['available_copies'], batch_size=2000)
+
+        refresh_stats()
+        refresh_member_stats()
+        refresh_borrow_counts()
+
+    if new_books:
+        books_imported.send(sender=Book, book_ids=[book.pk for book in new_books])
+    return result
+
+
+def _books(rng, count, today):
+    start = (Book.objects.aggregate(last=Max('id'))['last'] or 0) + 1
+    categories = list(CATEGORY_WEIGHTS)
+    cum_weights = list(accumulate(CATEGORY_WEIGHTS.values()))
+    for number in range(start, start + count):
+        words = rng.sample(TITLE_WORDS, rng.choice((1, 2, 2, 3)))
+        title = ' '.join(words) if rng.random() < 0.6 else f'The {words[0]} of the {words[-1]}'
+        # Newer books are more common; a long tail goes back to 1850
+        year = max(1850, today.year - int(rng.expovariate(1 / 12)))
+        yield Book(
+            isbn=_isbn13(f'979{number:09d}'),
+            title=title,
+            author=f'{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}',
+            published_date=datetime.date(year, rng.randint(1, 12), rng.randint(1, 28)),
+            available_copies=rng.choices((1, 2, 3, 4, 5, 8, 10), (30, 25, 15, 10, 10, 6, 4))[0],
+            category=rng.choices(categories, cum_weights=cum_weights)[0],
+            description=' '.join(rng.choices(TITLE_WORDS, k=rng.randint(8, 30))).capitalize() + '.',
+        )
+
+
+def _members(rng, count, today, years):
+    start = (Member.objects.aggregate(last=Max('id'))['last'] or 0) + 1
+    for number in range(start, start + count):
+        first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+        yield Member(
+            full_name=f'{first} {last}',
+            email=f'{first}.{last}.{number}@example.org'.lower(),
+            phone=f'555-{rng.randint(0, 9999):04d}',
+            address=f'{rng.randint(1, 400)} {rng.choice(STREETS)}',
+            date_joined=today - datetime.timedelta(days=rng.randint(0, 365 * years)),
+        )
+
+
+def _zipf_weights(rng, count, exponent=0.9):
+    """Zipf popularity weights, assigned to the books in random order."""
+    ranks = list(range(1, count + 1))
+    rng.shuffle(ranks)
+    return [1 / rank ** exponent for rank in ranks]
+
+
+def _loans(rng, count, books, members, book_weights, member_weights, today, years):
+    chosen_books = rng.choices(books, weights=book_weights, k=count)
+    chosen_members = rng.choices(members, weights=member_weights, k=count)
+    open_pairs = set()
+    loans = []
+    for book, member in zip(chosen_books, chosen_members):
+        # Activity grows over time: later dates are more likely
+        age = min(int(rng.expovariate(1 / (120 * years))), 365 * years)
+        issue_date = max(today - datetime.timedelta(days=age), member.date_joined)
+        return_date = issue_date + datetime.timedelta(days=1 + int(rng.gammavariate(2, 7)))
+        pair = (member.pk, book.pk)
+        if ((today - issue_date).days < OPEN_LOAN_DAYS and rng.random() < 0.6) or return_date > today:
+            if book.available_copies > 0 and pair not in open_pairs:
+                book.available_copies -= 1
+                open_pairs.add(pair)
+                loans.append(Transaction(member=member, book=book, issue_date=issue_date, status='Issued'))
+                continue
+            return_date = min(return_date, today)
+        loans.append(Transaction(
+            member=member, book=book, issue_date=issue_date, return_date=return_date, status='Returned',
+        ))
+    return loans
+
+
+def _requests(rng, count, books, members, book_weights, member_weights):
+    chosen_books = rng.choices(books, weights=book_weights, k=count)
+    chosen_members = rng.choices(members, weights=member_weights, k=count)
+    now = timezone.now()
+    pending_pairs = set()
+    requests = []
+    for book, member in zip(chosen_books, chosen_members):
+        request_date = now - datetime.timedelta(minutes=int(rng.expovariate(1 / (60 * 24 * 30))))
+        status = rng.choices(('Approved', 'Rejected'), (7, 3))[0]
+        pair = (member.pk, book.pk)
+        if (now - request_date).days < PENDING_REQUEST_DAYS and pair not in pending_pairs:
+            status = 'Pending'
+            pending_pairs.add(pair)
+        requests.append(BookRequest(
+            member=member,
+            book=book,
+            request_date=request_date,
+            status=status,
+            admin_notes='Not available' if status == 'Rejected' else None,
+        ))
+    return requests
+
+
+def _isbn13(first12):
+    total = sum(int(digit) * (3 if i % 2 else 1) for i, digit in enumerate(first12))
+    return first12 + str((10 - total % 10) % 10)
+
+
+def _restore_dates(model, rows, field_name, values, batch_size=2000):
+    """
+    Store ``values`` in the ``auto_now_add`` field ``field_name`` of the
+    inserted ``rows``: one UPDATE per distinct value (and batch of ids).
+    """
+    ids_by_value = defaultdict(list)
+    for row, value in zip(rows, values):
+        setattr(row, field_name, value)
+        ids_by_value[value].append(row.pk)
+    for value, ids in ids_by_value.items():
+        for start in range(0, len(ids), batch_size):
+            model.objects.filter(pk__in=ids[start:start + batch_size]).update(**{field_name: value})
@@ -0,0 +1,214 @@
+"""
+Signal handlers that keep ``LibraryStats`` in step with the data.
+
+Each handler turns one row change into counter deltas. ``from_db`` on the
+models records the stored ``status`` / ``available_copies`` / ``image`` so
+updates can tell what actually changed. A new cover image also queues its
+derivatives (Admin/covers.py).
+
+Deleting a member or book cascades to its loans, live and archived, and its
+requests. Those are counted in bulk by the member/book ``pre_delete``
+handlers, a fixed number of queries however many rows go, and the per-row
+delete handlers skip rows removed by such a cascade. ``Member.delete()`` and
+``Book.delete()`` go further and also delete those rows in bulk
+(``delete_dependents``), so Django's collector finds none left to load.
+"""
+from django.db.models import Count, F, IntegerField, OuterRef, QuerySet, Subquery, Value
+from django.db.models.functions import Coalesce
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from Admin.covers import schedule_derivatives
+from Admin.models import ArchivedTransaction, Book, BookRequest, LibraryStats, LoanHistory, Member, Transaction
+
+TRANSACTION_COUNTERS = {
+    'Issued': 'issued_books',
+    'Returned': 'returned_books',
+}
+
+MEMBER_COUNTERS = {
+    'Issued': 'issued_count',
+    'Returned': 'returned_count',
+}
+
+
+def _is_low_stock(copies):
+    return copies is not None and int(copies) < LibraryStats.LOW_STOCK_THRESHOLD
+
+
+@receiver(post_save, sender=Book)
+def book_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    low_now = _is_low_stock(instance.available_copies)
+    if created:
+        LibraryStats.bump(total_books=1, low_stock_books=int(low_now), catalog_version=1)
+    elif hasattr(instance, '_loaded_copies'):
+        low_before = _is_low_stock(instance._loaded_copies)
+        LibraryStats.bump(low_stock_books=int(low_now) - int(low_before), catalog_version=1)
+    else:
+        LibraryStats.bump(catalog_version=1)
+    instance._loaded_copies = instance.available_copies
+
+    image = instance.image.name or ''
+    if image and image != getattr(instance, '_loaded_image', ''):
+        schedule_derivatives(image)
+    instance._loaded_image = image
+
+
+@receiver(post_delete, sender=Book)
+def book_deleted(sender, instance, **kwargs):
+    LibraryStats.bump(
+        total_books=-1,
+        low_stock_books=-int(_is_low_stock(instance.available_copies)),
+        catalog_version=1,
+    )
+
+
+@receiver(post_save, sender=Member)
+def member_saved(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        LibraryStats.bump(total_members=1)
+
+
+@receiver(post_delete, sender=Member)
+def member_deleted(sender, instance, **kwargs):
+    LibraryStats.bump(total_members=-1)
+
+
+@receiver(pre_delete, sender=Member)
+def member_deleting(sender, instance, **kwargs):
+    if getattr(instance, '_dependents_deleted', False):
+        return
+    loans = LoanHistory.objects.filter(member=instance)
+    _uncount_cascade(loans, BookRequest.objects.filter(member=instance))
+    # The member's counters go with the row; the books keep theirs
+    Book.objects.filter(pk__in=loans.values('book')).update(
+        borrow_count=F('borrow_count') - _count_per(loans, 'book'),
+    )
+
+
+@receiver(pre_delete, sender=Book)
+def book_deleting(sender, instance, **kwargs):
+    if getattr(instance, '_dependents_deleted', False):
+        return
+    loans = LoanHistory.objects.filter(book=instance)
+    _uncount_cascade(loans, BookRequest.objects.filter(book=instance))
+    Member.objects.filter(pk__in=loans.values('member')).update(**{
+        counter: F(counter) - _count_per(loans, 'member', **filters)
+        for counter, filters in (
+            ('total_loans', {}),
+            ('issued_count', {'status': 'Issued'}),
+            ('returned_count', {'status': 'Returned'}),
+        )
+    })
+
+
+@receiver(post_save, sender=Transaction)
+def transaction_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    deltas = {'catalog_version': 1}
+    member_deltas = {}
+    if created:
+        deltas['total_transactions'] = 1
+        member_deltas['total_loans'] = 1
+        _add(deltas, TRANSACTION_COUNTERS.get(instance.status), 1)
+        _add(deltas, 'low_stock_books', instance.__dict__.pop('_low_stock_delta', 0))
+        _add(member_deltas, MEMBER_COUNTERS.get(instance.status), 1)
+    else:
+        before = getattr(instance, '_loaded_status', None)
+        if before is not None and before != instance.status:
+            _add(deltas, TRANSACTION_COUNTERS.get(before), -1)
+            _add(deltas, TRANSACTION_COUNTERS.get(instance.status), 1)
+            _add(member_deltas, MEMBER_COUNTERS.get(before), -1)
+            _add(member_deltas, MEMBER_COUNTERS.get(instance.status), 1)
+    LibraryStats.bump(**deltas)
+    Member.bump_loan_counts(instance.member_id, **member_deltas)
+    instance._loaded_status = instance.status
+
+
+@receiver(post_delete, sender=Transaction)
+def transaction_deleted(sender, instance, origin=None, **kwargs):
+    if _cascaded(origin, Transaction):
+        return
+    deltas = {'total_transactions': -1, 'catalog_version': 1}
+    _add(deltas, TRANSACTION_COUNTERS.get(instance.status), -1)
+    _add(deltas, 'low_stock_books', instance.__dict__.pop('_low_stock_delta', 0))
+    LibraryStats.bump(**deltas)
+
+    member_deltas = {'total_loans': -1}
+    _add(member_deltas, MEMBER_COUNTERS.get(instance.status), -1)
+    Member.bump_loan_counts(instance.member_id, **member_deltas)
+    Book.objects.filter(pk=instance.book_id).update(borrow_count=F('borrow_count') - 1)
+
+
+@receiver(post_save, sender=BookRequest)
+def book_request_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    before = None if created else getattr(instance, '_loaded_status', instance.status)
+    delta = int(instance.status == 'Pending') - int(before == 'Pending')
+    LibraryStats.bump(pending_requests=delta)
+    instance._loaded_status = instance.status
+
+
+@receiver(post_delete, sender=BookRequest)
+def book_request_deleted(sender, instance, origin=None, **kwargs):
+    if instance.status == 'Pending' and not _cascaded(origin, BookRequest):
+        LibraryStats.bump(pending_requests=-1)
+
+
+def delete_dependents(instance):
+    """
+    Count and delete the loans (live and archived) and requests of a member
+    or book that is about to be deleted, in a fixed number of statements.
+    Must run in the same transaction as the delete itself.
+    """
+    if isinstance(instance, Member):
+        field, counting = 'member', member_deleting
+    else:
+        field, counting = 'book', book_deleting
+    counting(sender=type(instance), instance=instance)
+    instance._dependents_deleted = True
+
+    # Plain DELETEs: no rows are loaded and no per-row signals are sent. A
+    # loan only ever points at a request of its own member and book, so no
+    # loan that stays refers to a deleted request.
+    for model in (Transaction, ArchivedTransaction, BookRequest):
+        rows = model.objects.filter(**{field: instance})
+        rows._raw_delete(rows.db)
+
+
+def _uncount_cascade(loans, requests):
+    """Take the loans and requests about to be cascade-deleted off LibraryStats."""
+    by_status = dict(loans.order_by().values_list('status').annotate(n=Count('id')))
+    total = sum(by_status.values())
+    deltas = {
+        'total_transactions': -total,
+        'catalog_version': int(bool(total)),
+        'pending_requests': -requests.filter(status='Pending').count(),
+    }
+    for status, count in by_status.items():
+        _add(deltas, TRANSACTION_COUNTERS.get(status), -count)
+    LibraryStats.bump(**deltas)
+
+
+def _count_per(loans, field, **filters):
+    """Subquery counting ``loans`` per value of ``field`` (the outer row's pk)."""
+    counted = (
+        loans.filter(**{field: OuterRef('pk')}, **filters)
+        .order_by().values(field).annotate(n=Count('id')).values('n')
+    )
+    return Coalesce(Subquery(counted, output_field=IntegerField()), Value(0))
+
+
+def _cascaded(origin, model):
+    """True when a delete started from another model, i.e. a member/book cascade."""
+    origin_model = origin.model if isinstance(origin, QuerySet) else type(origin)
+    return origin is not None and origin_model is not model
+
+
+def _add(deltas, counter, amount):
+    if counter:
+        deltas[counter] = deltas.get(counter, 0) + amount
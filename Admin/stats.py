@@ -0,0 +1,82 @@
+"""
+Dashboard statistics.
+
+The counters live in the single ``LibraryStats`` row. ``Admin.signals`` keeps
+it current as books, members, transactions and requests change, so the
+dashboard reads one row instead of counting whole tables. ``refresh_stats``
+recomputes everything from scratch (``manage.py refresh_stats``).
+"""
+from django.db.models import Count, IntegerField, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Coalesce
+
+from Admin.models import Book, BookRequest, LibraryStats, LoanHistory, Member
+
+
+def compute_stats():
+    """Count everything from the source tables, one aggregate pass per table."""
+    book_counts = Book.objects.aggregate(
+        total_books=Count('id'),
+        low_stock_books=Count('id', filter=Q(available_copies__lt=LibraryStats.LOW_STOCK_THRESHOLD)),
+    )
+    transaction_counts = LoanHistory.objects.aggregate(
+        total_transactions=Count('id'),
+        issued_books=Count('id', filter=Q(status='Issued')),
+        returned_books=Count('id', filter=Q(status='Returned')),
+    )
+    pending_requests = BookRequest.objects.filter(status='Pending').count()
+
+    return {
+        **book_counts,
+        **transaction_counts,
+        'total_members': Member.objects.count(),
+        'pending_requests': pending_requests,
+    }
+
+
+def refresh_stats():
+    """Rebuild the stats row from the source tables and return it."""
+    stats, _created = LibraryStats.objects.update_or_create(pk=1, defaults=compute_stats())
+    return stats
+
+
+def refresh_member_stats():
+    """
+    Recompute every member's loan counters from their loan history in one UPDATE.
+
+    Returns:
+        Number of members updated
+    """
+    def count_loans(**filters):
+        loans = LoanHistory.objects.filter(member=OuterRef('pk'), **filters).order_by()
+        counted = loans.values('member').annotate(n=Count('id')).values('n')
+        return Coalesce(Subquery(counted, output_field=IntegerField()), Value(0))
+
+    return Member.objects.update(
+        issued_count=count_loans(status='Issued'),
+        returned_count=count_loans(status='Returned'),
+        total_loans=count_loans(),
+    )
+
+
+def refresh_borrow_counts():
+    """
+    Recompute every book's borrow_count from the loan history in one UPDATE.
+
+    Returns:
+        Number of books updated
+    """
+    loans = LoanHistory.objects.filter(book=OuterRef('pk')).order_by()
+    counted = loans.values('book').annotate(n=Count('id')).values('n')
+    updated = Book.objects.update(
+        borrow_count=Coalesce(Subquery(counted, output_field=IntegerField()), Value(0))
+    )
+    LibraryStats.bump(catalog_version=1)
+    return updated
+
+
+def get_stats():
+    """Return the current stats row, building it on first use."""
+    stats = LibraryStats.objects.filter(pk=1).first()
+    if stats is None:
+        stats = refresh_stats()
+    return stats
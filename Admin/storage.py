@@ -0,0 +1,59 @@
+"""
+Content-addressed storage for book covers.
+
+Each upload is stored under the SHA-256 of its contents,
+``covers/<first two hex digits>/<digest><ext>``. Uploading the same image
+twice stores it once, and a stored file never changes, so its URL can be
+cached forever (see ``Admin.views.serve_cover``). Files are not deleted with
+their book; ``manage.py gc_covers`` removes blobs no book refers to.
+"""
+import hashlib
+import posixpath
+
+from django.core.files.storage import FileSystemStorage
+
+COVERS_DIR = 'covers'
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """FileSystemStorage that names files after a hash of their contents."""
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        digest = content_digest(content)
+        extension = posixpath.splitext(name)[1].lower()
+        name = posixpath.join(posixpath.dirname(name), digest[:2], digest + extension)
+        if self.exists(name):
+            # Same bytes are already stored under this name
+            return name
+        return super().save(name, content, max_length=max_length)
+
+    def save_derived(self, name, content):
+        """
+        Store ``content`` under exactly ``name``, replacing any file there.
+
+        For files computed from a stored blob (cover derivatives), which are
+        named after the blob rather than after their own contents.
+        """
+        self.delete(name)
+        return super().save(name, content)
+
+
+def content_digest(content, chunk_size=64 * 1024):
+    digest = hashlib.sha256()
+    if hasattr(content, 'seek'):
+        content.seek(0)
+    for chunk in content.chunks(chunk_size):
+        digest.update(chunk)
+    if hasattr(content, 'seek'):
+        content.seek(0)
+    return digest.hexdigest()
+
+
+_cover_storage = ContentAddressedStorage()
+
+
+def cover_storage():
+    """Storage for ``Book.image``; migrations refer to this callable."""
+    return _cover_storage
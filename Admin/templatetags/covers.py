@@ -0,0 +1,34 @@
+from django import template
+from django.utils.html import format_html, format_html_join
+
+from Admin.covers import DERIVATIVES, derivative_url
+
+register = template.Library()
+
+
+@register.simple_tag
+def cover(book, kind, width=None, height=None, css_class='', style=''):
+    """
+    ``<picture>`` for a book's cover derivative (WebP with a JPEG fallback).
+
+    Falls back to the original upload while the derivatives are still being
+    generated. width/height default to the derivative's size and are always
+    set, so the page does not reflow as covers load.
+    """
+    box_width, box_height = DERIVATIVES[kind]
+    width = width or box_width
+    height = height or box_height
+    name = book.image.name
+    jpeg = derivative_url(name, kind, 'jpg')
+    attrs = format_html_join(' ', '{}="{}"', [
+        (attribute, value) for attribute, value in (
+            ('alt', book.title), ('width', width), ('height', height),
+            ('class', css_class), ('style', style),
+            ('loading', 'lazy'), ('decoding', 'async'),
+        ) if value != ''
+    ])
+    if jpeg is None:
+        return format_html('<img src="{}" {}>', book.image.url, attrs)
+    webp = derivative_url(name, kind, 'webp')
+    source = format_html('<source type="image/webp" srcset="{}">', webp) if webp else ''
+    return format_html('<picture>{}<img src="{}" {}></picture>', source, jpeg, attrs)
@@ -1,3 +1,946 @@
-from django.test import TestCase
+import csv
+import datetime
+import io
+import json
+import shutil
+from pathlib import Path
+from tempfile import TemporaryDirectory
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import IntegrityError, OperationalError, connection, connections
+from django.db.migrations.executor import MigrationExecutor
+from django.db.models import F
+from django.db.transaction import atomic
+from django.template import Context, Template
+from django.test import RequestFactory, TestCase, TransactionTestCase
+from django.urls import reverse
+from django.utils import timezone
+from django.test.utils import CaptureQueriesContext
+from PIL import Image
+
+from Admin.archive import archive_returned
+from Admin.benchmark import cases_for, load_budgets, run
+from Admin.circulation import NO_STOCK_NOTE, _resolve, approve_requests, check_in
+from Admin.covers import DERIVATIVES, FORMATS, derivative_name, derivative_url, generate_derivatives
+from Admin.db import READ_ALIAS, WRITE_ALIAS, _write_lock, writer
+from Admin.importer import ImportResult
+from Admin.management.commands.import_books import Checkpoint
+from Admin.models import (
+    ArchivedTransaction, Book, BookRequest, BookUnavailable, ConcurrentUpdate, LibraryStats, LoanHistory, Member,
+    Transaction, books_imported,
+)
+from Admin.pagination import paginate
+from Admin.search import search_books, search_ordering
+from Admin.seed import seed
+from Admin.stats import compute_stats, get_stats
+from Admin.storage import COVERS_DIR, cover_storage
+
+
+class LookupIndexTests(TestCase):
+    """EXPLAIN QUERY PLAN checks for the hot lookup paths."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.member = Member.objects.create(full_name='Ada Reader', email='ada@example.com', phone='555')
+        cls.book = Book.objects.create(
+            title='Dune', author='Frank Herbert', isbn='9780441013593',
+            published_date='1965-08-01', available_copies=3, category='Science Fiction',
+        )
+
+    def assertUsesIndex(self, queryset, index_name):
+        plan = queryset.explain()
+        self.assertIn(index_name, plan)
+
+    def test_open_loan_lookup(self):
+        qs = Transaction.objects.filter(member=self.member, book=self.book, status='Issued')
+        self.assertUsesIndex(qs, 'unique_open_loan')
+
+    def test_pending_request_lookup(self):
+        qs = BookRequest.objects.filter(member=self.member, book=self.book, status='Pending')
+        self.assertUsesIndex(qs, 'bookrequest_pending_idx')
+
+    def test_transactions_by_status(self):
+        qs = Transaction.objects.filter(status='Returned').order_by('-issue_date', '-id')
+        self.assertUsesIndex(qs, 'transaction_status_date_idx')
+
+    def test_requests_by_status(self):
+        qs = BookRequest.objects.filter(status='Pending').order_by('-request_date', '-id')
+        self.assertUsesIndex(qs, 'bookrequest_status_date_idx')
+
+    def test_available_books_by_category(self):
+        qs = Book.objects.filter(category='Science Fiction', available_copies__gt=0)
+        self.assertUsesIndex(qs, 'book_available_category_idx')
+
+    def test_duplicate_open_loan_rejected(self):
+        Transaction.objects.create(member=self.member, book=self.book)
+        with self.assertRaises(IntegrityError), atomic():
+            Transaction.objects.create(member=self.member, book=self.book)
+        # The failed issue must not have consumed a copy
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.available_copies, 2)
+
+
+class CounterAssertions:
+    def assertCountersConsistent(self):
+        """LibraryStats, member counters and borrow counts match the loan history."""
+        stats = get_stats()
+        for name, value in compute_stats().items():
+            self.assertEqual(getattr(stats, name), value, name)
+        for member in Member.objects.all():
+            loans = LoanHistory.objects.filter(member=member)
+            self.assertEqual(
+                (member.total_loans, member.issued_count, member.returned_count),
+                (loans.count(), loans.filter(status='Issued').count(), loans.filter(status='Returned').count()),
+                member.full_name,
+            )
+        for book in Book.objects.all():
+            self.assertEqual(book.borrow_count, LoanHistory.objects.filter(book=book).count(), book.title)
+
+
+def make_book(isbn, copies=3, **fields):
+    fields.setdefault('title', f'Book {isbn}')
+    fields.setdefault('author', 'Test Author')
+    return Book.objects.create(isbn=isbn, published_date='2000-01-01', available_copies=copies, **fields)
+
+
+def make_member(email, **fields):
+    return Member.objects.create(full_name=fields.pop('full_name', email), email=email, phone='555', **fields)
+
+
+class PaginationTests(TestCase):
+    """Walking the cursors visits every row exactly once, in order, in both directions."""
+
+    @classmethod
+    def setUpTestData(cls):
+        # Repeated titles and issue dates so the id tie-breaker matters
+        cls.books = [make_book(f'97800000010{i:02d}', title=f'Title {i % 4}') for i in range(11)]
+        member = make_member('pager@example.com')
+        for i, book in enumerate(cls.books):
+            loan = Transaction.objects.create(member=member, book=book)
+            Transaction.objects.filter(pk=loan.pk).update(issue_date=datetime.date(2024, 1, 1 + i % 3))
+
+    def page(self, queryset, ordering, cursor=None):
+        request = RequestFactory().get('/', {'cursor': cursor} if cursor else {})
+        return paginate(request, queryset, ordering, per_page=3)
+
+    def walk(self, queryset, ordering):
+        """Ids seen going forwards to the last page and then back to the first."""
+        forwards, pages = [], [self.page(queryset, ordering)]
+        while True:
+            forwards.extend(row.pk for row in pages[-1])
+            if not pages[-1].has_next:
+                break
+            pages.append(self.page(queryset, ordering, pages[-1].next_cursor))
+        self.assertFalse(pages[0].has_previous)
+
+        backwards, page = [], pages[-1]
+        while page.has_previous:
+            page = self.page(queryset, ordering, page.previous_cursor)
+            backwards[:0] = [row.pk for row in page]
+        self.assertEqual(backwards, forwards[:len(backwards)])
+        self.assertEqual(len(backwards), len(forwards) - len(pages[-1]))
+        return forwards
+
+    def test_ascending_key(self):
+        books = Book.objects.all()
+        self.assertEqual(
+            self.walk(books, ('title', 'id')), list(books.order_by('title', 'id').values_list('pk', flat=True)),
+        )
+
+    def test_descending_key(self):
+        loans = Transaction.objects.all()
+        self.assertEqual(
+            self.walk(loans, ('-issue_date', '-id')),
+            list(loans.order_by('-issue_date', '-id').values_list('pk', flat=True)),
+        )
+
+    def test_search_rank_key(self):
+        results = search_books('title')
+        self.assertEqual(self.walk(results, search_ordering()), [book.pk for book in results])
+
+    def test_rows_added_before_the_cursor_do_not_shift_the_next_page(self):
+        books = Book.objects.all()
+        first = self.page(books, ('title', 'id'))
+        expected = [book.pk for book in self.page(books, ('title', 'id'), first.next_cursor)]
+        make_book('9780000001099', title='A New Arrival')
+        self.assertEqual([book.pk for book in self.page(books, ('title', 'id'), first.next_cursor)], expected)
+
+    def test_bad_cursor_is_the_first_page(self):
+        books = Book.objects.all()
+        first = [book.pk for book in self.page(books, ('title', 'id'))]
+        for cursor in ('not-a-cursor', 'WyJ4IixbXV0'):
+            with self.subTest(cursor):
+                self.assertEqual([book.pk for book in self.page(books, ('title', 'id'), cursor)], first)
+
+
+class OpenLoanMigrationTests(TransactionTestCase):
+    """Migration 0010 closes the duplicate open loans the old issue_book allowed before adding unique_open_loan."""
+
+    databases = {WRITE_ALIAS, READ_ALIAS}
+    before = [('Admin', '0009_librarystats')]
+    after = [('Admin', '0010_lookup_indexes')]
+
+    def setUp(self):
+        self.executor = MigrationExecutor(connection)
+        self.executor.migrate(self.before)
+        self.addCleanup(self.migrate_to_latest)
+        apps = self.executor.loader.project_state(self.before).apps
+        Book, Member, Transaction = (apps.get_model('Admin', name) for name in ('Book', 'Member', 'Transaction'))
+        LibraryStats = apps.get_model('Admin', 'LibraryStats')
+
+        book = Book.objects.create(
+            title='Dune', author='Frank Herbert', isbn='9780441013593', published_date='1965-08-01', available_copies=2,
+        )
+        member = Member.objects.create(full_name='Ada Reader', email='ada@example.com', phone='555')
+        self.loans = [Transaction.objects.create(member=member, book=book, status='Issued') for _i in range(3)]
+        LibraryStats.objects.update_or_create(
+            pk=1, defaults={'total_books': 1, 'issued_books': 3, 'total_transactions': 3},
+        )
+
+    def migrate_to_latest(self):
+        self.executor.loader.build_graph()
+        self.executor.migrate(self.executor.loader.graph.leaf_nodes())
+
+    def test_duplicate_open_loans_closed(self):
+        with self.assertLogs('Admin.migrations.0010_lookup_indexes', 'WARNING') as logs:
+            self.executor.loader.build_graph()
+            self.executor.migrate(self.after)
+        self.assertIn(f'transaction ids {self.loans[1].pk}, {self.loans[2].pk}', logs.output[0])
+
+        apps = self.executor.loader.project_state(self.after).apps
+        Transaction = apps.get_model('Admin', 'Transaction')
+        self.assertEqual(
+            dict(Transaction.objects.values_list('id', 'status')),
+            {self.loans[0].pk: 'Issued', self.loans[1].pk: 'Returned', self.loans[2].pk: 'Returned'},
+        )
+        self.assertEqual(apps.get_model('Admin', 'Book').objects.get().available_copies, 4)
+        stats = apps.get_model('Admin', 'LibraryStats').objects.get()
+        self.assertEqual((stats.issued_books, stats.returned_books, stats.low_stock_books), (1, 2, 1))
+
+
+class ReadRoutingTests(TransactionTestCase):
+    """Reads outside a transaction use the query-only connection; anything in one stays on default."""
+
+    databases = {WRITE_ALIAS, READ_ALIAS}
+
+    def test_reads_outside_a_transaction_use_readonly(self):
+        make_book('9780000005001')
+        books = Book.objects.filter(isbn='9780000005001')
+        self.assertEqual(books.db, READ_ALIAS)
+        with CaptureQueriesContext(connections[READ_ALIAS]) as reads:
+            self.assertTrue(books.exists())
+        self.assertEqual(len(reads), 1)
+
+    def test_reads_in_a_transaction_see_its_writes(self):
+        with writer():
+            make_book('9780000005002')
+            books = Book.objects.filter(isbn='9780000005002')
+            self.assertEqual(books.db, WRITE_ALIAS)
+            self.assertTrue(books.exists())
+        with atomic():
+            self.assertEqual(Book.objects.all().db, WRITE_ALIAS)
+
+    def test_readonly_connection_refuses_writes(self):
+        with self.assertRaises(OperationalError), connections[READ_ALIAS].cursor() as cursor:
+            cursor.execute('DELETE FROM Admin_book')
+
+    def test_writer_inside_a_transaction_does_not_queue(self):
+        with writer():
+            self.assertTrue(_write_lock.locked())
+        with atomic(), writer():
+            # Waiting for the lock here could deadlock the enclosing transaction
+            self.assertFalse(_write_lock.locked())
+            make_book('9780000005003')
+        self.assertTrue(Book.objects.filter(isbn='9780000005003').exists())
+
+
+class CascadeDeleteTests(CounterAssertions, TestCase):
+    """Deleting a member or book takes its loans and requests off the counters in bulk."""
+
+    def setUp(self):
+        get_stats()
+        self.shared = make_book('9990000000000', copies=200)
+
+    def member_with_loans(self, name, loans):
+        member = make_member(f'{name}@example.com')
+        for i in range(loans):
+            loan = Transaction.objects.create(member=member, book=make_book(f'{name}{i:05d}'))
+            if i % 2:
+                loan.mark_returned()
+        Transaction.objects.create(member=member, book=self.shared).mark_returned()
+        BookRequest.objects.create(member=member, book=self.shared)
+        return member
+
+    def book_with_loans(self, name, loans):
+        book = make_book(f'{name}00000', copies=loans)
+        for i in range(loans):
+            loan = Transaction.objects.create(member=make_member(f'{name}{i}@example.com'), book=book)
+            if i % 2:
+                loan.mark_returned()
+            BookRequest.objects.create(member=loan.member, book=book)
+        return book
+
+    def delete_queries(self, instance):
+        with CaptureQueriesContext(connection) as queries:
+            instance.delete()
+        return len(queries)
+
+    def test_member_delete_takes_constant_queries(self):
+        small, large = self.member_with_loans('s', 5), self.member_with_loans('l', 50)
+        self.assertEqual(self.delete_queries(small), self.delete_queries(large))
+        self.assertCountersConsistent()
+        self.shared.refresh_from_db()
+        self.assertEqual(self.shared.borrow_count, 0)
+
+    def test_book_delete_takes_constant_queries(self):
+        small, large = self.book_with_loans('s', 5), self.book_with_loans('l', 50)
+        self.assertEqual(self.delete_queries(small), self.delete_queries(large))
+        self.assertCountersConsistent()
+
+    def test_archived_loans_uncounted_on_delete(self):
+        member = self.member_with_loans('a', 4)
+        other = self.member_with_loans('b', 2)
+        self.assertEqual(archive_returned(datetime.date.today() + datetime.timedelta(days=1)), 5)
+        member.delete()
+        self.assertCountersConsistent()
+        self.assertFalse(ArchivedTransaction.objects.filter(member_id=member.pk).exists())
+
+        self.shared.delete()
+        self.assertCountersConsistent()
+        self.assertEqual(LoanHistory.objects.filter(member=other).count(), 2)
+
+    def test_single_loan_delete_still_counted(self):
+        member = self.member_with_loans('m', 2)
+        Transaction.objects.filter(member=member, status='Issued').first().delete()
+        self.assertCountersConsistent()
+
+
+class MemberCounterTests(CounterAssertions, TestCase):
+    """Every issue and return path keeps the member's loan counters in step with the loans."""
+
+    def setUp(self):
+        get_stats()
+        self.member = make_member('counted@example.com')
+        self.books = [make_book(f'97800000030{i:02d}') for i in range(4)]
+
+    def assertCounters(self, issued, returned):
+        self.member.refresh_from_db()
+        self.assertEqual(
+            (self.member.issued_count, self.member.returned_count, self.member.total_loans),
+            (issued, returned, issued + returned),
+        )
+        self.assertCountersConsistent()
+
+    def test_issue_and_return_views(self):
+        self.client.post(reverse('issue_book'), {'member': self.member.pk, 'book': self.books[0].pk})
+        self.client.post(reverse('issue_book'), {'member': self.member.pk, 'book': self.books[1].pk})
+        self.assertCounters(issued=2, returned=0)
+
+        loan = Transaction.objects.get(member=self.member, book=self.books[0])
+        self.client.get(reverse('admin_return_book', args=[loan.pk]))
+        self.client.get(reverse('admin_return_book', args=[loan.pk]))
+        self.assertCounters(issued=1, returned=1)
+
+    def test_approval_and_check_in(self):
+        requests = [BookRequest.objects.create(member=self.member, book=book) for book in self.books[:3]]
+        self.client.get(reverse('approve_request', args=[requests[0].pk]))
+        approve_requests([r.pk for r in requests[1:]])
+        self.assertCounters(issued=3, returned=0)
+
+        check_in([self.books[0].isbn, self.books[1].isbn, self.books[0].isbn], by='isbn')
+        self.assertCounters(issued=1, returned=2)
+
+    def test_deleting_loans(self):
+        loans = [Transaction.objects.create(member=self.member, book=book) for book in self.books[:2]]
+        loans[0].mark_returned()
+        self.client.get(reverse('delete_transaction', args=[loans[0].pk]))
+        self.assertCounters(issued=1, returned=0)
+        self.client.get(reverse('delete_transaction', args=[loans[1].pk]))
+        self.assertCounters(issued=0, returned=0)
+
+    def test_profile_edit_keeps_counters(self):
+        stale = Member.objects.get(pk=self.member.pk)
+        Transaction.objects.create(member=self.member, book=self.books[0])
+        stale.full_name = 'Renamed Reader'
+        stale.save()
+        self.assertCounters(issued=1, returned=0)
+        self.assertEqual(self.member.full_name, 'Renamed Reader')
+
+    def test_refresh_repairs_drifted_counters(self):
+        Transaction.objects.create(member=self.member, book=self.books[0]).mark_returned()
+        Member.objects.filter(pk=self.member.pk).update(issued_count=7, returned_count=0, total_loans=0)
+        call_command('refresh_member_stats', stdout=io.StringIO())
+        self.assertCounters(issued=0, returned=1)
+
+
+class BorrowCountTests(CounterAssertions, TestCase):
+    """borrow_count counts every loan of a book, open or returned, and nothing else."""
+
+    def setUp(self):
+        get_stats()
+        self.book = make_book('9780000003101', copies=2)
+        self.members = [make_member(f'borrower{i}@example.com') for i in range(3)]
+
+    def assertBorrowCount(self, count):
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.borrow_count, count)
+        self.assertCountersConsistent()
+
+    def test_issue_counts_and_return_does_not(self):
+        loan = Transaction.objects.create(member=self.members[0], book=self.book)
+        self.assertBorrowCount(1)
+        loan.mark_returned()
+        self.assertBorrowCount(1)
+        Transaction.objects.create(member=self.members[0], book=self.book)
+        self.assertBorrowCount(2)
+
+    def test_failed_issue_is_not_counted(self):
+        for member in self.members[:2]:
+            Transaction.objects.create(member=member, book=self.book)
+        with self.assertRaises(BookUnavailable):
+            Transaction.objects.create(member=self.members[2], book=self.book)
+        self.assertBorrowCount(2)
+
+    def test_bulk_approval_counts_approved_only(self):
+        requests = [BookRequest.objects.create(member=member, book=self.book) for member in self.members]
+        approve_requests([r.pk for r in requests])
+        self.assertBorrowCount(2)
+
+    def test_deleted_loan_is_uncounted(self):
+        loan = Transaction.objects.create(member=self.members[0], book=self.book)
+        loan.mark_returned()
+        self.client.get(reverse('delete_transaction', args=[loan.pk]))
+        self.assertBorrowCount(0)
+
+    def test_refresh_repairs_drifted_counts(self):
+        Transaction.objects.create(member=self.members[0], book=self.book)
+        Book.objects.filter(pk=self.book.pk).update(borrow_count=40)
+        call_command('refresh_popularity', stdout=io.StringIO())
+        self.assertBorrowCount(1)
+
+
+class BulkApprovalTests(CounterAssertions, TestCase):
+    def setUp(self):
+        get_stats()
+        self.book = make_book('9780000000001', copies=2)
+        self.members = [make_member(f'reader{i}@example.com') for i in range(3)]
+        self.requests = [BookRequest.objects.create(member=member, book=self.book) for member in self.members]
+
+    def test_copies_handed_out_oldest_first(self):
+        result = approve_requests([r.pk for r in self.requests])
+        self.assertEqual(result.approved, [r.pk for r in self.requests[:2]])
+        self.assertEqual(result.rejected, {self.requests[2].pk: NO_STOCK_NOTE})
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.available_copies, 0)
+        self.assertEqual(self.book.borrow_count, 2)
+        self.assertCountersConsistent()
+
+    def test_no_copies_left_rejects_everything(self):
+        Book.objects.filter(pk=self.book.pk).update(available_copies=0)
+        result = approve_requests([r.pk for r in self.requests])
+        self.assertEqual(result.approved, [])
+        self.assertEqual(result.rejected_for(NO_STOCK_NOTE), 3)
+        self.assertFalse(Transaction.objects.exists())
+
+    def test_request_resolved_meanwhile_is_a_conflict(self):
+        self.requests[0].resolve('Rejected')
+        with self.assertRaises(ConcurrentUpdate), atomic():
+            _resolve([r.pk for r in self.requests], status='Approved')
+        self.assertEqual(BookRequest.objects.filter(status='Pending').count(), 2)
+
+
+class CheckInTests(CounterAssertions, TestCase):
+    def setUp(self):
+        get_stats()
+        self.book = make_book('9780000000002')
+        self.members = [make_member(f'scan{i}@example.com') for i in range(2)]
+        self.loans = [Transaction.objects.create(member=member, book=self.book) for member in self.members]
+
+    def test_by_id_returns_once(self):
+        loan = self.loans[0]
+        results = check_in([str(loan.pk), str(loan.pk)], by='id')
+        self.assertEqual([r['status'] for r in results], ['returned', 'already_returned'])
+        self.assertFalse(loan.mark_returned())
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.available_copies, 2)
+        self.assertCountersConsistent()
+
+    def test_by_isbn_returns_oldest_loan_first(self):
+        results = check_in([self.book.isbn], by='isbn')
+        self.assertEqual(results[0]['transaction'].pk, self.loans[0].pk)
+        self.assertEqual(Transaction.objects.get(pk=self.loans[1].pk).status, 'Issued')
+
+    def test_oversized_id_is_not_found(self):
+        results = check_in(['9' * 40], by='id')
+        self.assertEqual(results[0]['status'], 'not_found')
+
+    def test_unknown_mode_is_a_form_error(self):
+        with self.assertRaises(ValueError):
+            check_in([str(self.loans[0].pk)], by='transaction')
+        response = self.client.post(
+            reverse('check_in'), {'identifiers': str(self.loans[0].pk), 'by': 'transaction'}, follow=True,
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'check in by ISBN or by transaction id')
+        self.assertEqual(Transaction.objects.filter(status='Issued').count(), 2)
+
+
+class ListingQueryTests(TestCase):
+    """Listing pages fetch members and books with their rows, so longer lists take no extra queries."""
+
+    PAGES = (
+        ('dashboard', {}),
+        ('transactions', {}),
+        ('transactions', {'status': 'Returned'}),
+        ('book_requests', {}),
+        ('book_requests', {'status': ''}),
+    )
+
+    def setUp(self):
+        self.next_isbn = 9780000002000
+        self.add_rows(2)
+
+    def add_rows(self, count):
+        for _i in range(count):
+            self.next_isbn += 1
+            book = make_book(str(self.next_isbn))
+            member = make_member(f'{self.next_isbn}@example.com')
+            Transaction.objects.create(member=member, book=book)
+            Transaction.objects.create(member=member, book=make_book(str(self.next_isbn + 5000))).mark_returned()
+            BookRequest.objects.create(member=member, book=book)
+            BookRequest.objects.create(member=member, book=book).resolve('Approved')
+
+    def queries(self, name, params):
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse(name), params)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_query_count_independent_of_rows(self):
+        few = {(name, tuple(params.items())): self.queries(name, params) for name, params in self.PAGES}
+        self.add_rows(10)
+        for name, params in self.PAGES:
+            with self.subTest(name, **params):
+                self.assertEqual(self.queries(name, params), few[name, tuple(params.items())])
+
+
+class DeleteTransactionTests(CounterAssertions, TestCase):
+    def setUp(self):
+        get_stats()
+        self.book = make_book('9780000000003', copies=1)
+        self.loan = Transaction.objects.create(member=make_member('del@example.com'), book=self.book)
+
+    def test_deleting_open_loan_restores_copy(self):
+        self.client.get(reverse('delete_transaction', args=[self.loan.pk]))
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.available_copies, 1)
+        self.assertCountersConsistent()
+
+    def test_deleting_returned_loan_does_not_restore_copy(self):
+        # Returned after the page listing the loan was rendered
+        Transaction.objects.get(pk=self.loan.pk).mark_returned()
+        self.client.get(reverse('delete_transaction', args=[self.loan.pk]))
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.available_copies, 1)
+        self.assertFalse(Transaction.objects.exists())
+        self.assertCountersConsistent()
+
+
+class LowStockTests(CounterAssertions, TestCase):
+    """Crossing the low-stock threshold is folded into the one LibraryStats UPDATE of an issue or return."""
+
+    def setUp(self):
+        get_stats()
+        self.book = make_book('9780000003201', copies=LibraryStats.LOW_STOCK_THRESHOLD)
+        self.member = make_member('low@example.com')
+
+    def assertOneStatsUpdate(self, queries):
+        table = LibraryStats._meta.db_table
+        updates = [q['sql'] for q in queries if q['sql'].startswith('UPDATE') and table in q['sql']]
+        self.assertEqual(len(updates), 1, updates)
+
+    def assertLowStock(self, count):
+        self.assertEqual(get_stats().low_stock_books, count)
+        self.assertCountersConsistent()
+
+    def test_issue_and_return_across_threshold(self):
+        with CaptureQueriesContext(connection) as queries:
+            loan = Transaction.objects.create(member=self.member, book=self.book)
+        self.assertOneStatsUpdate(queries)
+        self.assertLowStock(1)
+
+        with CaptureQueriesContext(connection) as queries:
+            loan.mark_returned()
+        self.assertOneStatsUpdate(queries)
+        self.assertLowStock(0)
+
+    def test_deleting_open_loan_across_threshold(self):
+        loan = Transaction.objects.create(member=self.member, book=self.book)
+        self.client.get(reverse('delete_transaction', args=[loan.pk]))
+        self.assertLowStock(0)
+
+    def test_crossing_costs_no_extra_queries(self):
+        above = make_book('9780000003202', copies=LibraryStats.LOW_STOCK_THRESHOLD + 2)
+        counts = []
+        for book in (above, self.book):
+            with CaptureQueriesContext(connection) as issue:
+                loan = Transaction.objects.create(member=self.member, book=book)
+            with CaptureQueriesContext(connection) as ret:
+                loan.mark_returned()
+            counts.append((len(issue), len(ret)))
+        self.assertEqual(counts[0], counts[1])
+
+
+class ArchiveTests(CounterAssertions, TestCase):
+    """archive_transactions moves old returned loans and leaves every count and the loan history as they were."""
+
+    def setUp(self):
+        get_stats()
+        today = datetime.date.today()
+        self.member = make_member('archive@example.com')
+        self.old = []
+        for i in range(5):
+            book = make_book(f'97800000060{i:02d}')
+            request = BookRequest.objects.create(member=self.member, book=book)
+            request.resolve('Approved')
+            loan = Transaction.objects.create(member=self.member, book=book, book_request=request)
+            loan.mark_returned()
+            returned = today - datetime.timedelta(days=400 + i)
+            Transaction.objects.filter(pk=loan.pk).update(
+                issue_date=returned - datetime.timedelta(days=20), return_date=returned,
+            )
+            self.old.append(loan.pk)
+        self.recent = Transaction.objects.create(member=self.member, book=make_book('9780000006100'))
+        self.recent.mark_returned()
+        self.open = Transaction.objects.create(member=self.member, book=make_book('9780000006101'))
+
+    def archive(self, *args):
+        out = io.StringIO()
+        call_command('archive_transactions', '--days', '365', '--batch-size', '2', *args, stdout=out)
+        return out.getvalue()
+
+    def snapshot(self):
+        """Loan history, LibraryStats row, member counters and borrow counts."""
+        return (
+            list(LoanHistory.objects.order_by('id').values_list('id', 'issue_date', 'return_date', 'status')),
+            LibraryStats.objects.values().get(),
+            list(Member.objects.order_by('id').values('issued_count', 'returned_count', 'total_loans')),
+            list(Book.objects.order_by('id').values_list('borrow_count', flat=True)),
+        )
+
+    def test_dry_run_moves_nothing(self):
+        self.assertIn('Would archive 5 loan(s)', self.archive('--dry-run'))
+        self.assertFalse(ArchivedTransaction.objects.exists())
+
+    def test_old_returned_loans_moved(self):
+        before = self.snapshot()
+
+        self.assertIn('Archived 5 loan(s)', self.archive())
+        self.assertEqual(sorted(ArchivedTransaction.objects.values_list('id', flat=True)), self.old)
+        self.assertEqual(set(Transaction.objects.values_list('id', flat=True)), {self.recent.pk, self.open.pk})
+        self.assertEqual(set(ArchivedTransaction.objects.values_list('book_request__status', flat=True)), {'Approved'})
+        self.assertEqual(set(LoanHistory.objects.filter(archived=True).values_list('id', flat=True)), set(self.old))
+        self.assertEqual(self.snapshot(), before)
+        self.assertCountersConsistent()
+        self.assertIn('Archived 0 loan(s)', self.archive())
+
+
+class ExportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_user('librarian', password='x', is_staff=True)
+        cls.member = make_member('export@example.com', full_name='Ada Export')
+        cls.book = make_book('9780000000004', title='Exported Book')
+        Transaction.objects.create(member=cls.member, book=cls.book).mark_returned()
+        Transaction.objects.create(member=cls.member, book=make_book('9780000000005'))
+
+    def export(self, kind, **params):
+        response = self.client.get(reverse('export', args=[kind]), params)
+        self.assertEqual(response.status_code, 200)
+        return b''.join(response.streaming_content).decode()
+
+    def test_requires_staff(self):
+        response = self.client.get(reverse('export', args=['members']))
+        self.assertEqual(response.status_code, 302)
+        self.client.force_login(User.objects.create_user('reader', password='x'))
+        response = self.client.get(reverse('export', args=['members']))
+        self.assertEqual(response.status_code, 302)
+
+    def test_members_csv(self):
+        self.client.force_login(self.staff)
+        rows = list(csv.reader(io.StringIO(self.export('members'))))
+        self.assertEqual(rows[0][:3], ['id', 'full_name', 'email'])
+        self.assertEqual(rows[1][1:3], ['Ada Export', 'export@example.com'])
+        self.assertEqual(rows[1][-1], '2')
+
+    def test_transactions_jsonl_filtered_and_archived(self):
+        self.client.force_login(self.staff)
+        archive_returned(datetime.date.today() + datetime.timedelta(days=1))
+        lines = [json.loads(line) for line in self.export('transactions', format='jsonl', status='Returned').splitlines()]
+        self.assertEqual(len(lines), 1)
+        self.assertEqual(lines[0]['book'], 'Exported Book')
+        self.assertTrue(lines[0]['archived'])
+
+    def test_bad_parameters(self):
+        self.client.force_login(self.staff)
+        self.assertEqual(self.client.get(reverse('export', args=['books']), {'from': 'soon'}).status_code, 400)
+        self.assertEqual(self.client.get(reverse('export', args=['secrets'])).status_code, 404)
+
+
+class SearchTests(TestCase):
+    """FTS5 search through the BookSearchEntry join, kept in sync by triggers."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.dune = make_book('9780441013593', title='Dune', description='Desert planet politics')
+        cls.foundation = make_book('9780553293357', title='Foundation', category='Science Fiction')
+        cls.emma = make_book('9780141439587', title='Emma', author='Jane Austen')
+
+    def titles(self, query, **kwargs):
+        return [book.title for book in search_books(query, **kwargs)]
+
+    def test_words_and_prefixes(self):
+        self.assertEqual(self.titles('desert planet'), ['Dune'])
+        self.assertEqual(self.titles('found'), ['Foundation'])
+        self.assertEqual(self.titles('austen'), ['Emma'])
+        self.assertEqual(self.titles('dune austen'), [])
+        self.assertEqual(sorted(self.titles('dune austen', match_any=True)), ['Dune', 'Emma'])
+
+    def test_ranked_with_annotation(self):
+        books = list(search_books('dune'))
+        self.assertEqual(len(books), 1)
+        self.assertLess(books[0].search_rank, 0)
+
+    def test_operators_in_input_are_harmless(self):
+        self.assertEqual(self.titles('dune" (*^'), ['Dune'])
+        self.assertEqual(self.titles('!!!'), [])
+
+    def test_isbn_substring(self):
+        self.assertEqual(self.titles('0441'), ['Dune'])
+        self.assertEqual(self.titles('978-0553'), ['Foundation'])
+
+    def test_triggers_follow_updates_and_deletes(self):
+        self.dune.title = 'Children of Dune'
+        self.dune.save()
+        self.assertEqual(self.titles('children'), ['Children of Dune'])
+        self.emma.delete()
+        self.assertEqual(self.titles('austen'), [])
+
+    def test_narrows_a_queryset_and_works_as_subquery(self):
+        scifi = Book.objects.filter(category='Science Fiction')
+        self.assertEqual(self.titles('foundation', queryset=scifi), ['Foundation'])
+        self.assertEqual(self.titles('dune', queryset=scifi), [])
+        ids = search_books('dune').values('id')
+        self.assertEqual(list(Book.objects.filter(id__in=ids)), [self.dune])
+
+
+def cover_upload(colour='red', name='cover.png'):
+    buffer = io.BytesIO()
+    Image.new('RGB', (300, 450), colour).save(buffer, 'PNG')
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/png')
+
+
+class CoverTests(TestCase):
+    """Derivatives are written to and looked up in cover_storage, next to the original."""
+
+    def setUp(self):
+        self.book = make_book('9780000000400', image=cover_upload())
+        self.addCleanup(shutil.rmtree, cover_storage().path(COVERS_DIR), ignore_errors=True)
+
+    def render(self, kind='card'):
+        return Template('{% load covers %}{% cover book kind %}').render(Context({'book': self.book, 'kind': kind}))
+
+    def test_derivatives_in_cover_storage(self):
+        name = self.book.image.name
+        self.assertEqual(generate_derivatives(name), len(DERIVATIVES) * len(FORMATS))
+        card = derivative_name(name, 'card', 'jpg')
+        self.assertTrue(cover_storage().exists(card))
+        with cover_storage().open(card) as fh:
+            self.assertEqual(Image.open(fh).size, DERIVATIVES['card'])
+        self.assertEqual(derivative_url(name, 'card'), cover_storage().url(card))
+        self.assertIn('<picture><source type="image/webp"', self.render())
+        self.assertIn('alt="%s" width="400" height="600"' % self.book.title, self.render())
+
+    def test_deleted_derivative_falls_back_to_original(self):
+        name = self.book.image.name
+        generate_derivatives(name)
+        self.assertIsNotNone(derivative_url(name, 'thumb'))
+        for ext in FORMATS:
+            cover_storage().delete(derivative_name(name, 'thumb', ext))
+        self.assertIsNone(derivative_url(name, 'thumb'))
+        self.assertIn('<img src="%s"' % self.book.image.url, self.render('thumb'))
+
+    def test_gc_keeps_derivatives_shared_with_a_live_cover(self):
+        live = make_book('9780000000417', image=cover_upload('blue', 'scan.jpg'))
+        orphan = make_book('9780000000424', image=cover_upload('blue', 'scan.jpeg'))
+        generate_derivatives(live.image.name)
+        derivatives = [derivative_name(live.image.name, kind, ext) for kind in DERIVATIVES for ext in FORMATS]
+        self.assertEqual(derivatives[0], derivative_name(orphan.image.name, 'thumb', 'jpg'))
+        stored = lambda names: [name for name in names if cover_storage().exists(name)]
+
+        orphan.delete()
+        call_command('gc_covers', min_age=0, stdout=io.StringIO())
+        self.assertEqual(stored([orphan.image.name, live.image.name]), [live.image.name])
+        self.assertEqual(stored(derivatives), derivatives)
+
+        live.delete()
+        call_command('gc_covers', min_age=0, stdout=io.StringIO())
+        self.assertEqual(stored([live.image.name, *derivatives]), [])
+
+
+def marc_record(isbn, title, author='Marc Author', year='1999'):
+    """One binary MARC 21 record with the fields the importer reads."""
+    fields = [
+        ('008', '000000s%s    xx            000 0 eng d' % year),
+        ('020', '  \x1fa%s' % isbn),
+        ('100', '1 \x1fa%s,' % author),
+        ('245', '10\x1fa%s /' % title),
+    ]
+    directory, data = b'', b''
+    for tag, value in fields:
+        encoded = value.encode('utf-8') + b'\x1e'
+        directory += tag.encode() + b'%04d%05d' % (len(encoded), len(data))
+        data += encoded
+    directory += b'\x1e'
+    base = 24 + len(directory)
+    return b'%05dnam a22%05d   4500' % (base + len(data) + 1, base) + directory + data + b'\x1d'
+
+
+class ImportTests(TestCase):
+    """import_books reports bad records without stopping, and resumes where it stopped."""
+
+    def setUp(self):
+        get_stats()
+        tmp = TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.tmp = Path(tmp.name)
+        self.announced = []
+        receiver = lambda sender, book_ids, **kwargs: self.announced.extend(book_ids)
+        books_imported.connect(receiver, sender=Book, weak=False)
+        self.addCleanup(books_imported.disconnect, receiver, sender=Book)
+
+    def run_import(self, name, content, *args):
+        path = self.tmp / name
+        path.write_bytes(content)
+        stdout, stderr = io.StringIO(), io.StringIO()
+        call_command('import_books', str(path), *args, stdout=stdout, stderr=stderr)
+        return path, stdout.getvalue(), stderr.getvalue()
+
+    def test_csv_bad_records_reported(self):
+        content = (
+            'isbn,title,author,published_date,available_copies\n'
+            '9780000000601,Atlas,Ann,2001-02-03,2\n'
+            '9780000000618,,Ann,2001,1\n'
+            '9780000000625,Bad \xff bytes,Ann,2001,1\n'
+            '12345,Short,Ann,2001,1\n'
+            '9780000000632,Botany,Bea,1999,1\n'
+        ).encode('latin-1')
+        _path, stdout, stderr = self.run_import('books.csv', content)
+        self.assertEqual(sorted(Book.objects.values_list('title', flat=True)), ['Atlas', 'Botany'])
+        self.assertIn('Record 2: title is required', stderr)
+        self.assertIn('Record 3: title is not valid UTF-8', stderr)
+        self.assertIn("Record 4: invalid ISBN '12345'", stderr)
+        self.assertIn('2 created, 0 updated, 3 invalid', stdout)
+        self.assertEqual(sorted(self.announced), sorted(Book.objects.values_list('id', flat=True)))
+        self.assertEqual(get_stats().total_books, 2)
+
+    def test_csv_unparseable_row_fails_only_itself(self):
+        content = (
+            'isbn,title,author,published_date,available_copies\n'
+            f'9780000000601,"{"x" * (csv.field_size_limit() + 1)}",Ann,2001,1\n'
+            '9780000000632,Botany,Bea,1999,1\n'
+        ).encode()
+        _path, stdout, stderr = self.run_import('books.csv', content)
+        self.assertEqual(list(Book.objects.values_list('title', flat=True)), ['Botany'])
+        self.assertIn('Record 1: malformed CSV row: field larger than field limit', stderr)
+        self.assertIn('1 created, 0 updated, 1 invalid', stdout)
+
+    def test_jsonl_non_object_fails_only_itself(self):
+        content = (
+            '[1, 2]\n"x"\nnot json\n'
+            '{"isbn": "9780000000632", "title": "Botany", "author": "Bea", "published_date": "1999"}\n'
+        ).encode()
+        _path, stdout, stderr = self.run_import('books.jsonl', content)
+        self.assertEqual(list(Book.objects.values_list('title', flat=True)), ['Botany'])
+        self.assertIn('Record 1: expected a JSON object, got list', stderr)
+        self.assertIn('Record 2: expected a JSON object, got str', stderr)
+        self.assertIn('Record 3: invalid JSON', stderr)
+        self.assertIn('1 created, 0 updated, 3 invalid', stdout)
+
+    def test_malformed_marc_records_are_skipped(self):
+        good = marc_record('9780000000649', 'Chess')
+        bad_leader = b'x' * 24 + b'garbage\x1d'
+        bad_directory = marc_record('9780000000656', 'Dune')
+        bad_directory = bad_directory[:24] + b'0\xff\xfe' + bad_directory[27:]
+        content = good + bad_leader + bad_directory + marc_record('9780000000663', 'Emma')
+        _path, stdout, stderr = self.run_import('books.mrc', content)
+
+        self.assertEqual(sorted(Book.objects.values_list('title', flat=True)), ['Chess', 'Emma'])
+        self.assertEqual(Book.objects.get(title='Chess').author, 'Marc Author')
+        self.assertIn('Record 2: malformed MARC leader', stderr)
+        self.assertIn('Record 3: malformed MARC record', stderr)
+        self.assertIn('2 created, 0 updated, 2 invalid', stdout)
+
+    def test_resume_announces_books_written_before_the_crash(self):
+        rows = ['9780000000670,Fable,Ann,2000-01-01,1', '9780000000687,Gone,Ann,2000-01-01,1',
+                '9780000000694,Haze,Ann,2000-01-01,1', '9780000000700,Iris,Ann,2000-01-01,1']
+        path = self.tmp / 'books.csv'
+        path.write_text('isbn,title,author,published_date,available_copies\n' + '\n'.join(rows) + '\n')
+        # The interrupted run finished the first chunk and wrote the second
+        # one, but crashed before announcing it and saving the checkpoint
+        written = [make_book(isbn, copies=1, title=title, author='Ann', category='Other', description='')
+                   for isbn, title, *_rest in (row.split(',') for row in rows)]
+        Checkpoint(path).save(2, ImportResult(created=2))
+
+        stdout = io.StringIO()
+        call_command('import_books', str(path), chunk_size=2, stdout=stdout, stderr=io.StringIO())
+        self.assertIn('Resuming after record 2.', stdout.getvalue())
+        self.assertEqual(sorted(self.announced), [book.id for book in written[2:]])
+        self.assertFalse(Checkpoint(path).path.exists())
+
+
+class SeedTests(TestCase):
+    def test_seeded_data_is_consistent(self):
+        result = seed(books=50, members=10, transactions=400, requests=40, seed=2)
+        self.assertEqual(Book.objects.count(), 50)
+        self.assertEqual(Transaction.objects.count(), result.transactions)
+        self.assertEqual(Transaction.objects.filter(status='Issued').count(), result.open_loans)
+        self.assertFalse(Book.objects.filter(available_copies__lt=0).exists())
+        stats = get_stats()
+        for name, value in compute_stats().items():
+            self.assertEqual(getattr(stats, name), value, name)
+        self.assertEqual(sum(Member.objects.values_list('total_loans', flat=True)), result.transactions)
+        self.assertEqual(sum(Book.objects.values_list('borrow_count', flat=True)), result.transactions)
+
+    def test_generated_dates_are_kept(self):
+        seed(books=20, members=5, transactions=200, requests=30, years=2, seed=3)
+        today = timezone.now().date()
+        dates = set(Transaction.objects.values_list('issue_date', flat=True))
+        self.assertGreater(len(dates), 20)
+        self.assertLess(min(dates), today - datetime.timedelta(days=30))
+        self.assertFalse(Transaction.objects.filter(return_date__lt=F('issue_date')).exists())
+        self.assertGreater(BookRequest.objects.values('request_date').distinct().count(), 20)
+        self.assertTrue(Transaction._meta.get_field('issue_date').auto_now_add)
+
+
+class QueryBudgetTests(TestCase):
+    """Admin views must stay within the query budgets in Admin/query_budgets.json."""
+
+    @classmethod
+    def setUpTestData(cls):
+        seed(books=60, members=15, transactions=300, requests=30, seed=1)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_admin_views_within_budget(self):
+        budgets = load_budgets()
+        results = run(iterations=1, cases=cases_for('Admin'), budgets=budgets)
+        for result in results:
+            with self.subTest(result.key):
+                self.assertIn(result.key, budgets, 'record it with manage.py benchmark_views --record')
+                self.assertLessEqual(result.queries, result.budget)
@@ -22,11 +22,16 @@ urlpatterns = [
     path('transactions/', views.transactions, name="transactions"),
     path('transactions/issue/', views.issue_book, name="issue_book"),
     path('transactions/return/<int:id>/', views.return_book, name="admin_return_book"),
+    path('transactions/check-in/', views.check_in_books, name="check_in"),
     path('transactions/delete/<int:id>/', views.delete_transaction, name="delete_transaction"),
     
     # Book Requests
     path('book-requests/', views.book_requests, name="book_requests"),
     path('book-requests/approve/<int:id>/', views.approve_request, name="approve_request"),
     path('book-requests/reject/<int:id>/', views.reject_request, name="reject_request"),
-    path('book-requests/delete/<int:id>/', views.delete_request, name="delete_request")
+    path('book-requests/bulk/', views.bulk_requests, name="bulk_requests"),
+    path('book-requests/delete/<int:id>/', views.delete_request, name="delete_request"),
+
+    # Exports (CSV / JSON Lines)
+    path('export/<str:kind>/', views.export, name="export"),
 ]
@@ -1,22 +1,40 @@
+import os
+
+from django.conf import settings
 from django.utils import timezone
 from django.shortcuts import get_object_or_404, redirect, render
+from django.views.static import serve
 from django.contrib import messages
+from django.contrib.admin.views.decorators import staff_member_required
+from django.db import IntegrityError
 from django.db.models import Q
-
-from Admin.models import Book, Member, Transaction, BookRequest
+from django.http import Http404, HttpResponseBadRequest, StreamingHttpResponse
+
+from Admin.circulation import (
+    ALREADY_ISSUED_NOTE, CHECK_IN_MODES, NO_STOCK_NOTE, approve_requests, check_in, parse_identifiers,
+    reject_requests,
+)
+from Admin.conditional import catalog_condition
+from Admin.db import writer
+from Admin.exports import EXPORTS, FORMATS as EXPORT_FORMATS, encode, export_rows, parse_date
+from Admin.models import Book, Member, Transaction, BookRequest, BookUnavailable, ConcurrentUpdate
+from Admin.pagination import paginate
+from Admin.search import search_books, search_ordering
+from Admin.stats import get_stats
+from Admin.storage import COVERS_DIR
 
 # Create your views here.
+@catalog_condition
 def admin(request):
     search_query = request.GET.get('search', '')
     books = Book.objects.all()
+    ordering = ('title', 'id')
     
     if search_query:
-        books = books.filter(
-            Q(title__icontains=search_query) |
-            Q(author__icontains=search_query) |
-            Q(isbn__icontains=search_query)
-        )
+        books = search_books(search_query, books)
+        ordering = search_ordering()
     
+    books = paginate(request, books, ordering)
     return render(request, 'admin.html', {'books': books, 'search_query': search_query})
   
 
@@ -79,37 +97,34 @@ def update(request, id):
     return render(request, 'update.html', {'book': book})
 
 def dashboard(request):
-    total_books = Book.objects.count()
-    total_members = Member.objects.count()
-    issued_books = Transaction.objects.filter(status="Issued").count()
-    returned_books = Transaction.objects.filter(status="Returned").count()
-    total_transactions = Transaction.objects.count()
-    pending_requests = BookRequest.objects.filter(status="Pending").count()
+    # Counters are maintained incrementally in the LibraryStats row
+    stats = get_stats()
     
     # Calculate return rate
     return_rate = 0
-    if total_transactions > 0:
-        return_rate = (returned_books / total_transactions) * 100
+    if stats.total_transactions > 0:
+        return_rate = (stats.returned_books / stats.total_transactions) * 100
     
     # Recent transactions
-    recent_transactions = Transaction.objects.all().order_by('-issue_date')[:5]
+    recent_transactions = Transaction.objects.select_related('member', 'book').only(
+        'status', 'member__full_name', 'book__title'
+    ).order_by('-issue_date', '-id')[:5]
     
     # Recent pending requests
-    recent_requests = BookRequest.objects.filter(status="Pending").order_by('-request_date')[:5]
+    recent_requests = BookRequest.objects.filter(status="Pending").select_related('member', 'book').only(
+        'request_date', 'member__full_name', 'book__title'
+    ).order_by('-request_date', '-id')[:5]
     
-    # Books with low stock (less than 5 copies)
-    low_stock_books = Book.objects.filter(available_copies__lt=5).count()
-
     context = {
-        'total_books': total_books,
-        'total_members': total_members,
-        'issued_books': issued_books,
-        'returned_books': returned_books,
-        'total_transactions': total_transactions,
+        'total_books': stats.total_books,
+        'total_members': stats.total_members,
+        'issued_books': stats.issued_books,
+        'returned_books': stats.returned_books,
+        'total_transactions': stats.total_transactions,
         'recent_transactions': recent_transactions,
-        'low_stock_books': low_stock_books,
+        'low_stock_books': stats.low_stock_books,
         'return_rate': return_rate,
-        'pending_requests': pending_requests,
+        'pending_requests': stats.pending_requests,
         'recent_requests': recent_requests,
     }
     return render(request, 'dashboard.html', context)
@@ -126,6 +141,7 @@ def members(request):
             Q(phone__icontains=search_query)
         )
     
+    all_members = paginate(request, all_members, ('id',))
     return render(request, 'members.html', {'members': all_members, 'search_query': search_query})
 
 
@@ -181,11 +197,8 @@ def issue_book(request):
             book = Book.objects.get(id=book_id)
             member = Member.objects.get(id=member_id)
 
-            if book.available_copies <= 0:
-                messages.error(request, 'No copies available for this book!')
-                return redirect('issue_book')
-
-            # Create transaction - the model's save method will handle copy reduction
+            # Create transaction - the model's save method takes the copy
+            # atomically and raises BookUnavailable if none is left
             Transaction.objects.create(
                 member=member,
                 book=book,
@@ -194,6 +207,13 @@ def issue_book(request):
 
             messages.success(request, f'Book "{book.title}" issued to {member.full_name} successfully!')
             return redirect('transactions')
+        except BookUnavailable:
+            messages.error(request, 'No copies available for this book!')
+            return redirect('issue_book')
+        except IntegrityError:
+            # unique_open_loan: the member already holds this book
+            messages.warning(request, 'Member already has this book issued.')
+            return redirect('issue_book')
         except Exception as e:
             messages.error(request, f'Error issuing book: {str(e)}')
 
@@ -204,7 +224,11 @@ def transactions(request):
     search_query = request.GET.get('search', '')
     status_filter = request.GET.get('status', '')
     
-    all_transactions = Transaction.objects.all().order_by('-issue_date')
+    all_transactions = Transaction.objects.select_related('member', 'book').only(
+        'issue_date', 'return_date', 'status',
+        'member__full_name', 'member__email',
+        'book__title', 'book__author',
+    )
     
     if search_query:
         all_transactions = all_transactions.filter(
@@ -216,6 +240,7 @@ def transactions(request):
     if status_filter:
         all_transactions = all_transactions.filter(status=status_filter)
     
+    all_transactions = paginate(request, all_transactions, ('-issue_date', '-id'))
     return render(request, 'transactions.html', {
         'transactions': all_transactions,
         'search_query': search_query,
@@ -223,11 +248,10 @@ def transactions(request):
     })
 
 def return_book(request, id):
-    t = get_object_or_404(Transaction, id=id)
+    t = get_object_or_404(Transaction.objects.select_related('book'), id=id)
 
-    if t.status == "Issued":
-        # Use the model's mark_returned method which handles everything
-        t.mark_returned()
+    # Use the model's mark_returned method which handles everything
+    if t.mark_returned():
         messages.success(request, f'Book "{t.book.title}" returned successfully!')
     else:
         messages.warning(request, 'This book has already been returned.')
@@ -235,15 +259,48 @@ def return_book(request, id):
     return redirect('transactions')
 
 
-def delete_transaction(request, id):
-    t = get_object_or_404(Transaction, id=id)
+def check_in_books(request):
+    """Batch check-in: return every scanned ISBN or transaction id at once"""
+    results = []
+    identifiers_text = ''
+    by = request.POST.get('by', 'isbn')
     
-    # If transaction is issued, restore the book copy
-    if t.status == "Issued":
-        t.book.available_copies += 1
-        t.book.save()
+    if request.method == 'POST':
+        identifiers_text = request.POST.get('identifiers', '')
+        identifiers = parse_identifiers(identifiers_text)
+        
+        if by not in CHECK_IN_MODES:
+            messages.error(request, 'Please choose whether to check in by ISBN or by transaction id.')
+            by = 'isbn'
+        elif not identifiers:
+            messages.warning(request, 'Please scan or enter at least one ISBN or transaction id.')
+        else:
+            try:
+                results = check_in(identifiers, by=by)
+                returned = sum(1 for item in results if item['status'] == 'returned')
+                messages.success(request, f'{returned} of {len(results)} item(s) checked in.')
+                identifiers_text = ''
+            except ConcurrentUpdate as e:
+                messages.error(request, f'Error checking in books: {str(e)} Nothing was changed.')
     
-    t.delete()
+    return render(request, 'check_in.html', {
+        'results': results,
+        'identifiers_text': identifiers_text,
+        'by': by,
+    })
+
+
+def delete_transaction(request, id):
+    with writer():
+        # Read the status under the write lock, so a return that commits
+        # meanwhile cannot put the copy back a second time
+        t = get_object_or_404(Transaction.objects.select_for_update().select_related('book'), id=id)
+        
+        # If transaction is issued, restore the book copy
+        if t.status == "Issued":
+            t._low_stock_delta = t.book.return_copy()
+        
+        t.delete()
     messages.success(request, 'Transaction deleted successfully!')
     return redirect('transactions')
 
@@ -252,35 +309,33 @@ def book_requests(request):
     """View all book requests"""
     status_filter = request.GET.get('status', 'Pending')
     
-    requests = BookRequest.objects.all().order_by('-request_date')
+    requests = BookRequest.objects.select_related('member', 'book').only(
+        'request_date', 'status', 'admin_notes',
+        'member__full_name', 'member__email',
+        'book__title', 'book__author', 'book__available_copies',
+    )
     
     if status_filter:
         requests = requests.filter(status=status_filter)
     
+    requests = paginate(request, requests, ('-request_date', '-id'))
+    
     context = {
         'requests': requests,
         'status_filter': status_filter,
-        'pending_count': BookRequest.objects.filter(status='Pending').count(),
+        'pending_count': get_stats().pending_requests,
     }
     return render(request, 'book_requests.html', context)
 
 
 def approve_request(request, id):
     """Approve a book request and create transaction"""
-    book_request = get_object_or_404(BookRequest, id=id)
+    book_request = get_object_or_404(BookRequest.objects.select_related('member', 'book'), id=id)
     
     if book_request.status != 'Pending':
         messages.warning(request, 'This request has already been processed.')
         return redirect('book_requests')
     
-    # Check if book is still available
-    if book_request.book.available_copies <= 0:
-        messages.error(request, 'Book is no longer available. Cannot approve request.')
-        book_request.status = 'Rejected'
-        book_request.admin_notes = 'Book no longer available'
-        book_request.save()
-        return redirect('book_requests')
-    
     # Check if member already has this book issued
     existing_transaction = Transaction.objects.filter(
         member=book_request.member,
@@ -290,25 +345,27 @@ def approve_request(request, id):
     
     if existing_transaction:
         messages.warning(request, 'Member already has this book issued.')
-        book_request.status = 'Rejected'
-        book_request.admin_notes = 'Member already has this book issued'
-        book_request.save()
+        book_request.resolve('Rejected', 'Member already has this book issued')
         return redirect('book_requests')
     
     try:
-        # Create transaction
-        transaction = Transaction.objects.create(
-            member=book_request.member,
-            book=book_request.book,
-            status='Issued',
-            book_request=book_request
-        )
-        
-        # Update request status
-        book_request.status = 'Approved'
-        book_request.save()
+        # Request status, transaction and stock are committed as one unit
+        with writer():
+            if not book_request.resolve('Approved'):
+                messages.warning(request, 'This request has already been processed.')
+                return redirect('book_requests')
+            
+            Transaction.objects.create(
+                member=book_request.member,
+                book=book_request.book,
+                status='Issued',
+                book_request=book_request
+            )
         
         messages.success(request, f'Request approved! Book "{book_request.book.title}" issued to {book_request.member.full_name}.')
+    except BookUnavailable:
+        messages.error(request, 'Book is no longer available. Cannot approve request.')
+        book_request.resolve('Rejected', 'Book no longer available')
     except Exception as e:
         messages.error(request, f'Error approving request: {str(e)}')
     
@@ -317,7 +374,7 @@ def approve_request(request, id):
 
 def reject_request(request, id):
     """Reject a book request"""
-    book_request = get_object_or_404(BookRequest, id=id)
+    book_request = get_object_or_404(BookRequest.objects.select_related('member', 'book'), id=id)
     
     if book_request.status != 'Pending':
         messages.warning(request, 'This request has already been processed.')
@@ -325,15 +382,55 @@ def reject_request(request, id):
     
     if request.method == 'POST':
         admin_notes = request.POST.get('admin_notes', '')
-        book_request.status = 'Rejected'
-        book_request.admin_notes = admin_notes
-        book_request.save()
-        messages.success(request, 'Request rejected successfully.')
+        if book_request.resolve('Rejected', admin_notes):
+            messages.success(request, 'Request rejected successfully.')
+        else:
+            messages.warning(request, 'This request has already been processed.')
         return redirect('book_requests')
     
     return render(request, 'reject_request.html', {'book_request': book_request})
 
 
+def bulk_requests(request):
+    """Approve or reject a batch of selected book requests"""
+    if request.method != 'POST':
+        return redirect('book_requests')
+    
+    request_ids = [rid for rid in request.POST.getlist('request_ids') if rid.isdigit()]
+    action = request.POST.get('action')
+    # "books" widens the selection to every pending request for those books
+    whole_books = request.POST.get('scope') == 'books'
+    
+    if not request_ids:
+        messages.warning(request, 'Please select at least one request.')
+        return redirect('book_requests')
+    
+    try:
+        if action == 'approve':
+            result = approve_requests(request_ids, whole_books=whole_books)
+            messages.success(request, f'{len(result.approved)} request(s) approved and issued.')
+            if result.rejected_count:
+                messages.warning(
+                    request,
+                    f'{result.rejected_count} request(s) rejected: '
+                    f'{result.rejected_for(NO_STOCK_NOTE)} out of stock, '
+                    f'{result.rejected_for(ALREADY_ISSUED_NOTE)} already issued to the member.'
+                )
+        elif action == 'reject':
+            result = reject_requests(
+                request_ids,
+                admin_notes=request.POST.get('admin_notes', ''),
+                whole_books=whole_books
+            )
+            messages.success(request, f'{result.rejected_count} request(s) rejected.')
+        else:
+            messages.error(request, 'Unknown bulk action.')
+    except (ConcurrentUpdate, IntegrityError) as e:
+        messages.error(request, f'Error processing requests: {str(e)} Nothing was changed.')
+    
+    return redirect('book_requests')
+
+
 def delete_request(request, id):
     """Delete a book request"""
     book_request = get_object_or_404(BookRequest, id=id)
@@ -342,3 +439,45 @@ def delete_request(request, id):
     return redirect('book_requests')
 
 
+@staff_member_required
+def export(request, kind):
+    """
+    Stream a CSV or JSON Lines export of loans, members or books.
+
+    Staff only: the exports hold every member's contact details.
+
+    Query parameters: ``format`` (csv or jsonl), ``status`` (loans only) and
+    ``from`` / ``to`` ISO dates.
+    """
+    if kind not in EXPORTS:
+        raise Http404('Unknown export.')
+    file_format = request.GET.get('format', 'csv')
+    if file_format not in EXPORT_FORMATS:
+        return HttpResponseBadRequest('format must be csv or jsonl.')
+    try:
+        names, rows = export_rows(
+            kind,
+            status=request.GET.get('status'),
+            date_from=parse_date(request.GET.get('from')),
+            date_to=parse_date(request.GET.get('to')),
+        )
+    except ValueError as e:
+        return HttpResponseBadRequest(str(e))
+
+    response = StreamingHttpResponse(encode(names, rows, file_format), content_type=EXPORT_FORMATS[file_format])
+    filename = f'{kind}-{timezone.now().date()}.{file_format}'
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+
+def serve_cover(request, path):
+    """
+    Serve a content-addressed cover (or one of its derivatives).
+
+    The file name is a hash of the contents, so browsers and proxies may
+    keep it forever. In production the web server serves /media/ itself and
+    should send the same header (see the README).
+    """
+    response = serve(request, path, document_root=os.path.join(settings.MEDIA_ROOT, COVERS_DIR))
+    response['Cache-Control'] = 'public, max-age=31536000, immutable'
+    return response
@@ -49,6 +49,7 @@ MIDDLEWARE = [
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
+    'User.middleware.MemberMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
@@ -75,13 +76,54 @@ WSGI_APPLICATION = 'LMS.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
+# WAL lets readers run alongside the single writer; see Admin/db.py for how
+# reads and writes are split between the two aliases. journal_mode is stored
+# in the database file itself: db.sqlite3 is committed already in WAL mode,
+# so opening it does not rewrite its header, and the -wal/-shm files SQLite
+# keeps next to it are ignored by git.
+SQLITE_PRAGMAS = (
+    'PRAGMA journal_mode=WAL;'
+    'PRAGMA synchronous=NORMAL;'
+    'PRAGMA cache_size=-16000;'
+    'PRAGMA temp_store=MEMORY;'
+    'PRAGMA mmap_size=134217728'
+)
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
-    }
+        'CONN_MAX_AGE': 600,
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            'init_command': SQLITE_PRAGMAS,
+            # Take the write lock when a transaction starts instead of
+            # failing to upgrade a read lock halfway through it
+            'transaction_mode': 'IMMEDIATE',
+            # Seconds to wait for the write lock (busy_timeout)
+            'timeout': 20,
+        },
+    },
+    'readonly': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'db.sqlite3',
+        'CONN_MAX_AGE': 600,
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            'init_command': SQLITE_PRAGMAS + ';PRAGMA query_only=ON',
+            'timeout': 20,
+        },
+        'TEST': {'MIRROR': 'default'},
+    },
 }
 
+DATABASE_ROUTERS = ['Admin.db.ReadWriteRouter']
+
+# Threads that run the ORM work of async views (Admin.db.in_worker_thread),
+# each keeping its own connections. 0 runs it on the caller's thread, as the
+# tests and the view benchmark do: their data is in an uncommitted transaction.
+DB_WORKER_THREADS = 8
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -123,6 +165,26 @@ STATICFILES_DIRS = [BASE_DIR / 'static']
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 MEDIA_URL = '/media/'
 
+# Recommendation indexes (built by management commands, see User/similarity.py)
+SIMILARITY_INDEX_PATH = BASE_DIR / 'var' / 'similar_books.npz'
+COBORROW_INDEX_PATH = BASE_DIR / 'var' / 'coborrow.npz'
+
+# Tests write indexes and media to a temporary directory instead
+TEST_RUNNER = 'LMS.test_runner.TestRunner'
+
+# Chatbot answers kept per process (see User/answer_cache.py)
+CHATBOT_CACHE_SIZE = 1024
+
+# Rendered book pages (see User/book_pages.py). Entries are keyed on the
+# catalog version stored in the database, so a per-process cache never serves
+# a stale page; a shared backend such as Memcached or Redis only saves each
+# server process rendering its own copy.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+
 # Login URLs
 LOGIN_URL = '/user/login/'
 LOGIN_REDIRECT_URL = '/user/'
@@ -0,0 +1,34 @@
+"""
+Test runner that keeps the test suite's files out of the project tree.
+
+The recommendation indexes and uploaded media are written to a temporary
+directory for the whole run, so tests never read or overwrite the indexes
+and covers of the development database. Async views run their ORM work on
+the calling thread, inside the test's transaction.
+"""
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+
+class TestRunner(DiscoverRunner):
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self._files = TemporaryDirectory(prefix='lms-test-')
+        root = Path(self._files.name)
+        self._settings = override_settings(
+            SIMILARITY_INDEX_PATH=root / 'var' / 'similar_books.npz',
+            COBORROW_INDEX_PATH=root / 'var' / 'coborrow.npz',
+            MEDIA_ROOT=str(root / 'media'),
+            # Test data is uncommitted, so worker threads could not see it
+            DB_WORKER_THREADS=0,
+        )
+        self._settings.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self._settings.disable()
+        self._files.cleanup()
+        super().teardown_test_environment(**kwargs)
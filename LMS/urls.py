@@ -15,7 +15,7 @@ Including another URLconf
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
 from django.contrib import admin
-from django.urls import path, include
+from django.urls import path, include, re_path
 from django.conf import settings
 from django.conf.urls.static import static
 
@@ -28,4 +28,8 @@ urlpatterns = [
 
 # Serve media files during development
 if settings.DEBUG:
+    from Admin.views import serve_cover
+    urlpatterns += [
+        re_path(r'^%scovers/(?P<path>.*)$' % settings.MEDIA_URL.lstrip('/'), serve_cover),
+    ]
     urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
@@ -0,0 +1,64 @@
+"""
+Response cache for the chatbot endpoint.
+
+Answers are cached per process as the finished JSON payload, so a hit skips
+the ORM, the recommendation indexes and image URL building. Entries are
+keyed by the normalised query. Personalised intents also key on the user,
+since for a signed-in user they depend on their history. Each entry is
+stamped with ``LibraryStats.catalog_version``, which changes on every Book or
+Transaction write, and is treated as a miss once the version has moved on.
+The least recently used entry is evicted once ``CHATBOT_CACHE_SIZE`` is
+reached.
+"""
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+
+# Intents whose answer depends on who is asking
+PERSONAL_INTENTS = frozenset({'recommend'})
+
+
+class AnswerCache:
+    """A thread-safe LRU mapping of key -> (catalog version, payload)."""
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, version):
+        """Return the cached payload, or None if missing or stale."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] != version:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key, version, payload):
+        with self._lock:
+            self._entries[key] = (version, payload)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+def cache_key(parsed, user):
+    """Key for a parsed query asked by ``user``."""
+    query = ' '.join(parsed.text.lower().split())
+    personal = parsed.intent in PERSONAL_INTENTS and user.is_authenticated
+    return (query, user.pk if personal else None)
+
+
+answer_cache = AnswerCache(settings.CHATBOT_CACHE_SIZE)
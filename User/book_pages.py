@@ -0,0 +1,74 @@
+"""
+Cached book detail pages.
+
+Everything on a book's page except the signed-in member's loan/request
+status is the same for every visitor. That part is rendered once per book and
+kept in the cache along with the few book fields the rest of the page needs,
+so serving a hit never loads the Book. The catalog version it was rendered
+at doubles as the page's ETag.
+
+Pages are keyed on ``LibraryStats.catalog_version``, which every write to a
+book, its stock or its loans moves on in the database, whichever process
+makes it (the server, ``import_books``, ``seed_lms``...). Nothing has to be
+invalidated: a page of an older version is simply never asked for again and
+ages out of the cache. A request reads the version before it loads the book,
+so if a write commits while it renders, its page is stored under a version
+nobody reads any more instead of replacing the fresh one.
+"""
+from django.core.cache import cache
+from django.template.loader import render_to_string
+
+from Admin.conditional import catalog_state
+from Admin.models import Book, LibraryStats
+
+CACHE_TIMEOUT = 60 * 60
+
+# Where book_info.html leaves room for the member's status
+STATUS_SLOT = '<!-- member status -->'
+
+
+def cache_key(book_id, version):
+    return f'book_page:{book_id}:{version}'
+
+
+def book_page_for(request, book_id):
+    """get_book_page() read at most once per request (ETag, Last-Modified and view)."""
+    if not hasattr(request, '_book_pages'):
+        request._book_pages = {}
+    if book_id not in request._book_pages:
+        request._book_pages[book_id] = get_book_page(book_id, catalog_state(request))
+    return request._book_pages[book_id]
+
+
+def get_book_page(book_id, state=None):
+    """
+    Return the cached page parts of a book, rendering them on a miss.
+
+    ``state`` is the ``(catalog_version, catalog_modified)`` pair to serve,
+    read from LibraryStats when not given.
+
+    Returns:
+        Dict with ``id``, ``title``, ``available_copies``, the rendered
+        HTML ``before`` and ``after`` the status slot and the catalog
+        ``version`` and ``modified`` time it was rendered at, or None if
+        there is no such book
+    """
+    version, modified = state or LibraryStats.catalog_state()
+    key = cache_key(book_id, version)
+    page = cache.get(key)
+    if page is None:
+        book = Book.objects.filter(pk=book_id).first()
+        if book is None:
+            return None
+        before, after = render_to_string('user/book_info.html', {'book': book}).split(STATUS_SLOT)
+        page = {
+            'id': book.id,
+            'title': book.title,
+            'available_copies': book.available_copies,
+            'before': before,
+            'after': after,
+            'version': version,
+            'modified': modified,
+        }
+        cache.set(key, page, CACHE_TIMEOUT)
+    return page
@@ -2,63 +2,41 @@
 Smart Book Recommendation Chatbot
 Handles various types of book recommendation queries
 """
-from django.db.models import Q, Count
-from Admin.models import Book, Transaction, Member
+from django.db.models import Q
+from Admin.models import Book, LoanHistory, Member
+from Admin.search import search_books
+from .coborrow import recommend_for_member
+from .intents import ParsedQuery, parse_query
+from .similarity import similar_books
 
 
 class BookRecommendationChatbot:
     """Chatbot for book recommendations"""
     
-    def __init__(self, user=None):
-        self.user = user
-        self.member = None
-        if user and user.is_authenticated:
-            from .utils import get_or_create_member
-            self.member = get_or_create_member(user)
+    def __init__(self, member=None):
+        # The asking user's Member (request.member), or None for anonymous users
+        self.member = member
     
     def process_query(self, query):
-        """Process user query and return recommendations"""
-        query_lower = query.lower().strip()
-        
-        # Similar book recommendations
-        if any(keyword in query_lower for keyword in ['similar', 'like', 'same as', 'recommend like']):
-            return self._find_similar_books(query)
-        
-        # Most borrowed books by category
-        elif any(keyword in query_lower for keyword in ['most borrowed', 'popular', 'top', 'best']):
-            return self._find_most_borrowed_by_category(query)
-        
-        # Beginner recommendations
-        elif any(keyword in query_lower for keyword in ['beginner', 'start', 'learn', 'introduction', 'intro']):
-            return self._find_beginner_books(query)
-        
-        # Personalized recommendations
-        elif any(keyword in query_lower for keyword in ['recommend', 'suggest', 'what should', 'what can']):
-            if self.member:
-                return self._personalized_recommendations(query)
-            else:
-                return self._general_recommendations(query)
-        
-        # Category-based search
-        elif any(category.lower() in query_lower for category in [cat[0] for cat in Book.CATEGORY_CHOICES]):
-            return self._find_by_category(query)
-        
-        # Author search
-        elif 'author' in query_lower or 'by' in query_lower:
-            return self._find_by_author(query)
-        
+        """Process user query (text or a ParsedQuery) and return recommendations"""
+        parsed = query if isinstance(query, ParsedQuery) else parse_query(query)
+        return self._handler_for(parsed)(parsed)
+    
+    def _handler_for(self, parsed):
+        handlers = {
+            'similar': self._find_similar_books,
+            'popular': self._find_most_borrowed_by_category,
+            'beginner': self._find_beginner_books,
+            'recommend': self._personalized_recommendations if self.member else self._general_recommendations,
+            'category': self._find_by_category,
+            'author': self._find_by_author,
+        }
         # Default: search by title/keywords
-        else:
-            return self._search_books(query)
+        return handlers.get(parsed.intent, self._search_books)
     
-    def _find_similar_books(self, query):
+    def _find_similar_books(self, parsed):
         """Find books similar to a given book"""
-        # Extract book title from query
-        query_words = query.lower().split()
-        
-        # Remove common words
-        stop_words = ['similar', 'to', 'like', 'same', 'as', 'recommend', 'suggest', 'book', 'books']
-        keywords = [word for word in query_words if word not in stop_words]
+        keywords = parsed.keywords
         
         if not keywords:
             return {
@@ -67,12 +45,11 @@ class BookRecommendationChatbot:
                 'books': []
             }
         
-        # Find the book user is referring to
-        book_query = Q()
-        for keyword in keywords:
-            book_query |= Q(title__icontains=keyword) | Q(author__icontains=keyword)
-        
-        reference_book = Book.objects.filter(book_query).first()
+        # Find the book user is referring to (best full-text match)
+        reference_book = (
+            search_books(' '.join(keywords)).first() or
+            search_books(' '.join(keywords), match_any=True).first()
+        )
         
         if not reference_book:
             return {
@@ -81,19 +58,15 @@ class BookRecommendationChatbot:
                 'books': []
             }
         
-        # Find similar books (same category, same author, or similar title)
-        similar_books = Book.objects.filter(
-            Q(category=reference_book.category) |
-            Q(author=reference_book.author) |
-            Q(title__icontains=keywords[0])
-        ).exclude(id=reference_book.id).filter(available_copies__gt=0)[:5]
+        # Find similar books by TF-IDF cosine similarity
+        books = similar_books(reference_book, limit=5)
         
-        if similar_books.exists():
+        if books:
             return {
                 'type': 'similar',
                 'message': f"Here are books similar to '{reference_book.title}' by {reference_book.author}:",
                 'reference_book': reference_book,
-                'books': list(similar_books)
+                'books': books
             }
         else:
             return {
@@ -103,77 +76,46 @@ class BookRecommendationChatbot:
                 'books': list(Book.objects.filter(available_copies__gt=0).exclude(id=reference_book.id)[:5])
             }
     
-    def _find_most_borrowed_by_category(self, query):
+    def _find_most_borrowed_by_category(self, parsed):
         """Find most borrowed books in a category"""
-        query_lower = query.lower()
-        
-        # Extract category from query
-        category = None
-        for cat_choice in Book.CATEGORY_CHOICES:
-            if cat_choice[0].lower() in query_lower or cat_choice[1].lower() in query_lower:
-                category = cat_choice[0]
-                break
-        
-        if not category:
-            # Try to infer category from keywords
-            category_mapping = {
-                'history': 'History',
-                'programming': 'Programming',
-                'tech': 'Technology',
-                'science': 'Science',
-                'fiction': 'Fiction',
-                'fantasy': 'Fantasy',
-                'mystery': 'Mystery',
-                'romance': 'Romance',
-            }
-            for key, cat in category_mapping.items():
-                if key in query_lower:
-                    category = cat
-                    break
+        category = parsed.category
         
         if category:
             # Get most borrowed books in this category
-            books = Book.objects.filter(category=category).annotate(
-                borrow_count=Count('transaction')
-            ).order_by('-borrow_count', '-available_copies')[:5]
+            books = self._popular_books(category=category)
             
-            if books.exists():
+            if books:
                 return {
                     'type': 'category',
                     'message': f"Here are the most borrowed books in the {category} category:",
                     'category': category,
-                    'books': list(books)
+                    'books': books
                 }
         
         # If no category found or no books, return general most borrowed
-        books = Book.objects.annotate(
-            borrow_count=Count('transaction')
-        ).order_by('-borrow_count', '-available_copies')[:5]
-        
         return {
             'type': 'category',
             'message': "Here are the most borrowed books in our library:",
             'category': 'All Categories',
-            'books': list(books)
+            'books': self._popular_books()
         }
     
-    def _find_beginner_books(self, query):
-        """Find beginner-friendly books"""
-        query_lower = query.lower()
-        
-        # Extract topic/category
-        topic = None
-        for cat_choice in Book.CATEGORY_CHOICES:
-            if cat_choice[0].lower() in query_lower:
-                topic = cat_choice[0]
-                break
-        
-        # Common beginner keywords
-        beginner_keywords = ['introduction', 'beginner', 'basics', 'fundamentals', 'getting started', 'learn']
-        
+    def _popular_books(self, category=None, available_only=False, limit=5):
+        """Top books by borrow_count, read straight off the popularity indexes"""
+        return list(self._popular_queryset(category, available_only, limit))
+    
+    def _popular_queryset(self, category=None, available_only=False, limit=5):
+        books = Book.objects.all()
+        if category:
+            books = books.filter(category=category)
+        if available_only:
+            books = books.filter(available_copies__gt=0)
+        return books.order_by('-borrow_count', '-available_copies')[:limit]
+    
+    def _beginner_queryset(self, topic=None):
         if topic:
             # Search for beginner books in that topic
-            books = Book.objects.filter(
+            return Book.objects.filter(
                 Q(category=topic) &
                 (Q(title__icontains='introduction') |
                  Q(title__icontains='beginner') |
@@ -182,18 +124,22 @@ class BookRecommendationChatbot:
                  Q(description__icontains='beginner') |
                  Q(description__icontains='introduction'))
             ).filter(available_copies__gt=0)[:5]
-            
-            if not books.exists():
-                # Fallback to any books in that category
-                books = Book.objects.filter(category=topic, available_copies__gt=0)[:5]
-        else:
-            # General beginner books
-            books = Book.objects.filter(
-                Q(title__icontains='introduction') |
-                Q(title__icontains='beginner') |
-                Q(title__icontains='basics') |
-                Q(description__icontains='beginner')
-            ).filter(available_copies__gt=0)[:5]
+        # General beginner books
+        return Book.objects.filter(
+            Q(title__icontains='introduction') |
+            Q(title__icontains='beginner') |
+            Q(title__icontains='basics') |
+            Q(description__icontains='beginner')
+        ).filter(available_copies__gt=0)[:5]
+    
+    def _find_beginner_books(self, parsed):
+        """Find beginner-friendly books"""
+        topic = parsed.category
+        books = self._beginner_queryset(topic)
+        
+        if topic and not books.exists():
+            # Fallback to any books in that category
+            books = Book.objects.filter(category=topic, available_copies__gt=0)[:5]
         
         if books.exists():
             topic_text = f" for {topic}" if topic else ""
@@ -209,75 +155,70 @@ class BookRecommendationChatbot:
                 'books': list(Book.objects.filter(available_copies__gt=0)[:5])
             }
     
-    def _personalized_recommendations(self, query):
+    def _personalized_recommendations(self, parsed):
         """Provide personalized recommendations based on user's borrowing history"""
         if not self.member:
-            return self._general_recommendations(query)
+            return self._general_recommendations(parsed)
         
         # Get user's borrowing history
-        user_transactions = Transaction.objects.filter(member=self.member)
+        user_transactions = LoanHistory.objects.filter(member=self.member)
         
         if not user_transactions.exists():
             return {
                 'type': 'personalized',
                 'message': "You haven't borrowed any books yet. Here are some popular recommendations to get you started:",
-                'books': list(Book.objects.annotate(
-                    borrow_count=Count('transaction')
-                ).order_by('-borrow_count', '-available_copies').filter(available_copies__gt=0)[:5])
+                'books': self._popular_books(available_only=True)
             }
         
-        # Get categories of books user has borrowed
+        # Books borrowed by members with overlapping histories
+        recommendations = recommend_for_member(self.member, limit=5)
+        if recommendations:
+            return {
+                'type': 'personalized',
+                'message': "Members who borrowed the same books as you also borrowed these:",
+                'books': recommendations
+            }
+        
+        # Not enough co-borrowing data: fall back to categories/authors read
         borrowed_categories = set()
         borrowed_authors = set()
-        for transaction in user_transactions:
-            borrowed_categories.add(transaction.book.category)
-            borrowed_authors.add(transaction.book.author)
+        for category, author in user_transactions.values_list('book__category', 'book__author').distinct():
+            borrowed_categories.add(category)
+            borrowed_authors.add(author)
         
         # Recommend books in similar categories or by same authors
-        recommendations = Book.objects.filter(
+        recommendations = list(Book.objects.filter(
             Q(category__in=borrowed_categories) |
             Q(author__in=borrowed_authors)
         ).exclude(
-            id__in=[t.book.id for t in user_transactions.filter(status='Issued')]
-        ).filter(available_copies__gt=0).distinct()[:5]
+            id__in=user_transactions.filter(status='Issued').values('book_id')
+        ).filter(available_copies__gt=0).distinct()[:5])
         
-        if recommendations.exists():
+        if recommendations:
             return {
                 'type': 'personalized',
                 'message': "Based on your reading history, here are some personalized recommendations:",
-                'books': list(recommendations)
+                'books': recommendations
             }
         else:
             # Fallback to popular books
             return {
                 'type': 'personalized',
                 'message': "Based on your preferences, here are some popular books you might like:",
-                'books': list(Book.objects.annotate(
-                    borrow_count=Count('transaction')
-                ).order_by('-borrow_count', '-available_copies').filter(available_copies__gt=0)[:5])
+                'books': self._popular_books(available_only=True)
             }
     
-    def _general_recommendations(self, query):
+    def _general_recommendations(self, parsed):
         """Provide general recommendations"""
-        books = Book.objects.annotate(
-            borrow_count=Count('transaction')
-        ).order_by('-borrow_count', '-available_copies').filter(available_copies__gt=0)[:5]
-        
         return {
             'type': 'general',
             'message': "Here are some popular book recommendations:",
-            'books': list(books)
+            'books': self._popular_books(available_only=True)
         }
     
-    def _find_by_category(self, query):
+    def _find_by_category(self, parsed):
         """Find books by category"""
-        query_lower = query.lower()
-        
-        category = None
-        for cat_choice in Book.CATEGORY_CHOICES:
-            if cat_choice[0].lower() in query_lower:
-                category = cat_choice[0]
-                break
+        category = parsed.category
         
         if category:
             books = Book.objects.filter(category=category, available_copies__gt=0)[:10]
@@ -294,19 +235,13 @@ class BookRecommendationChatbot:
             'books': []
         }
     
-    def _find_by_author(self, query):
+    def _find_by_author(self, parsed):
         """Find books by author"""
-        # Extract author name
-        query_words = query.lower().split()
-        stop_words = ['author', 'by', 'books', 'book', 'from']
-        keywords = [word for word in query_words if word not in stop_words]
+        # Prefer the words after "by" / "author"
+        keywords = parsed.author_terms or parsed.keywords
         
         if keywords:
-            author_query = Q()
-            for keyword in keywords:
-                author_query |= Q(author__icontains=keyword)
-            
-            books = Book.objects.filter(author_query, available_copies__gt=0)[:10]
+            books = self._author_queryset(keywords)
             
             if books.exists():
                 return {
@@ -321,21 +256,29 @@ class BookRecommendationChatbot:
             'books': []
         }
     
-    def _search_books(self, query):
+    def _author_queryset(self, keywords):
+        author_query = Q()
+        for keyword in keywords:
+            author_query |= Q(author__icontains=keyword)
+        return Book.objects.filter(author_query, available_copies__gt=0)[:10]
+    
+    def _search_queryset(self, query):
+        return search_books(
+            query,
+            Book.objects.filter(available_copies__gt=0),
+            match_any=True
+        )[:10]
+    
+    def _search_books(self, parsed):
         """General book search"""
-        query_words = query.lower().split()
-        
-        book_query = Q()
-        for word in query_words:
-            book_query |= Q(title__icontains=word) | Q(author__icontains=word) | Q(category__icontains=word)
-        
-        books = Book.objects.filter(book_query, available_copies__gt=0)[:10]
+        query = parsed.text
+        books = list(self._search_queryset(query))
         
-        if books.exists():
+        if books:
             return {
                 'type': 'search',
                 'message': f"Here are books matching '{query}':",
-                'books': list(books)
+                'books': books
             }
         
         return {
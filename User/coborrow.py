@@ -0,0 +1,357 @@
+"""
+Item-to-item "members who borrowed this also borrowed" recommender.
+
+The index is a sparse, symmetric book x book co-occurrence matrix: ``C[a, b]``
+is the number of members who borrowed both ``a`` and ``b``. It is stored in
+CSR form, one row of ``(neighbour, count)`` postings per book, keeping the
+``TOP_NEIGHBOURS`` strongest neighbours of each book. A member's candidates
+are scored by summing the cosine similarity
+``C[a, b] / sqrt(n_a * n_b)`` over the books ``a`` in their history, with one
+gather and one ``np.bincount`` call.
+
+``manage.py build_coborrow_index`` builds it in one streaming pass over
+LoanHistory (live and archived loans) and saves it to ``settings.COBORROW_INDEX_PATH``;
+requests never build it, and until it exists there are no recommendations.
+Loans made after the build (by any code path, including bulk approval) are
+folded in incrementally: before answering a query each process picks up
+transactions with a higher id than the last one it has seen.
+
+A loaded index is never modified. Catching up produces a new index, which
+replaces the process-wide one under the lock, so threads that are still
+scoring against the old one are not affected.
+"""
+import os
+import threading
+from collections import Counter, defaultdict
+from copy import copy
+from pathlib import Path
+
+import numpy as np
+from django.conf import settings
+
+from Admin.models import Book, LoanHistory
+
+# Only a member's most recent distinct books form pairs, so one heavy
+# borrower cannot add a quadratic number of pairs
+MAX_HISTORY = 100
+
+# Strongest neighbours kept per book
+TOP_NEIGHBOURS = 200
+
+# Merge the buffered pair keys into the running totals this often
+COMPACT_EVERY = 4_000_000
+
+
+def index_path():
+    return Path(settings.COBORROW_INDEX_PATH)
+
+
+def _pair_keys(columns):
+    """Keys ``lo << 32 | hi`` for every unordered pair of distinct columns."""
+    columns = np.sort(np.asarray(columns, dtype=np.int64))
+    lo, hi = np.triu_indices(len(columns), k=1)
+    return (columns[lo] << 32) | columns[hi]
+
+
+def _merge(keys, counts):
+    """Sum the counts of equal keys."""
+    keys, inverse = np.unique(keys, return_inverse=True)
+    return keys, np.bincount(inverse, weights=counts).astype(np.int32)
+
+
+class CoBorrowIndex:
+    """An immutable co-borrowing matrix plus the loans folded in since the build."""
+
+    def __init__(self, book_ids, borrowers, indptr, neighbours, counts, last_transaction_id, extra=None):
+        self.book_ids = book_ids            # column -> book id
+        self.borrowers = borrowers          # column -> distinct members
+        self.indptr = indptr                # column -> slice of neighbours/counts
+        self.neighbours = neighbours
+        self.counts = counts
+        self.last_transaction_id = int(last_transaction_id)
+        self.column_of = {int(book_id): column for column, book_id in enumerate(book_ids)}
+        self.extra = extra or {}            # column -> Counter({column: count}) since the build
+
+    # -- building ----------------------------------------------------------
+
+    @classmethod
+    def build(cls, loans=None, chunk_size=5000):
+        """
+        Build the index in one pass.
+
+        Args:
+            loans: Iterable of ``(transaction_id, member_id, book_id)`` sorted
+                by member. Defaults to every loan in LoanHistory.
+        """
+        if loans is None:
+            loans = (
+                LoanHistory.objects.order_by('member_id', 'id')
+                .values_list('id', 'member_id', 'book_id')
+                .iterator(chunk_size=chunk_size)
+            )
+
+        column_of = {}
+        borrowers = []
+        buffered, buffered_size = [], 0
+        keys = np.empty(0, dtype=np.int64)
+        counts = np.empty(0, dtype=np.int32)
+        last_id = 0
+
+        def flush(books):
+            nonlocal buffered_size
+            columns = []
+            for book_id in books:
+                column = column_of.get(book_id)
+                if column is None:
+                    column = column_of[book_id] = len(borrowers)
+                    borrowers.append(0)
+                borrowers[column] += 1
+                columns.append(column)
+            if len(columns) > 1:
+                pairs = _pair_keys(columns[-MAX_HISTORY:])
+                buffered.append(pairs)
+                buffered_size += len(pairs)
+
+        current, books = None, {}
+        for transaction_id, member_id, book_id in loans:
+            last_id = max(last_id, transaction_id)
+            if member_id != current:
+                flush(books)
+                current, books = member_id, {}
+            books[book_id] = None       # distinct, in borrowing order
+            if buffered_size >= COMPACT_EVERY:
+                keys, counts = _merge(
+                    np.concatenate([keys, *buffered]),
+                    np.concatenate([counts, np.ones(buffered_size, dtype=np.int32)]),
+                )
+                buffered, buffered_size = [], 0
+        flush(books)
+        keys, counts = _merge(
+            np.concatenate([keys, *buffered]),
+            np.concatenate([counts, np.ones(buffered_size, dtype=np.int32)]),
+        )
+
+        # Both directions, then CSR rows ordered by strength
+        lo, hi = (keys >> 32).astype(np.int32), (keys & 0xFFFFFFFF).astype(np.int32)
+        rows, neighbours = np.concatenate([lo, hi]), np.concatenate([hi, lo])
+        counts = np.concatenate([counts, counts])
+        order = np.lexsort((-counts, rows))
+        rows, neighbours, counts = rows[order], neighbours[order], counts[order]
+
+        n_books = len(borrowers)
+        indptr = np.zeros(n_books + 1, dtype=np.int64)
+        np.cumsum(np.bincount(rows, minlength=n_books), out=indptr[1:])
+        keep = np.arange(len(rows)) - indptr[rows] < TOP_NEIGHBOURS
+        indptr[1:] = np.cumsum(np.bincount(rows[keep], minlength=n_books))
+
+        book_ids = np.empty(n_books, dtype=np.int64)
+        for book_id, column in column_of.items():
+            book_ids[column] = book_id
+        return cls(
+            book_ids=book_ids,
+            borrowers=np.asarray(borrowers, dtype=np.int32),
+            indptr=indptr,
+            neighbours=neighbours[keep],
+            counts=counts[keep],
+            last_transaction_id=last_id,
+        )
+
+    def save(self):
+        path = index_path()
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(path.name + '.tmp')
+        with open(tmp, 'wb') as fh:
+            np.savez(
+                fh,
+                book_ids=self.book_ids,
+                borrowers=self.borrowers,
+                indptr=self.indptr,
+                neighbours=self.neighbours,
+                counts=self.counts,
+                last_transaction_id=np.int64(self.last_transaction_id),
+            )
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls):
+        with np.load(index_path(), allow_pickle=False) as data:
+            return cls(**{name: data[name] for name in data.files})
+
+    # -- incremental updates -----------------------------------------------
+
+    def catch_up(self):
+        """
+        Return an index that also counts the loans made since this one last
+        looked; ``self`` when there are none.
+        """
+        new_loans = list(
+            LoanHistory.objects.filter(id__gt=self.last_transaction_id)
+            .order_by('id')
+            .values_list('id', 'member_id', 'book_id')
+        )
+        if not new_loans:
+            return self
+        newest = new_loans[-1][0]
+        history = defaultdict(dict)
+        earlier = (
+            LoanHistory.objects.filter(
+                member_id__in={member_id for _id, member_id, _book_id in new_loans},
+                id__lte=self.last_transaction_id,
+            )
+            .order_by('id')
+            .values_list('member_id', 'book_id')
+        )
+        for member_id, book_id in earlier:
+            history[member_id][book_id] = None
+
+        # Copy what the new loans change; the CSR arrays are shared
+        updated = copy(self)
+        updated.borrowers = self.borrowers.copy()
+        updated.column_of = dict(self.column_of)
+        updated.extra = dict(self.extra)
+        copied_rows = set()
+        for _id, member_id, book_id in new_loans:
+            updated._add_loan(list(history[member_id])[-MAX_HISTORY:], book_id, copied_rows)
+            history[member_id][book_id] = None
+        updated.last_transaction_id = newest
+        return updated
+
+    def _add_loan(self, history, book_id, copied_rows):
+        """
+        Count one new loan of ``book_id`` by a member who had ``history``.
+        Only called on a fresh copy; rows of ``extra`` not in ``copied_rows``
+        are still shared with the original and are copied before the update.
+        """
+        if book_id in history:
+            return
+        column = self._column(book_id)
+        self.borrowers[column] += 1
+        for other in history:
+            other_column = self._column(other)
+            for row, neighbour in ((column, other_column), (other_column, column)):
+                if row not in copied_rows:
+                    self.extra[row] = Counter(self.extra.get(row, ()))
+                    copied_rows.add(row)
+                self.extra[row][neighbour] += 1
+
+    def _column(self, book_id):
+        column = self.column_of.get(book_id)
+        if column is None:
+            column = self.column_of[book_id] = len(self.book_ids)
+            self.book_ids = np.append(self.book_ids, book_id)
+            self.borrowers = np.append(self.borrowers, np.int32(0))
+            self.indptr = np.append(self.indptr, self.indptr[-1])
+        return column
+
+    # -- querying ----------------------------------------------------------
+
+    def recommend(self, history, limit=5, exclude=()):
+        """
+        Return ``(book_id, score)`` pairs for a member who borrowed
+        ``history``, best first. Books in ``history`` and ``exclude`` are
+        never returned.
+        """
+        columns = np.unique(np.asarray(
+            [self.column_of[b] for b in history if b in self.column_of], dtype=np.int64
+        ))
+        if not len(columns):
+            return []
+
+        starts, ends = self.indptr[columns], self.indptr[columns + 1]
+        lengths = ends - starts
+        postings = np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())
+        sources = np.repeat(columns, lengths)
+        targets = self.neighbours[postings].astype(np.int64)
+        counts = self.counts[postings].astype(np.float64)
+
+        extra = [(source, target, count) for source in columns.tolist()
+                 for target, count in self.extra.get(source, {}).items()]
+        if extra:
+            extra = np.asarray(extra, dtype=np.int64)
+            sources = np.concatenate([sources, extra[:, 0]])
+            targets = np.concatenate([targets, extra[:, 1]])
+            counts = np.concatenate([counts, extra[:, 2]])
+
+        borrowers = self.borrowers.astype(np.float64)
+        similarity = counts / np.sqrt(np.maximum(borrowers[sources] * borrowers[targets], 1.0))
+        scores = np.bincount(targets, weights=similarity, minlength=len(self.book_ids))
+        scores[columns] = 0.0
+        scores[[self.column_of[b] for b in exclude if b in self.column_of]] = 0.0
+
+        top = min(limit, int(np.count_nonzero(scores)))
+        if not top:
+            return []
+        best = np.argpartition(-scores, top - 1)[:top]
+        ranked = [(int(self.book_ids[c]), float(scores[c])) for c in best]
+        ranked.sort(key=lambda pair: (-pair[1], pair[0]))
+        return ranked
+
+
+_lock = threading.Lock()
+_loaded = {'index': None, 'stamp': None}
+
+
+def _stamp():
+    try:
+        return os.stat(index_path()).st_mtime_ns
+    except OSError:
+        return None
+
+
+def get_index():
+    """
+    Return the process-wide index, up to date with the loan history, or None
+    while it has not been built.
+    """
+    with _lock:
+        stamp = _stamp()
+        if stamp is None:
+            return None
+        if _loaded['index'] is None or stamp != _loaded['stamp']:
+            _loaded['index'] = CoBorrowIndex.load()
+            _loaded['stamp'] = stamp
+        _loaded['index'] = _loaded['index'].catch_up()
+        return _loaded['index']
+
+
+def rebuild_index():
+    """Build and save a fresh index; returns it."""
+    index = CoBorrowIndex.build()
+    index.save()
+    return index
+
+
+def recommend_for_member(member, limit=5, available_only=True):
+    """
+    Books borrowed by members with a similar history, best first.
+
+    Args:
+        member: Member to recommend for
+        limit: Maximum number of books to return
+        available_only: Skip books with no copies on the shelf
+
+    Returns:
+        List of Book instances; empty when the member has no history yet or
+        the index has not been built
+    """
+    history = list(
+        LoanHistory.objects.filter(member=member).order_by('id').values_list('book_id', flat=True)
+    )
+    history = list(dict.fromkeys(history))[-MAX_HISTORY:]
+    if not history:
+        return []
+    index = get_index()
+    if index is None:
+        return []
+    # Over-fetch so filtering out unavailable books still leaves enough
+    ranked = index.recommend(history, limit=limit * 4 if available_only else limit)
+    books = Book.objects.in_bulk([book_id for book_id, _score in ranked])
+    result = []
+    for book_id, _score in ranked:
+        book = books.get(book_id)
+        if book is None or (available_only and book.available_copies <= 0):
+            continue
+        result.append(book)
+        if len(result) == limit:
+            break
+    return result
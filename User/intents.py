@@ -0,0 +1,109 @@
+"""
+Intent router for the book recommendation chatbot.
+
+Every keyword the chatbot reacts to is compiled at import into one regular
+expression with word boundaries, so ``parse_query`` reads a query in a single
+pass. It works out the intent, the category, any author hint and the
+remaining search keywords, and the handlers take the parsed query as is.
+"""
+import re
+
+from Admin.models import Book
+
+# Keywords that signal each intent
+INTENT_KEYWORDS = (
+    ('similar', ('similar', 'like', 'same as')),
+    ('popular', ('most borrowed', 'popular', 'top', 'best')),
+    ('beginner', ('beginner', 'beginners', 'start', 'starting', 'started',
+                  'learn', 'learning', 'introduction', 'intro')),
+    ('recommend', ('recommend', 'suggest', 'what should', 'what can')),
+    ('author', ('author', 'authors', 'by', 'written by')),
+)
+
+# Extra spellings for categories, on top of their names and labels
+CATEGORY_ALIASES = {
+    'tech': 'Technology',
+    'sci-fi': 'Science Fiction',
+    'scifi': 'Science Fiction',
+    'nonfiction': 'Non-Fiction',
+}
+
+STOP_WORDS = frozenset((
+    'a', 'an', 'the', 'to', 'as', 'of', 'for', 'from', 'me', 'some', 'any',
+    'book', 'books', 'please',
+))
+
+INTENT_PRIORITY = ('similar', 'popular', 'beginner', 'recommend', 'category', 'author')
+
+
+def _build_router():
+    tokens = {}
+    for intent, phrases in INTENT_KEYWORDS:
+        for phrase in phrases:
+            tokens[phrase] = (intent, None)
+    for value, label in Book.CATEGORY_CHOICES:
+        tokens[value.lower()] = ('category', value)
+        tokens[label.lower()] = ('category', value)
+    for alias, value in CATEGORY_ALIASES.items():
+        tokens[alias] = ('category', value)
+
+    # Longest first, so "science fiction" wins over "science"
+    alternatives = [
+        r'\s+'.join(re.escape(word) for word in phrase.split())
+        for phrase in sorted(tokens, key=len, reverse=True)
+    ]
+    pattern = re.compile(r'(?<![\w-])(?:%s)(?![\w-])' % '|'.join(alternatives), re.IGNORECASE)
+    return pattern, tokens
+
+
+_ROUTER, _TOKENS = _build_router()
+_WORD_RE = re.compile(r"[\w'-]+")
+
+
+class ParsedQuery:
+    """A chatbot query, parsed once by ``parse_query``."""
+
+    def __init__(self, text, intent, category=None, keywords=(), author_terms=()):
+        self.text = text                    # the query as typed, stripped
+        self.intent = intent                # one of INTENT_PRIORITY or 'search'
+        self.category = category            # Book category value, if mentioned
+        self.keywords = list(keywords)      # words left once keywords are removed
+        self.author_terms = list(author_terms)  # words after "by" / "author"
+
+    def __repr__(self):
+        return f'<ParsedQuery {self.intent} category={self.category!r} keywords={self.keywords!r}>'
+
+
+def parse_query(text):
+    """Split a chatbot query into intent, category, author hint and keywords."""
+    text = text.strip()
+    intents = set()
+    category = None
+    author_at = None
+    leftover = []
+    position = 0
+
+    for match in _ROUTER.finditer(text):
+        kind, value = _TOKENS[' '.join(match.group().lower().split())]
+        if kind == 'category':
+            category = category or value
+            # Category words still narrow a title/author search
+            leftover.append(text[position:match.end()])
+        else:
+            intents.add(kind)
+            leftover.append(text[position:match.start()])
+            if kind == 'author' and author_at is None:
+                author_at = len(''.join(leftover))
+        position = match.end()
+    leftover.append(text[position:])
+    leftover = ''.join(leftover)
+
+    if category:
+        intents.add('category')
+    intent = next((name for name in INTENT_PRIORITY if name in intents), 'search')
+
+    keywords = [w for w in _WORD_RE.findall(leftover.lower()) if w not in STOP_WORDS]
+    author_terms = []
+    if author_at is not None:
+        author_terms = [w for w in _WORD_RE.findall(leftover[author_at:].lower()) if w not in STOP_WORDS]
+    return ParsedQuery(text, intent, category, keywords, author_terms)
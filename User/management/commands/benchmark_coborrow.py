@@ -0,0 +1,56 @@
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from User.coborrow import CoBorrowIndex
+
+
+class Command(BaseCommand):
+    help = (
+        'Time building and querying the co-borrowing recommender on synthetic '
+        'loans (nothing is written to the database)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--transactions', type=int, default=1_000_000)
+        parser.add_argument('--members', type=int, default=50_000)
+        parser.add_argument('--books', type=int, default=20_000)
+        parser.add_argument('--queries', type=int, default=1_000)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = np.random.default_rng(options['seed'])
+        n = options['transactions']
+
+        # Zipf-like popularity: a few books and members account for most loans
+        book_weights = 1.0 / np.arange(1, options['books'] + 1)
+        member_weights = 1.0 / np.sqrt(np.arange(1, options['members'] + 1))
+        books = rng.choice(options['books'], size=n, p=book_weights / book_weights.sum()) + 1
+        members = rng.choice(options['members'], size=n, p=member_weights / member_weights.sum()) + 1
+        order = np.argsort(members, kind='stable')
+        loans = zip(range(1, n + 1), members[order].tolist(), books[order].tolist())
+
+        started = time.perf_counter()
+        index = CoBorrowIndex.build(loans=loans)
+        build_time = time.perf_counter() - started
+        self.stdout.write(
+            f'build: {n} transactions, {len(index.book_ids)} books, '
+            f'{len(index.neighbours) // 2} pairs in {build_time:.2f}s'
+        )
+
+        histories = {}
+        for member_id, book_id in zip(members.tolist(), books.tolist()):
+            histories.setdefault(member_id, {})[book_id] = None
+        sample = rng.choice(list(histories), size=options['queries'])
+        timings = []
+        for member_id in sample.tolist():
+            history = list(histories[member_id])
+            started = time.perf_counter()
+            index.recommend(history, limit=5)
+            timings.append(time.perf_counter() - started)
+        timings = np.asarray(timings) * 1000
+        self.stdout.write(
+            f'query: {len(timings)} members, p50 {np.percentile(timings, 50):.2f}ms, '
+            f'p95 {np.percentile(timings, 95):.2f}ms, max {timings.max():.2f}ms'
+        )
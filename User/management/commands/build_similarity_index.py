@@ -0,0 +1,27 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from User.similarity import MAX_DELTA, index_path, is_stale, rebuild_index
+
+
+class Command(BaseCommand):
+    help = 'Build the TF-IDF index behind the chatbot\'s "similar books" answers'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--if-stale', action='store_true',
+            help=f'Only rebuild when the index is missing or more than {MAX_DELTA} books changed since the build',
+        )
+
+    def handle(self, *args, **options):
+        if options['if_stale'] and not is_stale():
+            self.stdout.write(f'{index_path()} is up to date')
+            return
+        started = time.perf_counter()
+        index = rebuild_index()
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Indexed {len(index.book_ids)} books, {len(index.vocabulary)} terms '
+            f'in {elapsed:.2f}s -> {index_path()}'
+        ))
@@ -0,0 +1,160 @@
+import asyncio
+import io
+import json
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.middleware.csrf import _get_new_csrf_string
+
+from User.answer_cache import answer_cache
+
+DEFAULT_QUERIES = (
+    'popular programming books',
+    'books similar to python',
+    'beginner history',
+    'books by tolkien',
+    'fantasy',
+    'recommend something',
+    'learning science',
+    'mystery novels',
+)
+
+PATH = '/user/chatbot/query/'
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare chatbot throughput under WSGI (a pool of worker threads) and '
+        'ASGI (one event loop), calling the Django applications in-process '
+        'against the configured database'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=400)
+        parser.add_argument('--concurrency', type=int, default=50,
+                            help='Chat sessions in flight at once under ASGI')
+        parser.add_argument('--threads', type=int, default=4,
+                            help='WSGI worker threads (e.g. gunicorn --threads)')
+        parser.add_argument('--cache', action='store_true',
+                            help='Leave the chatbot answer cache on')
+
+    def handle(self, *args, **options):
+        if not options['cache']:
+            answer_cache.max_size = 0
+        token = _get_new_csrf_string()
+        bodies = [
+            json.dumps({'query': DEFAULT_QUERIES[i % len(DEFAULT_QUERIES)]}).encode()
+            for i in range(options['requests'])
+        ]
+
+        runs = (
+            (f'wsgi ({options["threads"]} threads)', self.run_wsgi),
+            (f'asgi ({options["concurrency"]} sessions)', self.run_asgi),
+        )
+        for name, run in runs:
+            started = time.perf_counter()
+            latencies, failures = run(bodies, token, options)
+            elapsed = time.perf_counter() - started
+            latencies.sort()
+            self.stdout.write(
+                f'{name}: {len(bodies)} requests in {elapsed:.2f}s '
+                f'({len(bodies) / elapsed:.1f} req/s), '
+                f'p50 {statistics.median(latencies) * 1000:.1f}ms, '
+                f'p95 {latencies[int(len(latencies) * 0.95) - 1] * 1000:.1f}ms, '
+                f'{failures} failed'
+            )
+
+    def run_wsgi(self, bodies, token, options):
+        from LMS.wsgi import application
+
+        def call(body):
+            environ = {
+                'REQUEST_METHOD': 'POST',
+                'PATH_INFO': PATH,
+                'SERVER_NAME': 'localhost',
+                'SERVER_PORT': '80',
+                'SERVER_PROTOCOL': 'HTTP/1.1',
+                'CONTENT_TYPE': 'application/json',
+                'CONTENT_LENGTH': str(len(body)),
+                'HTTP_COOKIE': f'csrftoken={token}',
+                'HTTP_X_CSRFTOKEN': token,
+                'wsgi.input': io.BytesIO(body),
+                'wsgi.url_scheme': 'http',
+                'wsgi.errors': io.StringIO(),
+            }
+            status = []
+            started = time.perf_counter()
+            response = application(environ, lambda s, headers, exc_info=None: status.append(s))
+            content = b''.join(response)
+            response.close()
+            return time.perf_counter() - started, _ok(status[0], content)
+
+        with ThreadPoolExecutor(max_workers=options['threads']) as pool:
+            results = list(pool.map(call, bodies))
+        connections.close_all()
+        return [latency for latency, _ok_ in results], sum(1 for _l, ok in results if not ok)
+
+    def run_asgi(self, bodies, token, options):
+        from LMS.asgi import application
+
+        async def call(body, slots):
+            scope = {
+                'type': 'http',
+                'asgi': {'version': '3.0'},
+                'http_version': '1.1',
+                'method': 'POST',
+                'scheme': 'http',
+                'path': PATH,
+                'raw_path': PATH.encode(),
+                'query_string': b'',
+                'root_path': '',
+                'server': ('localhost', 80),
+                'client': ('127.0.0.1', 0),
+                'headers': [
+                    (b'host', b'localhost'),
+                    (b'content-type', b'application/json'),
+                    (b'content-length', str(len(body)).encode()),
+                    (b'cookie', f'csrftoken={token}'.encode()),
+                    (b'x-csrftoken', token.encode()),
+                ],
+            }
+            sent = False
+            status, chunks = [], []
+
+            async def receive():
+                nonlocal sent
+                if not sent:
+                    sent = True
+                    return {'type': 'http.request', 'body': body, 'more_body': False}
+                await asyncio.Event().wait()     # no disconnect while we wait
+
+            async def send(message):
+                if message['type'] == 'http.response.start':
+                    status.append(message['status'])
+                else:
+                    chunks.append(message.get('body', b''))
+
+            async with slots:
+                started = time.perf_counter()
+                await application(scope, receive, send)
+                return time.perf_counter() - started, _ok(status[0], b''.join(chunks))
+
+        async def main():
+            slots = asyncio.Semaphore(options['concurrency'])
+            return await asyncio.gather(*(call(body, slots) for body in bodies))
+
+        results = asyncio.run(main())
+        connections.close_all()
+        return [latency for latency, _ok_ in results], sum(1 for _l, ok in results if not ok)
+
+
+def _ok(status, content):
+    if not str(status).startswith('200'):
+        return False
+    try:
+        return json.loads(content).get('success', False)
+    except ValueError:
+        return False
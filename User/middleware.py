@@ -0,0 +1,63 @@
+"""
+Request-scoped Member resolution.
+
+``MemberMiddleware`` gives every request a lazy ``request.member`` (and
+``await request.amember()`` for async views). The member is looked up at
+most once per request, only when a view asks for it: one indexed query by
+user, or the creation of the profile on first use. Nothing is kept in the
+session, since Member rows carry counters that a copy would serve stale.
+"""
+from functools import partial
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.utils.functional import SimpleLazyObject
+
+from .utils import get_or_create_member
+
+
+def get_member(request):
+    """Return the signed-in user's Member (created on first use), or None."""
+    if not hasattr(request, '_cached_member'):
+        request._cached_member = _resolve_member(request)
+    return request._cached_member
+
+
+async def aget_member(request):
+    return await sync_to_async(get_member)(request)
+
+
+def _resolve_member(request):
+    user = request.user
+    if not user.is_authenticated:
+        return None
+    return get_or_create_member(user, request)
+
+
+class MemberMiddleware:
+    """
+    Attach ``request.member``; must come after the auth and message middleware.
+
+    Sync and async capable: it only attaches lazy lookups, so under ASGI it
+    runs on the event loop instead of being handed to a thread.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        self.attach(request)
+        return self.get_response(request)
+
+    async def __acall__(self, request):
+        self.attach(request)
+        return await self.get_response(request)
+
+    def attach(self, request):
+        request.member = SimpleLazyObject(partial(get_member, request))
+        request.amember = partial(aget_member, request)
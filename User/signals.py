@@ -0,0 +1,24 @@
+"""
+Keep the User app's recommendation indexes in step with the catalog.
+"""
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from Admin.models import Book, books_imported
+from .similarity import mark_book_changed, mark_books_changed
+
+
+@receiver(post_save, sender=Book)
+def book_saved(sender, instance, raw=False, **kwargs):
+    if not raw:
+        mark_book_changed(instance.id)
+
+
+@receiver(post_delete, sender=Book)
+def book_deleted(sender, instance, **kwargs):
+    mark_book_changed(instance.id)
+
+
+@receiver(books_imported, sender=Book)
+def books_imported_handler(sender, book_ids, **kwargs):
+    mark_books_changed(book_ids)
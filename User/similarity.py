@@ -0,0 +1,335 @@
+"""
+Content-based "similar books" engine.
+
+Books are embedded as L2-normalised TF-IDF vectors over their title, author,
+category and description. The matrix is stored column-wise (an inverted
+index: for every term, the rows that contain it and their weights), so one
+query touches only the postings of its own terms and scoring the whole
+catalog is a single ``np.bincount`` call.
+
+The index is built by ``manage.py build_similarity_index`` and saved to
+``settings.SIMILARITY_INDEX_PATH``; until then there are no similar books.
+Books created, edited or deleted afterwards are listed in a small delta file
+next to it. They are left out of the saved matrix and re-vectorised from the
+database at query time, until the next rebuild folds them in. Requests never
+rebuild the index: schedule ``build_similarity_index --if-stale`` to fold the
+delta in once it grows past MAX_DELTA.
+"""
+import json
+import logging
+import math
+import os
+import re
+import threading
+from collections import Counter
+from pathlib import Path
+
+import numpy as np
+from django.conf import settings
+
+from Admin.models import Book
+
+logger = logging.getLogger(__name__)
+
+TEXT_FIELDS = ('title', 'author', 'category', 'description')
+
+# Titles say the most about a book, so they count twice
+FIELD_WEIGHTS = {'title': 2, 'author': 1, 'category': 1, 'description': 1}
+
+STOP_WORDS = frozenset("""
+    a an and are as at be by for from has have in into is it its of on or
+    that the their this to was were will with book books edition volume
+""".split())
+
+# Every query rescores the changed books from the database, so past this
+# many the index is stale and should be rebuilt
+MAX_DELTA = 1000
+
+_TOKEN_RE = re.compile(r'[a-z0-9]+')
+
+
+def tokenize(text):
+    """Lowercase word tokens without stop words or single characters."""
+    return [
+        token for token in _TOKEN_RE.findall((text or '').lower())
+        if 1 < len(token) <= 40 and token not in STOP_WORDS
+    ]
+
+
+def book_terms(values):
+    """Weighted term counts for one book, given its TEXT_FIELDS values."""
+    counts = Counter()
+    for field, text in zip(TEXT_FIELDS, values):
+        for token in tokenize(text):
+            counts[token] += FIELD_WEIGHTS[field]
+    return counts
+
+
+def index_path():
+    return Path(settings.SIMILARITY_INDEX_PATH)
+
+
+def delta_path():
+    path = index_path()
+    return path.with_name(path.stem + '.delta.json')
+
+
+class SimilarityIndex:
+    """A loaded TF-IDF index plus the set of books changed since it was built."""
+
+    def __init__(self, book_ids, vocabulary, idf, indptr, rows, weights, changed=()):
+        self.book_ids = book_ids            # row -> book id
+        self.vocabulary = vocabulary        # term -> column
+        self.idf = idf                      # column -> idf
+        self.indptr = indptr                # column -> slice of rows/weights
+        self.rows = rows
+        self.weights = weights
+        self.row_of = {int(book_id): row for row, book_id in enumerate(book_ids)}
+        self.changed = set(changed)
+
+    # -- building ----------------------------------------------------------
+
+    @classmethod
+    def build(cls, chunk_size=2000):
+        """Build the index in one streaming pass over the catalog."""
+        vocabulary = {}
+        book_ids = []
+        doc_rows, doc_cols, doc_tf = [], [], []
+
+        books = Book.objects.order_by('id').values_list('id', *TEXT_FIELDS)
+        for row, (book_id, *values) in enumerate(books.iterator(chunk_size=chunk_size)):
+            book_ids.append(book_id)
+            for term, count in book_terms(values).items():
+                doc_rows.append(row)
+                doc_cols.append(vocabulary.setdefault(term, len(vocabulary)))
+                doc_tf.append(count)
+
+        n_books = len(book_ids)
+        doc_rows = np.asarray(doc_rows, dtype=np.int32)
+        doc_cols = np.asarray(doc_cols, dtype=np.int32)
+        tf = 1.0 + np.log(np.asarray(doc_tf, dtype=np.float32))
+
+        df = np.bincount(doc_cols, minlength=len(vocabulary))
+        idf = (np.log((1.0 + n_books) / (1.0 + df)) + 1.0).astype(np.float32)
+
+        weights = tf * idf[doc_cols]
+        norms = np.sqrt(np.bincount(doc_rows, weights=weights ** 2, minlength=n_books))
+        weights = (weights / np.maximum(norms[doc_rows], 1e-12)).astype(np.float32)
+
+        # Column-major (inverted) layout
+        order = np.argsort(doc_cols, kind='stable')
+        indptr = np.zeros(len(vocabulary) + 1, dtype=np.int64)
+        np.cumsum(df, out=indptr[1:])
+
+        return cls(
+            book_ids=np.asarray(book_ids, dtype=np.int64),
+            vocabulary=vocabulary,
+            idf=idf,
+            indptr=indptr,
+            rows=doc_rows[order],
+            weights=weights[order],
+        )
+
+    def save(self):
+        path = index_path()
+        path.parent.mkdir(parents=True, exist_ok=True)
+        terms = np.empty(len(self.vocabulary), dtype=object)
+        for term, column in self.vocabulary.items():
+            terms[column] = term
+        tmp = path.with_name(path.name + '.tmp')
+        with open(tmp, 'wb') as fh:
+            np.savez(
+                fh,
+                book_ids=self.book_ids,
+                terms=terms.astype(str),
+                idf=self.idf,
+                indptr=self.indptr,
+                rows=self.rows,
+                weights=self.weights,
+            )
+        os.replace(tmp, path)
+        # A fresh build covers every change recorded so far
+        _write_delta(set())
+
+    @classmethod
+    def load(cls):
+        with np.load(index_path(), allow_pickle=False) as data:
+            terms = data['terms']
+            return cls(
+                book_ids=data['book_ids'],
+                vocabulary={str(term): column for column, term in enumerate(terms)},
+                idf=data['idf'],
+                indptr=data['indptr'],
+                rows=data['rows'],
+                weights=data['weights'],
+                changed=_read_delta(),
+            )
+
+    # -- querying ----------------------------------------------------------
+
+    def vectorize(self, values):
+        """Normalised query vector for one book as ``(columns, weights)``."""
+        counts = book_terms(values)
+        columns, weights = [], []
+        for term, count in counts.items():
+            column = self.vocabulary.get(term)
+            if column is not None:
+                columns.append(column)
+                weights.append((1.0 + math.log(count)) * self.idf[column])
+        columns = np.asarray(columns, dtype=np.int64)
+        weights = np.asarray(weights, dtype=np.float32)
+        norm = np.linalg.norm(weights)
+        if norm:
+            weights /= norm
+        return columns, weights
+
+    def similar(self, book, limit=5):
+        """
+        Return ``(book_id, score)`` pairs most similar to ``book``, best first.
+
+        ``book`` is any object with the TEXT_FIELDS attributes and an ``id``.
+        """
+        columns, q = self.vectorize([getattr(book, field) for field in TEXT_FIELDS])
+        if not len(columns):
+            return []
+
+        # Gather the postings of every query term and score all rows at once
+        starts, ends = self.indptr[columns], self.indptr[columns + 1]
+        lengths = ends - starts
+        offsets = np.repeat(starts - np.cumsum(lengths) + lengths, lengths)
+        postings = offsets + np.arange(lengths.sum())
+        scores = np.bincount(
+            self.rows[postings],
+            weights=self.weights[postings] * np.repeat(q, lengths),
+            minlength=len(self.book_ids),
+        )
+
+        # Stale rows are rescored from the database below
+        stale_rows = [self.row_of[book_id] for book_id in self.changed | {book.id} if book_id in self.row_of]
+        scores[stale_rows] = 0.0
+
+        candidates = []
+        top = min(limit, int(np.count_nonzero(scores)))
+        if top:
+            best = np.argpartition(-scores, top - 1)[:top]
+            candidates = [(int(self.book_ids[row]), float(scores[row])) for row in best]
+        candidates += self._score_changed(columns, q, exclude=book.id)
+
+        candidates.sort(key=lambda pair: (-pair[1], pair[0]))
+        return [pair for pair in candidates if pair[1] > 0][:limit]
+
+    def _score_changed(self, columns, q, exclude):
+        ids = self.changed - {exclude}
+        if not ids:
+            return []
+        query = dict(zip(columns.tolist(), q.tolist()))
+        scored = []
+        for book_id, *values in Book.objects.filter(id__in=ids).values_list('id', *TEXT_FIELDS):
+            doc_columns, doc_weights = self.vectorize(values)
+            score = sum(query.get(c, 0.0) * w for c, w in zip(doc_columns.tolist(), doc_weights.tolist()))
+            scored.append((book_id, score))
+        return scored
+
+
+def _read_delta():
+    try:
+        with open(delta_path()) as fh:
+            return set(json.load(fh))
+    except (OSError, ValueError):
+        return set()
+
+
+def _write_delta(changed):
+    path = delta_path()
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + '.tmp')
+    with open(tmp, 'w') as fh:
+        json.dump(sorted(changed), fh)
+    os.replace(tmp, path)
+
+
+_lock = threading.Lock()
+_loaded = {'index': None, 'stamp': None}
+
+
+def _stamp():
+    try:
+        return tuple(os.stat(p).st_mtime_ns for p in (index_path(), delta_path()))
+    except OSError:
+        return None
+
+
+def get_index():
+    """
+    Return the process-wide index, (re)loading it when the files change, or
+    None while it has not been built.
+    """
+    with _lock:
+        if not index_path().exists():
+            return None
+        stamp = _stamp()
+        if _loaded['index'] is None or stamp != _loaded['stamp']:
+            _loaded['index'] = SimilarityIndex.load()
+            _loaded['stamp'] = _stamp()
+        return _loaded['index']
+
+
+def rebuild_index():
+    """Build and save a fresh index; returns it."""
+    index = SimilarityIndex.build()
+    index.save()
+    return index
+
+
+def is_stale():
+    """True when the index is missing or more than MAX_DELTA books changed since the build."""
+    return not index_path().exists() or len(_read_delta()) > MAX_DELTA
+
+
+def mark_book_changed(book_id):
+    """Record that a book was added, edited or deleted since the last build."""
+    mark_books_changed([book_id])
+
+
+def mark_books_changed(book_ids):
+    if not index_path().exists():
+        return
+    with _lock:
+        changed = _read_delta()
+        before = len(changed)
+        changed.update(book_ids)
+        _write_delta(changed)
+    if before <= MAX_DELTA < len(changed):
+        logger.warning(
+            '%d books changed since the similar-books index was built; '
+            'run manage.py build_similarity_index', len(changed),
+        )
+
+
+def similar_books(book, limit=5, available_only=True):
+    """
+    Books most similar to ``book``, best first.
+
+    Args:
+        book: Reference Book
+        limit: Maximum number of books to return
+        available_only: Skip books with no copies on the shelf
+
+    Returns:
+        List of Book instances; empty until the index has been built
+    """
+    index = get_index()
+    if index is None:
+        return []
+    # Over-fetch so filtering out unavailable books still leaves enough
+    ranked = index.similar(book, limit=limit * 4 if available_only else limit)
+    books = Book.objects.in_bulk([book_id for book_id, _score in ranked])
+    result = []
+    for book_id, _score in ranked:
+        candidate = books.get(book_id)
+        if candidate is None or (available_only and candidate.available_copies <= 0):
+            continue
+        result.append(candidate)
+        if len(result) == limit:
+            break
+    return result
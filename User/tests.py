@@ -1,3 +1,442 @@
-from django.test import TestCase
+import io
+import threading
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from Admin.benchmark import cases_for, load_budgets, run
+from Admin.models import Book, BookRequest, LibraryStats, Member, Transaction
+from Admin.seed import seed
+from User import book_pages, coborrow, similarity
+from User.answer_cache import AnswerCache, answer_cache
+from User.chatbot import BookRecommendationChatbot
+from User.intents import parse_query
+from User.middleware import get_member
+
+
+def make_book(isbn, title, author='Some Author', **fields):
+    fields.setdefault('category', 'Fiction')
+    return Book.objects.create(
+        isbn=isbn, title=title, author=author, published_date='2001-01-01', available_copies=2, **fields
+    )
+
+
+def make_member(email):
+    return Member.objects.create(full_name=email, email=email, phone='555')
+
+
+class MemberMiddlewareTests(TestCase):
+    """request.member is looked up once per request and drives the member's own book status."""
+
+    def setUp(self):
+        self.user = User.objects.create_user('reader', password='secret')
+        self.member = Member.objects.create(user=self.user, full_name='Reader', email='reader@example.org', phone='555')
+        self.book = make_book('9780000000301', 'Atlas')
+        self.client.force_login(self.user)
+
+    def test_member_looked_up_once(self):
+        request = RequestFactory().get('/')
+        request.user = self.user
+        with self.assertNumQueries(1):
+            self.assertEqual(get_member(request), self.member)
+            self.assertEqual(get_member(request), self.member)
+
+    def test_member_created_on_first_use(self):
+        self.member.delete()
+        for _attempt in range(2):
+            self.client.get(reverse('profile'))
+        self.assertEqual(Member.objects.filter(user=self.user).count(), 1)
+
+    def test_book_detail_shows_own_status(self):
+        other = make_member('other@example.org')
+        Transaction.objects.create(member=other, book=self.book)
+        BookRequest.objects.create(member=other, book=self.book)
+        self.assertEqual(self.client.get(reverse('book_detail', args=[self.book.id])).context['status'],
+                         {'issue_date': None, 'request_date': None})
+
+        loan = Transaction.objects.create(member=self.member, book=self.book)
+        status = self.client.get(reverse('book_detail', args=[self.book.id])).context['status']
+        self.assertEqual(status['issue_date'], loan.issue_date)
+        self.assertIsNone(status['request_date'])
+
+
+class MemberListingQueryTests(TestCase):
+    """A member's loan and request pages take the same queries however many rows they list."""
+
+    PAGES = ('my_books', 'my_requests', 'my_transactions')
+
+    def setUp(self):
+        self.user = User.objects.create_user('reader', password='secret')
+        self.member = Member.objects.create(user=self.user, full_name='Reader', email='reader@example.org', phone='555')
+        self.client.force_login(self.user)
+        self.books = 0
+        self.add_rows(1)
+
+    def add_rows(self, count):
+        for _i in range(count):
+            self.books += 2
+            book = make_book(f'97800000040{self.books:02d}', f'Open {self.books}')
+            Transaction.objects.create(member=self.member, book=book)
+            returned = make_book(f'97800000041{self.books:02d}', f'Returned {self.books}')
+            Transaction.objects.create(member=self.member, book=returned).mark_returned()
+            BookRequest.objects.create(member=self.member, book=book)
+
+    def queries(self, name):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse(name))
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_query_count_independent_of_rows(self):
+        few = {name: self.queries(name) for name in self.PAGES}
+        self.add_rows(8)
+        for name in self.PAGES:
+            with self.subTest(name):
+                self.assertEqual(self.queries(name), few[name])
+
+
+class BookPageTests(TestCase):
+    """Cached book pages are read once per request and never replaced by a stale render."""
+
+    def setUp(self):
+        cache.clear()
+        self.book = make_book('9780000000509', 'Atlas')
+
+    def test_page_read_once_per_request(self):
+        with mock.patch.object(book_pages, 'get_book_page', wraps=book_pages.get_book_page) as get_book_page:
+            response = self.client.get(reverse('book_detail', args=[self.book.id]))
+        self.assertContains(response, 'Atlas')
+        self.assertTrue(response.has_header('ETag'))
+        self.assertEqual(get_book_page.call_count, 1)
+
+    def test_late_render_of_old_row_is_not_served(self):
+        page = book_pages.get_book_page(self.book.id)
+        old_key = book_pages.cache_key(self.book.id, page['version'])
+
+        self.book.title = 'Atlas, Revised'
+        self.book.save()
+        # A request that loaded the old row stores its render after the invalidation
+        cache.set(old_key, page)
+        self.assertEqual(book_pages.get_book_page(self.book.id)['title'], 'Atlas, Revised')
+
+    def test_stock_change_invalidates_page(self):
+        self.assertEqual(book_pages.get_book_page(self.book.id)['available_copies'], 2)
+        Transaction.objects.create(member=make_member('reader@example.org'), book=self.book)
+        self.assertEqual(book_pages.get_book_page(self.book.id)['available_copies'], 1)
+
+    def test_write_by_another_process_is_seen(self):
+        etag = self.client.get(reverse('book_detail', args=[self.book.id]))['ETag']
+        # What import_books or seed_lms leave behind: new rows and a new
+        # catalog version, but no signal in this process
+        Book.objects.filter(pk=self.book.pk).update(title='Atlas, Revised')
+        LibraryStats.bump(catalog_version=1)
+
+        response = self.client.get(reverse('book_detail', args=[self.book.id]), HTTP_IF_NONE_MATCH=etag)
+        self.assertContains(response, 'Atlas, Revised')
+        self.assertNotEqual(response['ETag'], etag)
+
+
+class IntentParserTests(SimpleTestCase):
+    """parse_query picks one intent by priority and keeps the words the handlers search on."""
+
+    def assertParsed(self, text, intent, category=None, keywords=(), author_terms=()):
+        parsed = parse_query(text)
+        self.assertEqual(
+            (parsed.intent, parsed.category, parsed.keywords, parsed.author_terms),
+            (intent, category, list(keywords), list(author_terms)),
+        )
+
+    def test_intents(self):
+        self.assertParsed('books similar to Dune', 'similar', keywords=['dune'])
+        self.assertParsed('Python for beginners', 'beginner', keywords=['python'])
+        self.assertParsed('what should I read', 'recommend', keywords=['i', 'read'])
+        self.assertParsed('dragon riders', 'search', keywords=['dragon', 'riders'])
+
+    def test_categories_keep_their_words(self):
+        self.assertParsed('Science books', 'category', 'Science', ['science'])
+        self.assertParsed('sci-fi please', 'category', 'Science Fiction', ['sci-fi'])
+        self.assertParsed('Non-fiction', 'category', 'Non-Fiction', ['non-fiction'])
+
+    def test_longest_phrase_wins(self):
+        self.assertParsed('top   science   fiction', 'popular', 'Science Fiction', ['science', 'fiction'])
+
+    def test_intent_priority(self):
+        self.assertParsed('most borrowed science fiction books', 'popular', 'Science Fiction', ['science', 'fiction'])
+        self.assertParsed('popular books like Dune', 'similar', keywords=['dune'])
+
+    def test_author_terms(self):
+        self.assertParsed(
+            'books by Frank Herbert', 'author', keywords=['frank', 'herbert'], author_terms=['frank', 'herbert'],
+        )
+        self.assertParsed('Dune written by Frank', 'author', keywords=['dune', 'frank'], author_terms=['frank'])
+
+    def test_keywords_match_whole_words_only(self):
+        for text in ('Bylaws of the sea', 'startup stories', 'likely story'):
+            with self.subTest(text):
+                self.assertEqual(parse_query(text).intent, 'search')
+
+
+class ConditionalGetTests(TestCase):
+    """Catalog pages answer 304 while the catalog and the user are unchanged."""
+
+    def setUp(self):
+        cache.clear()
+        self.book = make_book('9780000000707', 'Atlas')
+        self.user = User.objects.create_user('reader', password='secret')
+
+    def get(self, name, *args, **headers):
+        return self.client.get(reverse(name, args=args), headers=headers)
+
+    def test_repeat_request_not_modified(self):
+        # Each only reads the catalog version from LibraryStats
+        for name, args in (('user_home', ()), ('admin', ()), ('book_detail', (self.book.id,))):
+            with self.subTest(name):
+                first = self.get(name, *args)
+                self.assertEqual(first.status_code, 200)
+                with self.assertNumQueries(1):
+                    repeat = self.get(name, *args, if_none_match=first['ETag'])
+                self.assertEqual(repeat.status_code, 304)
+                since = self.get(name, *args, if_modified_since=first['Last-Modified'])
+                self.assertEqual(since.status_code, 304)
+
+    def test_catalog_change_is_modified(self):
+        etag = self.get('user_home')['ETag']
+        make_book('9780000000714', 'Botany')
+        response = self.get('user_home', if_none_match=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Botany')
+
+    def test_etag_per_user(self):
+        anonymous = self.get('user_home')['ETag']
+        self.client.force_login(self.user)
+        response = self.get('user_home', if_none_match=anonymous)
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.has_header('Last-Modified'))
+        self.assertEqual(self.get('user_home', if_none_match=response['ETag']).status_code, 304)
+
+    def test_signed_in_book_detail_always_rendered(self):
+        self.client.force_login(self.user)
+        response = self.get('book_detail', self.book.id)
+        self.assertFalse(response.has_header('ETag'))
+        self.assertFalse(response.has_header('Last-Modified'))
+
+    def test_flash_message_not_lost_in_a_304(self):
+        etag = self.get('user_home')['ETag']
+        self.client.force_login(self.user)
+        self.client.get(reverse('user_logout'))
+        response = self.get('user_home', if_none_match=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'logged out')
+        self.assertEqual(self.get('user_home', if_none_match=etag).status_code, 304)
+
+
+class ChatbotTests(TestCase):
+    """The async endpoint answers through the same handlers as the sync chatbot."""
+
+    def setUp(self):
+        answer_cache.clear()
+        make_book('9780000000202', 'Dragon Riders', author='Ann Auditor')
+        make_book('9780000000219', 'Garden Birds', author='Bea Birder', category='Science')
+
+    def ask(self, query):
+        response = self.client.post(reverse('chatbot_query'), {'query': query}, content_type='application/json')
+        return response.json()
+
+    def test_endpoint_matches_sync_answer(self):
+        for query in ('dragon', 'books by birder', 'science books', 'recommend something'):
+            with self.subTest(query):
+                answer = self.ask(query)
+                expected = BookRecommendationChatbot().process_query(query)
+                self.assertTrue(answer['success'])
+                self.assertEqual(answer['type'], expected['type'])
+                self.assertEqual([book['id'] for book in answer['books']], [book.id for book in expected['books']])
+
+    def test_popular_answer_ranked_by_borrow_count(self):
+        birds = Book.objects.get(title='Garden Birds')
+        for i in range(2):
+            Transaction.objects.create(member=make_member(f'birder{i}@example.org'), book=birds).mark_returned()
+        answer = self.ask('most borrowed books')
+        self.assertEqual([book['title'] for book in answer['books']], ['Garden Birds', 'Dragon Riders'])
+
+    def test_search_answer(self):
+        answer = self.ask('dragon riders')
+        self.assertEqual(answer['type'], 'search')
+        self.assertEqual([book['title'] for book in answer['books']], ['Dragon Riders'])
+
+
+class ChatbotWorkerThreadTests(TransactionTestCase):
+    """Outside the tests the chatbot's database work runs on the worker pool, with its own connections."""
+
+    databases = {'default', 'readonly'}
+
+    def test_answer_computed_on_a_worker_thread(self):
+        answer_cache.clear()
+        make_book('9780000000806', 'Dragon Riders')
+        threads = []
+        process_query = BookRecommendationChatbot.process_query
+
+        def recording(chatbot, parsed):
+            threads.append(threading.current_thread().name)
+            return process_query(chatbot, parsed)
+
+        recorder = mock.patch.object(BookRecommendationChatbot, 'process_query', autospec=True, side_effect=recording)
+        with override_settings(DB_WORKER_THREADS=2), recorder:
+            response = self.client.post(reverse('chatbot_query'), {'query': 'dragon'}, content_type='application/json')
+        self.assertEqual([book['title'] for book in response.json()['books']], ['Dragon Riders'])
+        self.assertEqual(len(threads), 1)
+        self.assertTrue(threads[0].startswith('db-worker'), threads[0])
+
+
+class AnswerCacheTests(TestCase):
+    """Chatbot answers are reused until the catalog version moves, and personal ones per user."""
+
+    def setUp(self):
+        answer_cache.clear()
+        self.dragons = make_book('9780000000608', 'Dragon Riders')
+
+    def ask(self, query):
+        response = self.client.post(reverse('chatbot_query'), {'query': query}, content_type='application/json')
+        return response.json()
+
+    def handled(self):
+        """Patch the chatbot so the test can count how many answers were computed."""
+        process_query = BookRecommendationChatbot.process_query
+        return mock.patch.object(BookRecommendationChatbot, 'process_query', autospec=True, side_effect=process_query)
+
+    def titles(self, answer):
+        return [book['title'] for book in answer['books']]
+
+    def test_repeat_question_served_from_cache(self):
+        with self.handled() as process_query:
+            first = self.ask('dragon riders')
+            with self.assertNumQueries(1):
+                self.assertEqual(self.ask('  Dragon   RIDERS '), first)
+        self.assertEqual(process_query.call_count, 1)
+
+    def test_book_change_invalidates(self):
+        self.assertEqual(self.titles(self.ask('dragon')), ['Dragon Riders'])
+        make_book('9780000000615', 'Dragon Lore')
+        self.assertEqual(sorted(self.titles(self.ask('dragon'))), ['Dragon Lore', 'Dragon Riders'])
+
+    def test_loan_invalidates(self):
+        self.assertEqual(self.ask('most borrowed books')['books'][0]['available_copies'], 2)
+        Transaction.objects.create(member=make_member('borrower@example.org'), book=self.dragons)
+        self.assertEqual(self.ask('most borrowed books')['books'][0]['available_copies'], 1)
+
+    def test_personal_answers_keyed_per_user(self):
+        with self.handled() as process_query:
+            for name in ('first', 'second', 'first'):
+                self.client.force_login(User.objects.get_or_create(username=name)[0])
+                self.ask('recommend something')
+                self.ask('dragon')
+        # One recommendation per user, one shared search answer
+        self.assertEqual(process_query.call_count, 3)
+
+    def test_least_recently_used_evicted(self):
+        cache = AnswerCache(max_size=2)
+        cache.set('a', 1, 'A')
+        cache.set('b', 1, 'B')
+        cache.get('a', 1)
+        cache.set('c', 1, 'C')
+        self.assertEqual((cache.get('a', 1), cache.get('b', 1), cache.get('c', 1)), ('A', None, 'C'))
+        self.assertIsNone(cache.get('a', 2))
+        self.assertEqual(len(cache), 1)
+
+
+class CoBorrowIndexTests(TestCase):
+    """Requests never build the co-borrowing index, and catching up never changes a loaded one."""
+
+    def setUp(self):
+        coborrow.index_path().unlink(missing_ok=True)
+        self.addCleanup(coborrow.index_path().unlink, missing_ok=True)
+        self.first, self.second = make_member('first@example.org'), make_member('second@example.org')
+        self.atlas, self.botany, self.chess = (
+            make_book('97800000001%d' % n, title) for n, title in enumerate(('Atlas', 'Botany', 'Chess'))
+        )
+        for book in (self.atlas, self.botany):
+            Transaction.objects.create(member=self.first, book=book)
+        Transaction.objects.create(member=self.second, book=self.atlas)
+
+    def titles(self, member):
+        return [book.title for book in coborrow.recommend_for_member(member)]
+
+    def test_no_recommendations_until_built(self):
+        self.assertEqual(self.titles(self.second), [])
+        self.assertFalse(coborrow.index_path().exists())
+
+    def test_catching_up_swaps_in_a_new_index(self):
+        call_command('build_coborrow_index', stdout=io.StringIO())
+        self.assertEqual(self.titles(self.second), ['Botany'])
+        built = coborrow.get_index()
+        self.assertIs(coborrow.get_index(), built)
+        borrowers, ranked = built.borrowers.copy(), built.recommend([self.atlas.id])
+
+        Transaction.objects.create(member=self.first, book=self.chess)
+        self.assertEqual(sorted(self.titles(self.second)), ['Botany', 'Chess'])
+        self.assertIsNot(coborrow.get_index(), built)
+        self.assertEqual(built.extra, {})
+        self.assertEqual(built.borrowers.tolist(), borrowers.tolist())
+        self.assertEqual(built.recommend([self.atlas.id]), ranked)
+
+
+class SimilarityIndexTests(TestCase):
+    """The similar-books index is only rebuilt by its command, never by a request."""
+
+    def setUp(self):
+        for path in (similarity.index_path(), similarity.delta_path()):
+            path.unlink(missing_ok=True)
+            self.addCleanup(path.unlink, missing_ok=True)
+        self.dragons = make_book('9780000000011', 'Dragon Riders', description='Dragons and riders at war')
+        make_book('9780000000028', 'Dragon Riders Return', description='More dragons and their riders')
+        make_book('9780000000035', 'Tax Law', author='Ann Auditor', category='Business', description='Accounting rules')
+
+    def titles(self, book):
+        return [similar.title for similar in similarity.similar_books(book)]
+
+    def test_no_answers_until_built(self):
+        self.assertEqual(self.titles(self.dragons), [])
+        self.assertFalse(similarity.index_path().exists())
+
+    def test_similar_books_from_built_index(self):
+        call_command('build_similarity_index', stdout=io.StringIO())
+        self.assertEqual(self.titles(self.dragons), ['Dragon Riders Return'])
+
+    def test_changed_books_are_recorded_not_rebuilt(self):
+        call_command('build_similarity_index', stdout=io.StringIO())
+        built = similarity.index_path().stat().st_mtime_ns
+        with mock.patch.object(similarity, 'MAX_DELTA', 1), self.assertLogs('User.similarity', 'WARNING'):
+            added = make_book('9780000000042', 'Dragon Lore', description='Riders of dragons')
+            make_book('9780000000059', 'Garden Birds', author='Bea Birder', category='Nature')
+            self.assertEqual(similarity.index_path().stat().st_mtime_ns, built)
+            self.assertIn(added.id, similarity.get_index().changed)
+            self.assertIn('Dragon Lore', self.titles(self.dragons))
+            self.assertTrue(similarity.is_stale())
+
+            call_command('build_similarity_index', '--if-stale', stdout=io.StringIO())
+        self.assertEqual(similarity.get_index().changed, set())
+        self.assertIn('Dragon Lore', self.titles(self.dragons))
+
+
+class QueryBudgetTests(TestCase):
+    """Member views, chatbot included, must stay within the query budgets in Admin/query_budgets.json."""
+
+    @classmethod
+    def setUpTestData(cls):
+        seed(books=60, members=15, transactions=300, requests=30, seed=1)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_user_views_within_budget(self):
+        budgets = load_budgets()
+        results = run(iterations=1, cases=cases_for('User'), budgets=budgets)
+        for result in results:
+            with self.subTest(result.key):
+                self.assertIn(result.key, budgets, 'record it with manage.py benchmark_views --record')
+                self.assertLessEqual(result.queries, result.budget)
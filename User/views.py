@@ -2,27 +2,38 @@ from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth import login, logout, authenticate
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from django.db.models import Q
 from django.contrib.auth.models import User
-from django.http import JsonResponse
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import OuterRef, Subquery
+from django.http import Http404, HttpResponse, JsonResponse
+from django.utils.safestring import mark_safe
+from django.views.decorators.http import condition
 import json
 
-from Admin.models import Book, Member, Transaction, BookRequest
+from Admin.conditional import catalog_condition, conditional_etag, conditional_last_modified
+from Admin.covers import derivative_url
+from Admin.db import in_worker_thread, writer
+from Admin.models import Book, Member, Transaction, BookRequest, LibraryStats, LoanHistory
+from Admin.pagination import paginate
+from Admin.search import search_books, search_ordering
+from .answer_cache import answer_cache, cache_key
+from .book_pages import book_page_for
 from .chatbot import BookRecommendationChatbot
-from .utils import get_or_create_member
+from .intents import parse_query
 
 
+@catalog_condition
 def home(request):
     """User home page - Browse all books"""
     search_query = request.GET.get('search', '')
     books = Book.objects.all()
+    ordering = ('title', 'id')
     
     if search_query:
-        books = books.filter(
-            Q(title__icontains=search_query) |
-            Q(author__icontains=search_query) |
-            Q(isbn__icontains=search_query)
-        )
+        books = search_books(search_query, books)
+        ordering = search_ordering()
+    
+    books = paginate(request, books, ordering, per_page=24)
     
     context = {
         'books': books,
@@ -31,36 +42,44 @@ def home(request):
     return render(request, 'user/home.html', context)
 
 
+def _book_etag(request, id):
+    # A member's request status can change without a catalog write
+    if request.user.is_authenticated:
+        return None
+    page = book_page_for(request, id)
+    return page and conditional_etag(request, page['version'])
+
+
+def _book_last_modified(request, id):
+    page = book_page_for(request, id)
+    return page and conditional_last_modified(request, page['modified'])
+
+
+@condition(etag_func=_book_etag, last_modified_func=_book_last_modified)
 def book_detail(request, id):
     """View book details"""
-    book = get_object_or_404(Book, id=id)
-    
-    # Check if user has this book issued
-    user_has_book = False
-    user_transaction = None
-    pending_request = None
-    
+    page = book_page_for(request, id)
+    if page is None:
+        raise Http404('No Book matches the given query.')
+
+    status = {}
     if request.user.is_authenticated:
-        member = get_or_create_member(request.user)
-        user_transaction = Transaction.objects.filter(
-            member=member,
-            book=book,
-            status='Issued'
-        ).first()
-        user_has_book = user_transaction is not None
-        
-        # Check for pending request
-        pending_request = BookRequest.objects.filter(
-            member=member,
-            book=book,
-            status='Pending'
-        ).first()
-    
+        # The member's open loan and pending request for this book, in one query
+        member = request.member
+        status = Book.objects.filter(pk=id).values(
+            issue_date=Subquery(Transaction.objects.filter(
+                member=member, book=OuterRef('pk'), status='Issued'
+            ).values('issue_date')[:1]),
+            request_date=Subquery(BookRequest.objects.filter(
+                member=member, book=OuterRef('pk'), status='Pending'
+            ).values('request_date')[:1]),
+        ).first() or {}
+
     context = {
-        'book': book,
-        'user_has_book': user_has_book,
-        'user_transaction': user_transaction,
-        'pending_request': pending_request,
+        'book': page,
+        'page_before': mark_safe(page['before']),
+        'page_after': mark_safe(page['after']),
+        'status': status,
     }
     return render(request, 'user/book_detail.html', context)
 
@@ -156,10 +175,12 @@ def user_logout(request):
 @login_required
 def my_books(request):
     """View user's issued books"""
-    member = get_or_create_member(request.user, request)
+    member = request.member
     transactions = Transaction.objects.filter(
         member=member,
         status='Issued'
+    ).select_related('book').only(
+        'issue_date', 'status', 'book__title', 'book__author', 'book__image'
     ).order_by('-issue_date')
     
     context = {
@@ -173,10 +194,15 @@ def my_books(request):
 @login_required
 def my_requests(request):
     """View user's book requests"""
-    member = get_or_create_member(request.user, request)
-    requests = BookRequest.objects.filter(
-        member=member
-    ).order_by('-request_date')
+    member = request.member
+    requests = paginate(
+        request,
+        BookRequest.objects.filter(member=member).select_related('book').only(
+            'request_date', 'status', 'admin_notes',
+            'book__title', 'book__author', 'book__image'
+        ),
+        ('-request_date', '-id')
+    )
     
     context = {
         'requests': requests,
@@ -189,10 +215,14 @@ def my_requests(request):
 @login_required
 def my_transactions(request):
     """View all user's transactions (issued and returned)"""
-    member = get_or_create_member(request.user)
-    transactions = Transaction.objects.filter(
-        member=member
-    ).order_by('-issue_date')
+    member = request.member
+    transactions = paginate(
+        request,
+        LoanHistory.objects.filter(member=member).select_related('book').only(
+            'issue_date', 'return_date', 'status', 'book__title', 'book__author'
+        ),
+        ('-issue_date', '-id')
+    )
     
     context = {
         'transactions': transactions,
@@ -206,7 +236,7 @@ def my_transactions(request):
 def request_book(request, id):
     """Request a book (creates pending request)"""
     book = get_object_or_404(Book, id=id)
-    member = get_or_create_member(request.user, request)
+    member = request.member
     
     # Check if book is available
     if book.available_copies <= 0:
@@ -237,11 +267,12 @@ def request_book(request, id):
     
     # Create book request (pending)
     try:
-        BookRequest.objects.create(
-            member=member,
-            book=book,
-            status='Pending'
-        )
+        with writer():
+            BookRequest.objects.create(
+                member=member,
+                book=book,
+                status='Pending'
+            )
         messages.success(request, f'Book request for "{book.title}" submitted successfully! It is now pending admin approval.')
         return redirect('my_requests')
     except Exception as e:
@@ -252,16 +283,15 @@ def request_book(request, id):
 @login_required
 def return_book(request, id):
     """Return a book"""
-    transaction = get_object_or_404(Transaction, id=id)
-    member = get_or_create_member(request.user)
+    transaction = get_object_or_404(Transaction.objects.select_related('book'), id=id)
+    member = request.member
     
     # Verify the transaction belongs to the user
-    if transaction.member != member:
+    if transaction.member_id != member.id:
         messages.error(request, 'You are not authorized to return this book!')
         return redirect('my_books')
     
-    if transaction.status == 'Issued':
-        transaction.mark_returned()
+    if transaction.mark_returned():
         messages.success(request, f'Book "{transaction.book.title}" returned successfully!')
     else:
         messages.warning(request, 'This book has already been returned.')
@@ -272,19 +302,15 @@ def return_book(request, id):
 @login_required
 def profile(request):
     """User profile page"""
-    member = get_or_create_member(request.user, request)
-    
-    # Statistics
-    issued_count = Transaction.objects.filter(member=member, status='Issued').count()
-    returned_count = Transaction.objects.filter(member=member, status='Returned').count()
-    total_transactions = Transaction.objects.filter(member=member).count()
+    member = request.member
     
+    # Statistics are kept on the member row by the issue/return paths
     context = {
         'member': member,
         'user': request.user,
-        'issued_count': issued_count,
-        'returned_count': returned_count,
-        'total_transactions': total_transactions,
+        'issued_count': member.issued_count,
+        'returned_count': member.returned_count,
+        'total_transactions': member.total_loans,
     }
     
     return render(request, 'user/profile.html', context)
@@ -293,7 +319,7 @@ def profile(request):
 @login_required
 def update_profile(request):
     """Update user profile"""
-    member = get_or_create_member(request.user)
+    member = request.member
     
     if request.method == 'POST':
         try:
@@ -328,8 +354,64 @@ def chatbot(request):
     return render(request, 'user/chatbot.html')
 
 
-def chatbot_query(request):
-    """Handle chatbot queries via AJAX"""
+def _chatbot_response(result):
+    """Format a chatbot result for the JSON response"""
+    response_data = {
+        'success': True,
+        'type': result.get('type', 'general'),
+        'message': result.get('message', ''),
+        'books': []
+    }
+    
+    # Format books for JSON response
+    for book in result.get('books', []):
+        response_data['books'].append({
+            'id': book.id,
+            'title': book.title,
+            'author': book.author,
+            'category': book.category,
+            'available_copies': book.available_copies,
+            'image_url': (derivative_url(book.image.name, 'card') or book.image.url) if book.image else None,
+            'description': book.description or '',
+        })
+    
+    # Add reference book if exists
+    if 'reference_book' in result:
+        ref_book = result['reference_book']
+        response_data['reference_book'] = {
+            'id': ref_book.id,
+            'title': ref_book.title,
+            'author': ref_book.author,
+            'category': ref_book.category,
+        }
+    
+    # Add category if exists
+    if 'category' in result:
+        response_data['category'] = result['category']
+    
+    return response_data
+
+
+def _chatbot_answer(request, parsed, user):
+    """The JSON answer to ``parsed``, from the cache if the catalog has not changed since."""
+    key = cache_key(parsed, user)
+    version = LibraryStats.current_catalog_version()
+    payload = answer_cache.get(key, version)
+    if payload is None:
+        result = BookRecommendationChatbot(member=request.member).process_query(parsed)
+        payload = json.dumps(_chatbot_response(result), cls=DjangoJSONEncoder)
+        answer_cache.set(key, version, payload)
+    return payload
+
+
+async def chatbot_query(request):
+    """
+    Handle chatbot queries via AJAX.
+
+    Async so that, under ASGI, a worker keeps serving other chat sessions
+    while this one waits on the database. All of the ORM work runs in one
+    call on the worker pool (see Admin.db.in_worker_thread).
+    """
     if request.method == 'POST':
         try:
             data = json.loads(request.body)
@@ -342,47 +424,10 @@ def chatbot_query(request):
                     'books': []
                 })
             
-            # Initialize chatbot
-            chatbot = BookRecommendationChatbot(user=request.user)
-            
-            # Process query
-            result = chatbot.process_query(query)
-            
-            # Format response
-            response_data = {
-                'success': True,
-                'type': result.get('type', 'general'),
-                'message': result.get('message', ''),
-                'books': []
-            }
-            
-            # Format books for JSON response
-            for book in result.get('books', []):
-                response_data['books'].append({
-                    'id': book.id,
-                    'title': book.title,
-                    'author': book.author,
-                    'category': book.category,
-                    'available_copies': book.available_copies,
-                    'image_url': book.image.url if book.image else None,
-                    'description': book.description or '',
-                })
-            
-            # Add reference book if exists
-            if 'reference_book' in result:
-                ref_book = result['reference_book']
-                response_data['reference_book'] = {
-                    'id': ref_book.id,
-                    'title': ref_book.title,
-                    'author': ref_book.author,
-                    'category': ref_book.category,
-                }
-            
-            # Add category if exists
-            if 'category' in result:
-                response_data['category'] = result['category']
-            
-            return JsonResponse(response_data)
+            parsed = parse_query(query)
+            user = await request.auser()
+            payload = await in_worker_thread(_chatbot_answer)(request, parsed, user)
+            return HttpResponse(payload, content_type='application/json')
             
         except Exception as e:
             return JsonResponse({